@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+AI调用负载测试脚本
+在进程内启动模拟提供方（带延迟与每分钟请求数/token数限额），并发执行大量单AI节点的工作流，
+比较三种配置下的吞吐（调用/分钟）与提供方返回的429次数：
+- 不限流：超出提供方额度的请求收到429后按Retry-After重试
+- 客户端限流：按模型的令牌桶把请求速率控制在额度以内
+- 限流 + 微批：提供方支持批量接口时合并提示词，请求数额度不再是瓶颈
+"""
+
+import asyncio
+import logging
+import sys
+import time
+
+import httpx
+
+from src.ai_mock_server import create_mock_app
+from src.ai_providers import AIConfig, ModelLimits
+from src.engine import WorkflowEngine
+from src.http_pool import HttpPoolConfig
+
+CALLS = 10_000
+CONCURRENCY = 500
+# 模拟提供方的额度：每分钟3万请求、300万token
+PROVIDER_RPM = 30_000
+PROVIDER_TPM = 3_000_000
+
+
+def _workflow(i: int) -> dict:
+    return {"nodes": [{"id": "ai", "type": "ai", "config": {
+        "model": "mock", "prompt": f"总结第 {i} 号订单的客户反馈", "max_tokens": 16,
+    }}], "connections": []}
+
+
+async def run(name: str, calls: int, concurrency: int, limits: ModelLimits, batch_endpoint: bool = False):
+    mock = create_mock_app(latency=0.2, jitter=0.1, rpm=PROVIDER_RPM, tpm=PROVIDER_TPM)
+    engine = WorkflowEngine(
+        http_config=HttpPoolConfig(transport=httpx.ASGITransport(app=mock)),
+        ai_config=AIConfig(provider_url="http://mock-ai/v1", batch_endpoint=batch_endpoint,
+                           limits={"mock": limits}, max_retries=20),
+    )
+    counter = iter(range(calls))
+    errors = 0
+
+    async def client_loop():
+        nonlocal errors
+        for i in counter:
+            result = await engine.execute_workflow(_workflow(i))
+            if "error" in result["results"]["ai"]:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    stats = mock.state.provider.stats
+    print(f"  {name:<16} {calls / elapsed * 60:9,.0f} 调用/分钟  请求 {stats['requests']:6d}  "
+          f"429 {stats['rate_limited']:5d}  失败 {errors}")
+    await engine.aclose()
+
+
+if __name__ == "__main__":
+    # 可通过参数调整规模：python bench_ai.py 5000 200
+    call_count = int(sys.argv[1]) if len(sys.argv) > 1 else CALLS
+    client_count = int(sys.argv[2]) if len(sys.argv) > 2 else CONCURRENCY
+    logging.disable(logging.WARNING)
+    print("AI调用负载测试")
+    print("=" * 50)
+    print(f"提供方额度 {PROVIDER_RPM:,} 请求/分钟、{PROVIDER_TPM:,} token/分钟，并发 {client_count}")
+    safe = ModelLimits(max_concurrency=client_count, rpm=PROVIDER_RPM * 0.9, tpm=PROVIDER_TPM * 0.9)
+    scenarios = [
+        ("不限流", ModelLimits(max_concurrency=client_count), False),
+        ("客户端限流", safe, False),
+        ("限流 + 微批", ModelLimits(**{**safe.__dict__, "batch_size": 32, "batch_wait": 0.02}), True),
+    ]
+    for name, limits, batch_endpoint in scenarios:
+        asyncio.run(run(name, call_count, client_count, limits, batch_endpoint))
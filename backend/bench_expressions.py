@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+表达式引擎性能基准脚本
+对比逐条 eval 条件字符串与预编译谓词在不同数据规模下的过滤耗时
+"""
+
+import random
+import time
+
+from src.expressions import compile_expression
+
+CONDITION = "item['score'] > 50 and item.get('tier') == 'gold'"
+
+
+def build_records(count: int) -> list:
+    """构建合成记录"""
+    rng = random.Random(42)
+    return [
+        {"id": i, "score": rng.randint(0, 100), "tier": rng.choice(("gold", "silver", "free"))}
+        for i in range(count)
+    ]
+
+
+def filter_with_eval(records: list) -> list:
+    """旧实现：每条记录重新解析并求值条件字符串"""
+    result = []
+    for item in records:
+        if isinstance(item, dict):
+            try:
+                if eval(CONDITION, {"__builtins__": {}}, {"item": item}):
+                    result.append(item)
+            except Exception:
+                pass
+    return result
+
+
+def _timeit(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run_benchmark(count: int):
+    """对指定规模的数据运行基准测试"""
+    records = build_records(count)
+    columns = {key: [record[key] for record in records] for key in records[0]}
+    expression = compile_expression(CONDITION)
+
+    assert filter_with_eval(records) == expression.filter(records)
+
+    eval_time = _timeit(lambda: filter_with_eval(records))
+    compiled_time = _timeit(lambda: expression.filter(records))
+    columnar_time = _timeit(lambda: expression.filter_columns(columns))
+
+    print(
+        f"{count:>9} 条 | eval {eval_time * 1000:9.1f} ms | "
+        f"预编译 {compiled_time * 1000:8.1f} ms ({eval_time / compiled_time:5.1f}x) | "
+        f"列式 {columnar_time * 1000:8.1f} ms ({eval_time / columnar_time:5.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    print("表达式引擎基准测试")
+    print("=" * 50)
+    for size in (10_000, 100_000, 1_000_000):
+        run_benchmark(size)
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+定时调度负载测试脚本
+在临时SQLite数据库中创建2万个带 interval 触发器的工作流，运行调度器一段时间，
+测量触发器加载耗时、触发吞吐与触发延迟（实际提交时间 - 计划触发时间）
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from src.job_queue import ExecutionQueue, LatencyStats, MemoryJobQueue
+from src.scheduler import WorkflowScheduler, create_schedule_store
+from src.storage import Storage
+
+WORKFLOWS = 20_000
+DURATION = 10.0
+BATCH = 5_000
+
+
+def _workflow(i: int) -> dict:
+    return {
+        "name": f"scheduled-{i}",
+        "nodes": [{"id": "trigger", "type": "delay", "config": {"delay": 0}}],
+        "connections": [],
+        # 间隔分布在 2~11 秒，规模为2万时约 4000 次触发/秒
+        "triggers": [{"type": "interval", "seconds": 2 + i % 10}],
+    }
+
+
+async def run(path: str, workflows: int, duration: float):
+    storage = Storage(f"sqlite:///{path}", batch_size=BATCH)
+    for offset in range(0, workflows, BATCH):
+        await storage.workflows.create_many(_workflow(i) for i in range(offset, min(offset + BATCH, workflows)))
+
+    jobs = MemoryJobQueue()
+    queue = ExecutionQueue(jobs, storage.executions, max_size=10_000_000)
+    scheduler = WorkflowScheduler(queue, storage.workflows, create_schedule_store(storage.engine))
+
+    start = time.perf_counter()
+    await scheduler.start()
+    print(f"  加载 {workflows} 个触发器          {time.perf_counter() - start:9.2f} s")
+
+    await asyncio.sleep(duration)
+    await scheduler.stop()
+    stats = scheduler.stats()
+    print(f"  {duration:.0f} 秒内触发                  {stats['fired']:9d} 次  ({stats['fired'] / duration:,.0f} 次/秒)")
+
+    lag = LatencyStats(window=1_000_000)
+    while True:
+        job = await jobs.lease("bench", 60)
+        if job is None:
+            break
+        trigger = job.payload["input_data"]["trigger"]
+        lag.add(trigger["fired_at"] - trigger["scheduled_at"])
+    summary = lag.summary()
+    print(f"  触发延迟 p50 / p95 / max      {summary['p50'] * 1000:7.1f} / {summary['p95'] * 1000:.1f} / "
+          f"{summary['max'] * 1000:.1f} ms")
+    await storage.close()
+
+
+if __name__ == "__main__":
+    # 可通过参数调整规模：python bench_scheduler.py 10000 5
+    workflow_count = int(sys.argv[1]) if len(sys.argv) > 1 else WORKFLOWS
+    run_seconds = float(sys.argv[2]) if len(sys.argv) > 2 else DURATION
+    print("定时调度负载测试")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(os.path.join(directory, "bench.db"), workflow_count, run_seconds))
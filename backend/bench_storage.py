@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+存储层负载测试脚本
+在临时SQLite数据库中写入10万个工作流与100万条执行记录，
+测量批量写入吞吐、按id读取、分页列出与过期清理的耗时
+"""
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src.storage import ExecutionRecord, Storage
+
+WORKFLOWS = 100_000
+EXECUTIONS = 1_000_000
+BATCH = 5_000
+
+
+def _workflow(i: int) -> dict:
+    return {
+        "name": f"workflow-{i}",
+        "description": "负载测试",
+        "nodes": [{"id": "trigger", "type": "delay", "config": {"delay": 0}},
+                  {"id": "fetch", "type": "http", "config": {"url": f"https://example.com/{i}"}}],
+        "connections": [{"source": "trigger", "target": "fetch"}],
+    }
+
+
+async def _latency(label: str, calls: int, func):
+    start = time.perf_counter()
+    for _ in range(calls):
+        await func()
+    per_call = (time.perf_counter() - start) / calls * 1e6
+    print(f"  {label:<28} {per_call:9.1f} µs/次")
+
+
+async def run(path: str, workflows: int, executions: int):
+    storage = Storage(f"sqlite:///{path}", batch_size=BATCH)
+
+    print(f"工作流: {workflows}")
+    start = time.perf_counter()
+    for offset in range(0, workflows, BATCH):
+        await storage.workflows.create_many(_workflow(i) for i in range(offset, min(offset + BATCH, workflows)))
+    elapsed = time.perf_counter() - start
+    print(f"  批量写入                      {elapsed:9.2f} s  ({workflows / elapsed:,.0f} 条/秒)")
+
+    await _latency("按id读取", 2000, lambda: storage.workflows.get(random.randint(1, workflows)))
+    await _latency("首页 (limit=50)", 200, lambda: storage.workflows.list(limit=50))
+    await _latency("深分页 offset", 50, lambda: storage.workflows.list(limit=50, offset=workflows - 100))
+    await _latency("深分页 after_id 游标", 200, lambda: storage.workflows.list(limit=50, after_id=workflows - 100))
+    await _latency("计数", 50, storage.workflows.count)
+
+    print(f"执行记录: {executions}")
+    now = time.time()
+    ids = []
+    start = time.perf_counter()
+    for offset in range(0, executions, BATCH):
+        batch = []
+        for i in range(offset, min(offset + BATCH, executions)):
+            # 一半记录已过期，供清理测试使用
+            created = now - 3600 if i % 2 else now
+            record = ExecutionRecord(kind="workflow", status="success", workflow_id=i % workflows + 1,
+                                     data={"results": {"fetch": {"status": 200}}},
+                                     created_at=created, expires_at=created + 1800)
+            batch.append(record)
+        ids.append(batch[0].id)
+        await storage.executions.save_many(batch)
+    await storage.executions.flush()
+    elapsed = time.perf_counter() - start
+    print(f"  批量写入                      {elapsed:9.2f} s  ({executions / elapsed:,.0f} 条/秒)")
+
+    await _latency("按id读取", 2000, lambda: storage.executions.get(random.choice(ids)))
+    await _latency("按工作流列出", 200,
+                   lambda: storage.executions.list(workflow_id=random.randint(1, workflows), limit=20))
+
+    start = time.perf_counter()
+    purged = await storage.executions.purge_expired()
+    elapsed = time.perf_counter() - start
+    print(f"  清理过期记录 {purged} 条          {elapsed:9.2f} s")
+
+    await storage.close()
+    print(f"数据库大小: {os.path.getsize(path) / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == "__main__":
+    # 可通过参数缩小规模：python bench_storage.py 10000 100000
+    workflow_count = int(sys.argv[1]) if len(sys.argv) > 1 else WORKFLOWS
+    execution_count = int(sys.argv[2]) if len(sys.argv) > 2 else EXECUTIONS
+    print("存储层负载测试")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(os.path.join(directory, "bench.db"), workflow_count, execution_count))
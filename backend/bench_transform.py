@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+转换节点性能基准脚本
+对比逐条记录解析路径字符串与批量模式（预编译访问器、一次遍历）的耗时
+"""
+
+import time
+
+from src.paths import compile_mapping
+
+MAPPING = {"email": "email", "name": "profile.name", "city": "profile.address.city", "first_tag": "tags.0"}
+
+
+def build_records(count: int) -> list:
+    """构建合成记录"""
+    return [
+        {
+            "id": i,
+            "email": f"user{i}@example.com",
+            "profile": {"name": f"user{i}", "address": {"city": "Shanghai"}},
+            "tags": ["a", "b"],
+        }
+        for i in range(count)
+    ]
+
+
+def get_value_by_path(data, path):
+    """旧实现：每次调用重新拆分路径并转换下标"""
+    current = data
+    for part in path.split('.'):
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+            current = current[int(part)]
+        else:
+            return None
+    return current
+
+
+def transform_per_record(records: list) -> list:
+    rows = []
+    for record in records:
+        row = {}
+        for target, path in MAPPING.items():
+            value = get_value_by_path(record, path)
+            if value is not None:
+                row[target] = value
+        rows.append(row)
+    return rows
+
+
+def _timeit(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def run_benchmark(count: int):
+    """对指定数量的记录运行基准测试"""
+    records = build_records(count)
+    mapping = compile_mapping(MAPPING)
+
+    assert transform_per_record(records) == mapping.apply_batch(records)
+
+    old_time = _timeit(lambda: transform_per_record(records))
+    rows_time = _timeit(lambda: mapping.apply_batch(records))
+    columns_time = _timeit(lambda: mapping.apply_batch(records, output="columns"))
+
+    print(
+        f"{count:>7} 条 | 逐条解析 {old_time * 1000:8.1f} ms | "
+        f"批量行式 {rows_time * 1000:7.1f} ms ({old_time / rows_time:4.1f}x) | "
+        f"批量列式 {columns_time * 1000:7.1f} ms ({old_time / columns_time:4.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    print("转换节点基准测试")
+    print("=" * 50)
+    for size in (50_000, 500_000):
+        run_benchmark(size)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Webhook负载测试脚本
+使用临时SQLite数据库，不启动worker，向普通webhook与微批webhook发送请求，报告吞吐与延迟分位数：
+- 进程内：直接调用ASGI应用，只计服务端开销（单个API进程的处理能力）
+- HTTP：在子进程中启动uvicorn，通过本机网络请求；客户端与服务端共享CPU，结果偏保守
+微批模式下每个请求要等到所在批次落盘才返回，闭环客户端的吞吐受 max_wait 限制，
+其收益主要在执行数（worker侧开销）成倍减少
+"""
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+REQUESTS = 20_000
+CONCURRENCY = 64
+BODY = b'{"order_id": 1, "amount": 42.5, "items": ["a", "b"]}'
+PLAIN = {"type": "webhook", "path": "bench/plain"}
+BATCHED = {"type": "webhook", "path": "bench/batched", "batch": {"max_size": 200, "max_wait": 0.02}}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_ready(client: httpx.AsyncClient, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            await client.get("/docs")
+            return
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def _setup(client: httpx.AsyncClient):
+    token = (await client.post("/token", data={"username": "admin", "password": "password123"})).json()
+    headers = {"Authorization": f"Bearer {token['access_token']}"}
+    nodes = [{"id": "start", "type": "delay", "config": {"delay": 0}}]
+    for name, trigger in (("webhook", PLAIN), ("webhook-batched", BATCHED)):
+        response = await client.post("/workflows", headers=headers, json={
+            "name": name, "nodes": nodes, "connections": [], "triggers": [trigger],
+        })
+        response.raise_for_status()
+    return headers
+
+
+def _asgi_client(app):
+    """不经过网络，直接调用ASGI应用发送POST请求，返回 (状态码, 响应体)"""
+    async def post(path: str, body: bytes):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+            "client": ("127.0.0.1", 0), "server": ("127.0.0.1", 80),
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        response = {}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["body"] = response.get("body", b"") + message.get("body", b"")
+
+        await app(scope, receive, send)
+        return response["status"], response.get("body", b"")
+    return post
+
+
+async def _load(post, path: str, requests: int, concurrency: int, report: bool = True):
+    latencies = []
+    executions = set()
+    errors = 0
+    counter = iter(range(requests))
+
+    async def client_loop():
+        nonlocal errors
+        for _ in counter:
+            start = time.perf_counter()
+            status, body = await post(path, BODY)
+            latencies.append(time.perf_counter() - start)
+            if status == 202:
+                executions.add(json.loads(body)["execution_id"])
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    if not report:
+        return
+    latencies.sort()
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"  {path:<22} {requests / elapsed:8,.0f} 请求/秒  "
+          f"p50 {percentile(0.50):6.1f} ms  p95 {percentile(0.95):6.1f} ms  p99 {percentile(0.99):6.1f} ms  "
+          f"执行 {len(executions)}  错误 {errors}")
+
+
+async def run_in_process(requests: int, concurrency: int):
+    # 环境变量已在导入前设置
+    from src import main
+
+    await main.app.router.startup()
+    for workflow_id, trigger in ((1, PLAIN), (2, BATCHED)):
+        main.webhook_router.sync_workflow({"id": workflow_id, "active": True, "nodes": [], "triggers": [trigger]})
+    post = _asgi_client(main.app)
+    await _load(post, "/webhook/bench/plain", 500, concurrency, report=False)
+    print("进程内（ASGI直连）")
+    for clients in sorted({1, concurrency}):
+        print(f" 并发 {clients}")
+        await _load(post, "/webhook/bench/plain", requests if clients > 1 else requests // 10, clients)
+        await _load(post, "/webhook/bench/batched", requests if clients > 1 else requests // 10, clients)
+    await main.app.router.shutdown()
+
+
+async def run_http(port: int, requests: int, concurrency: int):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=30) as client:
+        await _wait_ready(client)
+        await _setup(client)
+
+        async def post(path: str, body: bytes):
+            response = await client.post(path, content=body, headers={"content-type": "application/json"})
+            return response.status_code, response.content
+
+        await _load(post, "/webhook/bench/plain", 500, concurrency, report=False)
+        print(f"HTTP（uvicorn单进程，并发 {concurrency}）")
+        await _load(post, "/webhook/bench/plain", requests, concurrency)
+        await _load(post, "/webhook/bench/batched", requests, concurrency)
+
+
+if __name__ == "__main__":
+    # 可通过参数调整规模：python bench_webhooks.py 5000 32
+    request_count = int(sys.argv[1]) if len(sys.argv) > 1 else REQUESTS
+    client_count = int(sys.argv[2]) if len(sys.argv) > 2 else CONCURRENCY
+    logging.disable(logging.INFO)
+    print("Webhook负载测试")
+    print("=" * 50)
+    with tempfile.TemporaryDirectory() as directory:
+        settings = {
+            "SCHEDULER_ENABLED": "0",
+            "EMBEDDED_WORKERS": "0",
+            "EXECUTION_QUEUE_SIZE": str(10 * request_count),
+        }
+        os.environ.update(settings, DATABASE_URL=f"sqlite:///{os.path.join(directory, 'in_process.db')}")
+        asyncio.run(run_in_process(request_count, client_count))
+
+        port = _free_port()
+        env = {**os.environ, **settings, "DATABASE_URL": f"sqlite:///{os.path.join(directory, 'http.db')}"}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+        )
+        try:
+            asyncio.run(run_http(port, request_count, client_count))
+        finally:
+            server.terminate()
+            server.wait()
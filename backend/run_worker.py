@@ -0,0 +1,5 @@
+from src.worker import main
+
+if __name__ == "__main__":
+    # 工作流执行worker：可启动多个进程/实例，与API进程共享 DATABASE_URL 指向的数据库
+    main()
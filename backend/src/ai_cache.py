@@ -0,0 +1,403 @@
+"""
+AI响应缓存
+AI节点配置 cache 后，相同 模型+渲染后的提示词+模型参数 的调用直接返回缓存的响应：
+
+    {"id": "summary", "type": "ai", "config": {"model": "...", "prompt": "...",
+     "cache": {"ttl": 86400, "normalize": ["whitespace", "case"]}}}
+
+- 精确键：提示词原样参与缓存键；normalize 后合并连续空白、忽略大小写再计算键，
+  提高模板渲染出的近似提示词的命中率（发送给模型的仍是原始提示词）
+- 条目按TTL过期，按条目数上限淘汰最久未访问的条目
+- 存储可选进程内LRU或数据库（与工作流同库，重启后保留，多个worker共享）
+- 按工作流统计命中次数、未命中次数与节省的token数
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, LargeBinary, String, Table, bindparam, delete, func, select, update
+from sqlalchemy.engine import Engine
+
+from . import serialization
+from .ai_providers import MODEL_PARAMS
+from .storage import SqlStoreBase, metadata
+
+logger = logging.getLogger("workflow-engine")
+
+DEFAULT_TTL = 24 * 3600.0
+NORMALIZATIONS = ("whitespace", "case")
+# 未关联工作流的执行（如直接调用引擎）的统计键
+ADHOC_WORKFLOW = "-"
+
+ai_cache_table = Table(
+    "ai_cache", metadata,
+    Column("key", String(64), primary_key=True),
+    Column("model", String(255), nullable=False),
+    Column("payload", LargeBinary, nullable=False),
+    Column("created_at", Float, nullable=False),
+    Column("expires_at", Float, nullable=False),
+    Column("accessed_at", Float, nullable=False, index=True),
+)
+
+ai_cache_stats_table = Table(
+    "ai_cache_stats", metadata,
+    Column("workflow_id", String(64), primary_key=True),
+    Column("hits", Integer, nullable=False, default=0),
+    Column("misses", Integer, nullable=False, default=0),
+    Column("tokens_saved", Integer, nullable=False, default=0),
+)
+
+
+@dataclass(frozen=True)
+class AICacheOptions:
+    """单个AI节点的缓存配置"""
+    ttl: Optional[float] = None
+    normalize: Tuple[str, ...] = ()
+
+    @staticmethod
+    def from_config(value: Any) -> Optional["AICacheOptions"]:
+        """
+        解析节点的 cache 配置：true 或 {"ttl": 秒, "normalize": true / ["whitespace", "case"]}，未开启时返回None
+
+        Raises:
+            ValueError: 配置无效
+        """
+        if not value:
+            return None
+        if not isinstance(value, dict):
+            return AICacheOptions()
+        normalize = value.get("normalize") or ()
+        if normalize is True:
+            normalize = NORMALIZATIONS
+        elif isinstance(normalize, str):
+            normalize = (normalize,)
+        unknown = [name for name in normalize if name not in NORMALIZATIONS]
+        if unknown:
+            raise ValueError(f"不支持的提示词归一化方式: {', '.join(map(str, unknown))}")
+        ttl = value.get("ttl")
+        return AICacheOptions(ttl=float(ttl) if ttl is not None else None, normalize=tuple(normalize))
+
+
+def normalize_prompt(prompt: str, normalize: Tuple[str, ...]) -> str:
+    """按配置归一化提示词：合并连续空白并去除首尾空白、统一为小写"""
+    if "whitespace" in normalize:
+        prompt = " ".join(prompt.split())
+    if "case" in normalize:
+        prompt = prompt.casefold()
+    return prompt
+
+
+@dataclass
+class AICacheEntry:
+    """缓存的模型响应 {"text", "usage"}"""
+    response: Dict[str, Any]
+    created_at: float
+    expires_at: float
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    @property
+    def tokens(self) -> int:
+        return int((self.response.get("usage") or {}).get("total_tokens", 0))
+
+
+class AICacheStore:
+    """AI响应缓存存储接口"""
+
+    async def get(self, key: str) -> Optional[AICacheEntry]:
+        raise NotImplementedError
+
+    async def set(self, key: str, model: str, entry: AICacheEntry):
+        raise NotImplementedError
+
+    def record(self, workflow_id: str, hit: bool, tokens_saved: int):
+        """累计工作流的命中统计（同步调用，不阻塞事件循环）"""
+        raise NotImplementedError
+
+    async def workflow_stats(self, workflow_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """按工作流的统计 {工作流id: {"hits", "misses", "tokens_saved"}}，指定 workflow_id 时只返回该工作流"""
+        raise NotImplementedError
+
+    async def flush(self):
+        """把缓冲中的统计落盘"""
+
+
+class MemoryAICacheStore(AICacheStore):
+    """进程内LRU存储"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries: "OrderedDict[str, AICacheEntry]" = OrderedDict()
+        self._counters: Dict[str, Dict[str, int]] = {}
+
+    async def get(self, key: str) -> Optional[AICacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, model: str, entry: AICacheEntry):
+        self._entries.pop(key, None)
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def record(self, workflow_id: str, hit: bool, tokens_saved: int):
+        _add(self._counters, workflow_id, hit, tokens_saved)
+
+    async def workflow_stats(self, workflow_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        if workflow_id is not None:
+            return {workflow_id: dict(self._counters[workflow_id])} if workflow_id in self._counters else {}
+        return {key: dict(value) for key, value in self._counters.items()}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _add(counters: Dict[str, Dict[str, int]], workflow_id: str, hit: bool, tokens_saved: int):
+    counter = counters.get(workflow_id)
+    if counter is None:
+        counter = counters[workflow_id] = {"hits": 0, "misses": 0, "tokens_saved": 0}
+    counter["hits" if hit else "misses"] += 1
+    counter["tokens_saved"] += tokens_saved
+
+
+class SqlAICacheStore(SqlStoreBase, AICacheStore):
+    """
+    基于SQLAlchemy的存储
+    条目数超过 max_entries 时删除过期条目与最久未访问的条目，降到上限的90%；
+    命中时的访问时间与按工作流的统计缓冲后每 flush_interval 秒批量写入
+    """
+
+    def __init__(self, engine: Engine, max_entries: int = 100_000, flush_interval: float = 1.0):
+        super().__init__(engine)
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self.evictions = 0
+        self._count: Optional[int] = None
+        self._touched: Dict[str, float] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def get(self, key: str) -> Optional[AICacheEntry]:
+        row = await asyncio.to_thread(self._read, self._select, key)
+        if row is None:
+            return None
+        self._touched[key] = time.time()
+        self._schedule()
+        return AICacheEntry(
+            response=serialization.loads(row.payload), created_at=row.created_at, expires_at=row.expires_at
+        )
+
+    async def set(self, key: str, model: str, entry: AICacheEntry):
+        await asyncio.to_thread(self._write, self._upsert, key, model, entry)
+
+    def record(self, workflow_id: str, hit: bool, tokens_saved: int):
+        _add(self._counters, workflow_id, hit, tokens_saved)
+        self._schedule()
+
+    async def workflow_stats(self, workflow_id: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        rows = await asyncio.to_thread(self._read, self._select_stats, workflow_id)
+        stats = {row.workflow_id: {"hits": row.hits, "misses": row.misses, "tokens_saved": row.tokens_saved}
+                 for row in rows}
+        # 尚未落盘的统计
+        for key, counter in self._counters.items():
+            if workflow_id is not None and key != workflow_id:
+                continue
+            merged = stats.setdefault(key, {"hits": 0, "misses": 0, "tokens_saved": 0})
+            for name, value in counter.items():
+                merged[name] += value
+        return stats
+
+    def _schedule(self):
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        self._spawn(self.flush())
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            if not self._touched and not self._counters:
+                return
+            touched, self._touched = self._touched, {}
+            counters, self._counters = self._counters, {}
+            try:
+                await asyncio.to_thread(self._write, self._apply, touched, counters)
+            except Exception as e:
+                logger.error(f"写入AI缓存统计失败: {str(e)}")
+                for key, counter in counters.items():
+                    merged = self._counters.setdefault(key, {"hits": 0, "misses": 0, "tokens_saved": 0})
+                    for name, value in counter.items():
+                        merged[name] += value
+
+    @staticmethod
+    def _select(conn, key: str):
+        table = ai_cache_table
+        return conn.execute(
+            select(table.c.payload, table.c.created_at, table.c.expires_at)
+            .where(table.c.key == key, table.c.expires_at > time.time())
+        ).first()
+
+    @staticmethod
+    def _select_stats(conn, workflow_id: Optional[str]):
+        query = select(ai_cache_stats_table)
+        if workflow_id is not None:
+            query = query.where(ai_cache_stats_table.c.workflow_id == workflow_id)
+        return conn.execute(query).all()
+
+    def _upsert(self, conn, key: str, model: str, entry: AICacheEntry):
+        table = ai_cache_table
+        if self._count is None:
+            self._count = conn.execute(select(func.count()).select_from(table)).scalar_one()
+        replaced = conn.execute(delete(table).where(table.c.key == key)).rowcount
+        conn.execute(table.insert(), {
+            "key": key,
+            "model": model,
+            "payload": serialization.dumps(entry.response),
+            "created_at": entry.created_at,
+            "expires_at": entry.expires_at,
+            "accessed_at": entry.created_at,
+        })
+        self._count += 1 - replaced
+        if self._count > self.max_entries:
+            self._evict(conn)
+
+    def _evict(self, conn):
+        table = ai_cache_table
+        removed = conn.execute(delete(table).where(table.c.expires_at <= time.time())).rowcount
+        # 其他worker也可能写入，淘汰前重新统计
+        count = conn.execute(select(func.count()).select_from(table)).scalar_one()
+        excess = count - int(self.max_entries * 0.9)
+        if excess > 0:
+            oldest = select(table.c.key).order_by(table.c.accessed_at).limit(excess)
+            removed += conn.execute(delete(table).where(table.c.key.in_(oldest.scalar_subquery()))).rowcount
+            count -= excess
+        self.evictions += removed
+        self._count = count
+
+    @staticmethod
+    def _apply(conn, touched: Dict[str, float], counters: Dict[str, Dict[str, int]]):
+        table = ai_cache_table
+        if touched:
+            conn.execute(
+                update(table).where(table.c.key == bindparam("touched_key")).values(accessed_at=bindparam("touched_at")),
+                [{"touched_key": key, "touched_at": at} for key, at in touched.items()],
+            )
+        stats = ai_cache_stats_table
+        for workflow_id, counter in counters.items():
+            updated = conn.execute(
+                update(stats).where(stats.c.workflow_id == workflow_id).values(
+                    hits=stats.c.hits + counter["hits"],
+                    misses=stats.c.misses + counter["misses"],
+                    tokens_saved=stats.c.tokens_saved + counter["tokens_saved"],
+                )
+            ).rowcount
+            if not updated:
+                conn.execute(stats.insert(), {"workflow_id": workflow_id, **counter})
+
+
+class AIResponseCache:
+    """AI节点的响应缓存"""
+
+    def __init__(self, store: Optional[AICacheStore] = None, default_ttl: float = DEFAULT_TTL):
+        """
+        Args:
+            store: 缓存存储，默认使用进程内LRU
+            default_ttl: 节点未配置ttl时的缓存秒数
+        """
+        self.store = store if store is not None else MemoryAICacheStore()
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    @classmethod
+    def from_env(cls, engine: Engine) -> "AIResponseCache":
+        """在存储所用的数据库上创建缓存，由环境变量 AI_CACHE_MAX_ENTRIES、AI_CACHE_TTL 配置"""
+        return cls(
+            create_ai_cache_store(engine, max_entries=int(os.environ.get("AI_CACHE_MAX_ENTRIES", 100_000))),
+            default_ttl=float(os.environ.get("AI_CACHE_TTL", DEFAULT_TTL)),
+        )
+
+    @staticmethod
+    def make_key(model: str, prompt: str, config: Dict[str, Any], normalize: Tuple[str, ...] = ()) -> str:
+        """由 提供方+模型+（归一化后的）提示词+模型参数 计算缓存键"""
+        parts = {
+            "provider": config.get("provider") or "default",
+            "model": model,
+            "prompt": normalize_prompt(prompt, normalize),
+            "params": {key: config[key] for key in MODEL_PARAMS if config.get(key) is not None},
+        }
+        data = json.dumps(parts, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    async def lookup(self, key: str, workflow_id: Any = None) -> Optional[Dict[str, Any]]:
+        """
+        查找缓存的响应，并按工作流记录命中或未命中
+
+        Returns:
+            {"text", "usage"}，未命中或已过期时返回None
+        """
+        entry = await self.store.get(key)
+        workflow_key = str(workflow_id) if workflow_id is not None else ADHOC_WORKFLOW
+        if entry is None or not entry.fresh:
+            self.misses += 1
+            self.store.record(workflow_key, False, 0)
+            return None
+        self.hits += 1
+        self.tokens_saved += entry.tokens
+        self.store.record(workflow_key, True, entry.tokens)
+        return entry.response
+
+    async def save(self, key: str, model: str, response: Dict[str, Any], ttl: Optional[float] = None):
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        await self.store.set(key, model, AICacheEntry(response=response, created_at=now, expires_at=now + ttl))
+
+    async def workflow_stats(self, workflow_id: Any = None) -> Dict[str, Dict[str, Any]]:
+        """按工作流的命中率与节省的token数"""
+        stats = await self.store.workflow_stats(str(workflow_id) if workflow_id is not None else None)
+        for counter in stats.values():
+            lookups = counter["hits"] + counter["misses"]
+            counter["hit_ratio"] = counter["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def stats(self) -> Dict[str, Any]:
+        """本进程的命中统计"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "evictions": getattr(self.store, "evictions", None),
+        }
+
+    async def flush(self):
+        await self.store.flush()
+
+
+def create_ai_cache_store(engine: Engine, max_entries: int = 100_000) -> SqlAICacheStore:
+    """在存储所用的数据库上创建AI响应缓存存储"""
+    metadata.create_all(engine, tables=[ai_cache_table, ai_cache_stats_table])
+    return SqlAICacheStore(engine, max_entries=max_entries)
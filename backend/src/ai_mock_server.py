@@ -0,0 +1,195 @@
+"""
+本地模拟AI提供方
+实现OpenAI兼容的 /v1/chat/completions 与批量 /v1/completions 接口，用于离线测试与压测：
+
+- 每个请求按 latency（加随机 jitter）秒延迟后返回
+- 按每分钟请求数（rpm）与token数（tpm）限流，超出时返回429与Retry-After
+- error_rate 为随机返回429的比例，模拟提供方的突发限流
+- 请求带 "stream": true 时以服务端事件流逐词返回，首个片段在 latency 秒后、其后每 token_interval 秒一个
+
+单独运行：python -m src.ai_mock_server --port 8100 --rpm 3000 --latency 0.2
+然后设置 AI_PROVIDER_URL=http://127.0.0.1:8100/v1
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Any, Dict, List, Optional
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from .ai_providers import estimate_tokens
+
+
+class _Limiter:
+    """不等待的令牌桶：令牌不足时返回需要等待的秒数"""
+
+    def __init__(self, per_minute: Optional[float]):
+        self.rate = per_minute / 60 if per_minute else None
+        self.capacity = max(1.0, self.rate) if self.rate else 0.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        if self.rate is None:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        if self.tokens < amount:
+            return (amount - self.tokens) / self.rate
+        self.tokens -= amount
+        return 0.0
+
+
+class MockProvider:
+    """模拟提供方的状态与统计"""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, rpm: Optional[float] = None,
+                 tpm: Optional[float] = None, error_rate: float = 0.0, completion_tokens: int = 16,
+                 token_interval: float = 0.005):
+        """
+        Args:
+            latency: 每个请求的基础延迟（秒）
+            jitter: 额外的随机延迟上限（秒）
+            rpm: 每分钟请求数上限，None表示不限制
+            tpm: 每分钟token数上限，None表示不限制
+            error_rate: 随机返回429的比例
+            completion_tokens: 未指定 max_tokens 时每个回复的token数
+            token_interval: 流式返回时相邻片段的间隔（秒）
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.completion_tokens = completion_tokens
+        self.token_interval = token_interval
+        self.requests = _Limiter(rpm)
+        self.tokens = _Limiter(tpm)
+        self.stats = {"requests": 0, "prompts": 0, "rate_limited": 0, "tokens": 0}
+
+    def _admit(self, prompts: List[str], params: Dict[str, Any]) -> Optional[JSONResponse]:
+        self.stats["requests"] += 1
+        completion = int(params.get("max_tokens") or self.completion_tokens)
+        tokens = sum(estimate_tokens(prompt) + completion for prompt in prompts)
+        wait = self.requests.take(1) or self.tokens.take(tokens)
+        if not wait and random.random() < self.error_rate:
+            wait = 1.0
+        if wait:
+            self.stats["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                status_code=429, headers={"Retry-After": f"{wait:.3f}"},
+            )
+        self.stats["prompts"] += len(prompts)
+        self.stats["tokens"] += tokens
+        return None
+
+    async def _respond(self):
+        await asyncio.sleep(self.latency + random.random() * self.jitter)
+
+    def _choice(self, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        completion = int(params.get("max_tokens") or self.completion_tokens)
+        return {
+            "text": f"mock response to: {prompt[:50]}",
+            "usage": {
+                "prompt_tokens": estimate_tokens(prompt),
+                "completion_tokens": completion,
+                "total_tokens": estimate_tokens(prompt) + completion,
+            },
+        }
+
+    async def chat_completions(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        prompt = "\n".join(str(message.get("content", "")) for message in body.get("messages") or [])
+        rejected = self._admit([prompt], body)
+        if rejected is not None:
+            return rejected
+        if body.get("stream"):
+            return StreamingResponse(self._stream(prompt, body), media_type="text/event-stream")
+        await self._respond()
+        choice = self._choice(prompt, body)
+        return JSONResponse({
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": choice["text"]},
+                         "finish_reason": "stop"}],
+            "usage": choice["usage"],
+        })
+
+    async def _stream(self, prompt: str, body: Dict[str, Any]):
+        await self._respond()
+        choice = self._choice(prompt, body)
+        words = choice["text"].split(" ")
+        for i, word in enumerate(words):
+            if i:
+                await asyncio.sleep(self.token_interval)
+            chunk = {"object": "chat.completion.chunk", "model": body.get("model"),
+                     "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}}]}
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        if (body.get("stream_options") or {}).get("include_usage"):
+            yield f"data: {json.dumps({'choices': [], 'usage': choice['usage']})}\n\n"
+        yield "data: [DONE]\n\n"
+
+    async def completions(self, request: Request) -> JSONResponse:
+        body = await request.json()
+        prompts = body.get("prompt") or ""
+        if isinstance(prompts, str):
+            prompts = [prompts]
+        rejected = self._admit(prompts, body)
+        if rejected is not None:
+            return rejected
+        await self._respond()
+        choices = [self._choice(prompt, body) for prompt in prompts]
+        return JSONResponse({
+            "object": "text_completion",
+            "model": body.get("model"),
+            "choices": [{"index": index, "text": choice["text"], "finish_reason": "stop"}
+                        for index, choice in enumerate(choices)],
+            "usage": {
+                key: sum(choice["usage"][key] for choice in choices)
+                for key in ("prompt_tokens", "completion_tokens", "total_tokens")
+            },
+        })
+
+    async def get_stats(self, request: Request) -> JSONResponse:
+        return JSONResponse(self.stats)
+
+
+def create_mock_app(**options) -> Starlette:
+    """
+    创建模拟提供方的ASGI应用，参数同 MockProvider；提供方实例可通过 app.state.provider 访问
+    """
+    provider = MockProvider(**options)
+    app = Starlette(routes=[
+        Route("/v1/chat/completions", provider.chat_completions, methods=["POST"]),
+        Route("/v1/completions", provider.completions, methods=["POST"]),
+        Route("/v1/stats", provider.get_stats, methods=["GET"]),
+    ])
+    app.state.provider = provider
+    return app
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="本地模拟AI提供方")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--rpm", type=float, default=None)
+    parser.add_argument("--tpm", type=float, default=None)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--token-interval", type=float, default=0.02)
+    args = parser.parse_args()
+    uvicorn.run(
+        create_mock_app(latency=args.latency, jitter=args.jitter, rpm=args.rpm, tpm=args.tpm,
+                        error_rate=args.error_rate, token_interval=args.token_interval),
+        host=args.host, port=args.port, log_level="warning",
+    )
@@ -0,0 +1,500 @@
+"""
+AI模型调用
+AI节点通过 AIGateway 调用模型提供方：
+
+- 提供方：OpenAI兼容接口（/chat/completions，支持时用 /completions 批量接口），
+  未配置时使用本地模拟提供方
+- 复用引擎的HTTP连接池
+- 每个模型独立的并发上限、请求数与token数令牌桶限流；收到429时按Retry-After暂停该模型的所有调用后重试
+- 微批：提供方支持批量接口时，同一模型、相同参数的并发提示词在 batch_wait 秒内合并为一次请求
+- 流式：stream 逐段产出模型输出（OpenAI兼容接口的服务端事件流）
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+
+import httpx
+
+from .http_pool import HttpClientPool
+
+logger = logging.getLogger("workflow-engine")
+
+# 传给提供方的模型参数，其余节点配置不发送
+MODEL_PARAMS = ("temperature", "max_tokens", "top_p", "stop", "presence_penalty", "frequency_penalty", "seed")
+# 未指定 max_tokens 时预估的输出token数（用于token限流）
+DEFAULT_COMPLETION_TOKENS = 256
+# 429响应的Retry-After上限（秒）
+MAX_RETRY_AFTER = 60.0
+
+
+class AIProviderError(Exception):
+    """提供方返回错误"""
+
+
+class RateLimitError(AIProviderError):
+    """提供方限流（429）"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数（约4个字符一个token）"""
+    return len(text) // 4 + 1
+
+
+def _estimate(prompts: List[str], params: Dict[str, Any]) -> int:
+    """请求的预估token数（提示词 + 输出上限），用于token限流"""
+    completion = int(params.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+    return sum(estimate_tokens(prompt) + completion for prompt in prompts)
+
+
+class TokenBucket:
+    """异步令牌桶：按 rate（每秒）补充、最多 capacity 个令牌，acquire 在令牌不足时等待，等待者按到达顺序获取"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """取得令牌并返回实际扣除的数量：单次请求超过桶容量时只扣除容量，避免永远等待"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return amount
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, amount: float):
+        """按实际用量修正：正数退还多扣的令牌，负数补扣（可为负债，之后的请求等待更久）"""
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+@dataclass
+class ModelLimits:
+    """单个模型的调用限制"""
+    max_concurrency: int = 16
+    # 每分钟请求数与token数上限，None表示不限制；
+    # 请求到达提供方的时间有抖动，宜设为略低于提供方额度（如90%），偶发的429由重试兜底
+    rpm: Optional[float] = None
+    tpm: Optional[float] = None
+    # 微批：单批最多提示词数（1表示不合并）与最长等待时间（秒），仅对支持批量接口的提供方生效
+    batch_size: int = 1
+    batch_wait: float = 0.01
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ModelLimits":
+        return cls(**{key: value for key, value in data.items() if key in cls.__dataclass_fields__})
+
+
+@dataclass
+class AIConfig:
+    """AI调用配置"""
+    # OpenAI兼容接口地址（如 https://api.openai.com/v1），为空时使用本地模拟提供方
+    provider_url: Optional[str] = None
+    api_key: Optional[str] = None
+    # 提供方是否支持 /completions 批量接口（prompt为列表）
+    batch_endpoint: bool = False
+    # 按模型名的限制，"*" 为默认值
+    limits: Dict[str, ModelLimits] = field(default_factory=dict)
+    # 429后的最大重试次数
+    max_retries: int = 5
+    timeout: float = 120.0
+
+    @classmethod
+    def from_env(cls) -> "AIConfig":
+        """
+        由环境变量 AI_PROVIDER_URL、AI_API_KEY、AI_BATCH_ENDPOINT、AI_MAX_RETRIES、AI_MODEL_LIMITS 构建，
+        AI_MODEL_LIMITS 为JSON，如 {"gpt-4o-mini": {"rpm": 3000, "tpm": 1000000, "batch_size": 16}}
+        """
+        limits = json.loads(os.environ.get("AI_MODEL_LIMITS") or "{}")
+        return cls(
+            provider_url=os.environ.get("AI_PROVIDER_URL") or None,
+            api_key=os.environ.get("AI_API_KEY") or None,
+            batch_endpoint=os.environ.get("AI_BATCH_ENDPOINT", "").lower() in ("1", "true"),
+            limits={model: ModelLimits.from_dict(value) for model, value in limits.items()},
+            max_retries=int(os.environ.get("AI_MAX_RETRIES", 5)),
+        )
+
+    def limits_for(self, model: str) -> ModelLimits:
+        return self.limits.get(model) or self.limits.get("*") or ModelLimits()
+
+
+class AIProvider:
+    """模型提供方接口，返回 {"text": 输出, "usage": {"prompt_tokens", "completion_tokens", "total_tokens"}}"""
+
+    supports_batch = False
+
+    async def complete(self, model: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def complete_batch(self, model: str, prompts: List[str], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """一次请求完成多个提示词，结果顺序与prompts一致"""
+        raise NotImplementedError
+
+    async def stream(self, model: str, prompt: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        """流式输出：依次产出 {"delta": 文本片段}，最后产出 {"usage": token用量}；默认一次性返回完整结果"""
+        result = await self.complete(model, prompt, params)
+        yield {"delta": result["text"]}
+        yield {"usage": result["usage"]}
+
+
+def _usage(prompt: str, text: str, usage: Optional[Dict[str, Any]] = None) -> Dict[str, int]:
+    if usage and usage.get("total_tokens") is not None:
+        return {
+            "prompt_tokens": int(usage.get("prompt_tokens", 0)),
+            "completion_tokens": int(usage.get("completion_tokens", 0)),
+            "total_tokens": int(usage["total_tokens"]),
+        }
+    prompt_tokens, completion_tokens = estimate_tokens(prompt), estimate_tokens(text)
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+    }
+
+
+class SimulatedProvider(AIProvider):
+    """未配置提供方时的本地模拟：固定延迟后返回回显内容"""
+
+    def __init__(self, latency: float = 1.0):
+        self.latency = latency
+
+    async def complete(self, model: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency)
+        text = f"这是对提示词的AI响应: {prompt[:30]}..."
+        return {"text": text, "usage": _usage(prompt, text)}
+
+    async def stream(self, model: str, prompt: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        # 首个片段在延迟的1/4后到达，其余片段均匀分布在剩余时间内
+        text = f"这是对提示词的AI响应: {prompt[:30]}..."
+        pieces = [text[i:i + 4] for i in range(0, len(text), 4)]
+        await asyncio.sleep(self.latency / 4)
+        for i, piece in enumerate(pieces):
+            if i:
+                await asyncio.sleep(self.latency * 3 / 4 / len(pieces))
+            yield {"delta": piece}
+        yield {"usage": _usage(prompt, text)}
+
+
+class OpenAICompatibleProvider(AIProvider):
+    """OpenAI兼容的HTTP接口"""
+
+    def __init__(self, base_url: str, http_pool: HttpClientPool, api_key: Optional[str] = None,
+                 batch_endpoint: bool = False, timeout: float = 120.0):
+        self.base_url = base_url.rstrip("/")
+        self.http_pool = http_pool
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.supports_batch = batch_endpoint
+        self.timeout = timeout
+
+    async def _post(self, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        url = f"{self.base_url}{path}"
+        client = self.http_pool.get_client(url)
+        try:
+            response = await client.post(url, json=body, headers=self.headers, timeout=self.timeout)
+        except httpx.HTTPError as e:
+            raise AIProviderError(f"请求AI提供方失败: {str(e)}") from e
+        _raise_for_status(response)
+        return response.json()
+
+    async def complete(self, model: str, prompt: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        data = await self._post("/chat/completions", {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            **params,
+        })
+        text = data["choices"][0]["message"]["content"]
+        return {"text": text, "usage": _usage(prompt, text, data.get("usage"))}
+
+    async def stream(self, model: str, prompt: str, params: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        url = f"{self.base_url}/chat/completions"
+        body = {
+            "model": model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True,
+            "stream_options": {"include_usage": True},
+            **params,
+        }
+        client = self.http_pool.get_client(url)
+        text, usage = [], None
+        try:
+            async with client.stream("POST", url, json=body, headers=self.headers, timeout=self.timeout) as response:
+                if response.status_code >= 400:
+                    await response.aread()
+                    _raise_for_status(response)
+                # 服务端事件流：每行 "data: {...}"，以 "data: [DONE]" 结束
+                async for line in response.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    usage = chunk.get("usage") or usage
+                    for choice in chunk.get("choices") or ():
+                        delta = (choice.get("delta") or {}).get("content")
+                        if delta:
+                            text.append(delta)
+                            yield {"delta": delta}
+        except httpx.HTTPError as e:
+            raise AIProviderError(f"请求AI提供方失败: {str(e)}") from e
+        yield {"usage": _usage(prompt, "".join(text), usage)}
+
+    async def complete_batch(self, model: str, prompts: List[str], params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        data = await self._post("/completions", {"model": model, "prompt": prompts, **params})
+        texts = [""] * len(prompts)
+        for choice in data["choices"]:
+            texts[choice.get("index", 0)] = choice.get("text", "")
+        # 批量接口只返回总用量，按提示词分别估算
+        return [{"text": text, "usage": _usage(prompt, text)} for prompt, text in zip(prompts, texts)]
+
+
+def _raise_for_status(response: httpx.Response):
+    if response.status_code == 429:
+        try:
+            retry_after = float(response.headers.get("retry-after", 1.0))
+        except ValueError:
+            retry_after = 1.0
+        raise RateLimitError("AI提供方限流", retry_after)
+    if response.status_code >= 400:
+        raise AIProviderError(f"AI提供方返回 {response.status_code}: {response.text[:200]}")
+
+
+@dataclass
+class _Batch:
+    prompts: List[str] = field(default_factory=list)
+    futures: List[asyncio.Future] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None
+
+
+class _ModelState:
+    """单个模型的并发与限流状态"""
+
+    def __init__(self, limits: ModelLimits):
+        self.limits = limits
+        self.semaphore = asyncio.Semaphore(limits.max_concurrency)
+        self.requests = TokenBucket(limits.rpm / 60) if limits.rpm else None
+        self.tokens = TokenBucket(limits.tpm / 60) if limits.tpm else None
+        self.batches: Dict[str, _Batch] = {}
+        # 收到429后在此时间前不再发出请求
+        self.resume_at = 0.0
+
+    async def wait_resume(self):
+        delay = self.resume_at - time.monotonic()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.resume_at - time.monotonic()
+
+
+class AIGateway:
+    """AI调用入口：按模型限流、限制并发并合并批量请求"""
+
+    def __init__(self, config: Optional[AIConfig] = None, http_pool: Optional[HttpClientPool] = None,
+                 providers: Optional[Dict[str, AIProvider]] = None):
+        """
+        Args:
+            config: AI调用配置，默认 AIConfig()
+            http_pool: HTTP连接池，一般为引擎的连接池
+            providers: 按名称注册的提供方，节点通过 provider 配置选择，默认使用 "default"
+        """
+        self.config = config or AIConfig()
+        self.http_pool = http_pool if http_pool is not None else HttpClientPool()
+        self.providers = dict(providers or {})
+        if "default" not in self.providers:
+            if self.config.provider_url:
+                self.providers["default"] = OpenAICompatibleProvider(
+                    self.config.provider_url, self.http_pool, api_key=self.config.api_key,
+                    batch_endpoint=self.config.batch_endpoint, timeout=self.config.timeout,
+                )
+            else:
+                self.providers["default"] = SimulatedProvider()
+        self.calls = 0
+        self.requests = 0
+        self.rate_limited = 0
+        self._models: Dict[Tuple[str, str], _ModelState] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 持有执行中的批次任务，避免被垃圾回收
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+    def _state(self, provider_name: str, model: str) -> _ModelState:
+        # 信号量与锁绑定在事件循环上，循环切换后重建
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._models = {}
+            self._loop = loop
+        state = self._models.get((provider_name, model))
+        if state is None:
+            state = self._models[(provider_name, model)] = _ModelState(self.config.limits_for(model))
+        return state
+
+    async def complete(self, model: str, prompt: str, params: Optional[Dict[str, Any]] = None,
+                       provider: Optional[str] = None) -> Dict[str, Any]:
+        """
+        调用模型
+
+        Returns:
+            {"text": 输出, "usage": token用量}
+
+        Raises:
+            AIProviderError: 提供方返回错误，或429重试次数用尽
+        """
+        provider_name = provider or "default"
+        if provider_name not in self.providers:
+            raise AIProviderError(f"未知的AI提供方: {provider_name}")
+        implementation = self.providers[provider_name]
+        params = {key: params[key] for key in MODEL_PARAMS if params and params.get(key) is not None}
+        state = self._state(provider_name, model)
+        self.calls += 1
+
+        if implementation.supports_batch and state.limits.batch_size > 1:
+            return await self._enqueue_batch(state, implementation, model, prompt, params)
+        results = await self._request(state, implementation, model, [prompt], params, batch=False)
+        return results[0]
+
+    async def _enqueue_batch(self, state: _ModelState, provider: AIProvider, model: str, prompt: str,
+                             params: Dict[str, Any]) -> Dict[str, Any]:
+        key = json.dumps(params, sort_keys=True, default=str)
+        batch = state.batches.get(key)
+        loop = asyncio.get_running_loop()
+        if batch is None:
+            batch = state.batches[key] = _Batch()
+            batch.timer = loop.call_later(
+                state.limits.batch_wait, self._flush_batch, state, provider, model, params, key, batch
+            )
+        future = loop.create_future()
+        batch.prompts.append(prompt)
+        batch.futures.append(future)
+        if len(batch.prompts) >= state.limits.batch_size:
+            self._flush_batch(state, provider, model, params, key, batch)
+        return await future
+
+    def _flush_batch(self, state: _ModelState, provider: AIProvider, model: str, params: Dict[str, Any],
+                     key: str, batch: _Batch):
+        if state.batches.get(key) is batch:
+            del state.batches[key]
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        task = asyncio.ensure_future(self._run_batch(state, provider, model, params, batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _run_batch(self, state: _ModelState, provider: AIProvider, model: str, params: Dict[str, Any],
+                         batch: _Batch):
+        try:
+            results = await self._request(state, provider, model, batch.prompts, params, batch=True)
+        except Exception as e:
+            for future in batch.futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(batch.futures, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _request(self, state: _ModelState, provider: AIProvider, model: str, prompts: List[str],
+                       params: Dict[str, Any], batch: bool) -> List[Dict[str, Any]]:
+        estimated = _estimate(prompts, params)
+        attempt = 0
+        while True:
+            charged = await self._admit(state, estimated)
+            try:
+                async with state.semaphore:
+                    self.requests += 1
+                    if batch:
+                        results = await provider.complete_batch(model, prompts, params)
+                    else:
+                        results = [await provider.complete(model, prompts[0], params)]
+            except RateLimitError as e:
+                attempt += 1
+                self._rate_limited(state, model, e, attempt)
+                continue
+            if state.tokens is not None:
+                state.tokens.adjust(charged - sum(result["usage"]["total_tokens"] for result in results))
+            return results
+
+    async def stream(self, model: str, prompt: str, params: Optional[Dict[str, Any]] = None,
+                     provider: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        流式调用模型，限流与并发限制同 complete（不参与微批）
+
+        Returns:
+            异步迭代器，依次产出 {"delta": 文本片段}，最后总是产出 {"usage": token用量}
+
+        Raises:
+            AIProviderError: 提供方返回错误，或429重试次数用尽
+        """
+        provider_name = provider or "default"
+        if provider_name not in self.providers:
+            raise AIProviderError(f"未知的AI提供方: {provider_name}")
+        implementation = self.providers[provider_name]
+        params = {key: params[key] for key in MODEL_PARAMS if params and params.get(key) is not None}
+        state = self._state(provider_name, model)
+        self.calls += 1
+        estimated = _estimate([prompt], params)
+        attempt = 0
+        while True:
+            charged = await self._admit(state, estimated)
+            started = False
+            usage = None
+            try:
+                async with state.semaphore:
+                    self.requests += 1
+                    async for item in implementation.stream(model, prompt, params):
+                        if "usage" in item:
+                            usage = item["usage"]
+                            continue
+                        started = True
+                        yield item
+            except RateLimitError as e:
+                # 已输出部分内容后不能重试
+                if started:
+                    raise
+                attempt += 1
+                self._rate_limited(state, model, e, attempt)
+                continue
+            if usage is None:
+                usage = _usage(prompt, "")
+            if state.tokens is not None:
+                state.tokens.adjust(charged - usage["total_tokens"])
+            yield {"usage": usage}
+            return
+
+    async def _admit(self, state: _ModelState, estimated: int) -> float:
+        """等待限流暂停结束并取得请求数与token数令牌，返回实际扣除的token数（用于按实际用量修正）"""
+        await state.wait_resume()
+        if state.requests is not None:
+            await state.requests.acquire(1)
+        if state.tokens is not None:
+            return await state.tokens.acquire(estimated)
+        return 0
+
+    def _rate_limited(self, state: _ModelState, model: str, error: RateLimitError, attempt: int):
+        self.rate_limited += 1
+        # 暂停该模型的所有调用，避免其他协程继续触发429
+        state.resume_at = max(state.resume_at, time.monotonic() + min(error.retry_after, MAX_RETRY_AFTER))
+        if attempt > self.config.max_retries:
+            raise error
+        logger.warning(f"模型 {model} 被限流，{error.retry_after:.2f}秒后重试")
+
+    def stats(self) -> Dict[str, int]:
+        """调用统计：节点调用数、发往提供方的请求数（批量合并后）、被限流次数"""
+        return {"calls": self.calls, "requests": self.requests, "rate_limited": self.rate_limited}
@@ -0,0 +1,359 @@
+"""
+浏览器会话池
+预先创建并复用远程浏览器会话（会话 + WebDriver），避免每次自动化都新建会话、获取连接URL、建立WebDriver再全部销毁：
+
+- 池大小在 min_size 与 max_size 之间，启动时预热 min_size 个会话，不够用时按需创建，达到上限后租用方排队等待
+- 空闲超过 idle_timeout 秒、存活超过 max_age 秒或使用超过 max_uses 次的会话被回收，之后补足到 min_size
+- 租出前做健康检查（执行一段脚本），失效的会话直接销毁并换一个
+- 归还时重置状态：关闭多余窗口、清除cookie与本地存储、导航到 about:blank，重置失败的会话不再复用
+- 整个池超过 close_after_idle 秒没有租用时自行关闭，不再为不用的池保持（按时计费的）远程会话
+
+会话的创建与销毁由 BrowserFactory 负责（Browserbase远程会话、本地Selenium/WebDriver服务或测试替身）。
+Selenium的调用都是阻塞的，统一经 DriverExecutor 在专用的有界线程池中执行，不占用事件循环
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger("workflow-engine")
+
+BLANK_URL = "about:blank"
+HEALTH_CHECK_SCRIPT = "return document.readyState"
+CLEAR_STORAGE_SCRIPT = (
+    "try { window.localStorage.clear(); } catch (e) {}"
+    "try { window.sessionStorage.clear(); } catch (e) {}"
+)
+
+
+class BrowserPoolError(Exception):
+    """浏览器会话池错误"""
+
+
+class BrowserPoolTimeout(BrowserPoolError):
+    """等待空闲会话超时"""
+
+
+@dataclass
+class BrowserPoolConfig:
+    """浏览器会话池配置"""
+    min_size: int = 0
+    max_size: int = 4
+    idle_timeout: float = 120.0
+    # 远程服务通常会结束存活过久的会话，在那之前主动回收
+    max_age: float = 600.0
+    max_uses: int = 50
+    acquire_timeout: float = 60.0
+    # 整个池没有租用超过该秒数后关闭（包括 min_size 个预热的会话），0 表示不关闭
+    close_after_idle: float = 900.0
+
+    @classmethod
+    def from_env(cls) -> "BrowserPoolConfig":
+        """由环境变量 BROWSER_POOL_MIN_SIZE、BROWSER_POOL_MAX_SIZE、BROWSER_POOL_IDLE_TIMEOUT、BROWSER_POOL_MAX_AGE、BROWSER_POOL_MAX_USES、BROWSER_POOL_CLOSE_AFTER_IDLE 构建"""
+        return cls(
+            min_size=int(os.environ.get("BROWSER_POOL_MIN_SIZE", 0)),
+            max_size=int(os.environ.get("BROWSER_POOL_MAX_SIZE", 4)),
+            idle_timeout=float(os.environ.get("BROWSER_POOL_IDLE_TIMEOUT", 120)),
+            max_age=float(os.environ.get("BROWSER_POOL_MAX_AGE", 600)),
+            max_uses=int(os.environ.get("BROWSER_POOL_MAX_USES", 50)),
+            acquire_timeout=float(os.environ.get("BROWSER_POOL_ACQUIRE_TIMEOUT", 60)),
+            close_after_idle=float(os.environ.get("BROWSER_POOL_CLOSE_AFTER_IDLE", 900)),
+        )
+
+
+class DriverExecutor:
+    """执行阻塞WebDriver调用的专用线程池，线程数即单个进程内可同时操作浏览器的自动化数"""
+
+    def __init__(self, max_workers: int = 16):
+        """
+        Args:
+            max_workers: 线程数上限
+        """
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @classmethod
+    def from_env(cls) -> "DriverExecutor":
+        """由环境变量 WEBDRIVER_THREADS 构建"""
+        return cls(max_workers=int(os.environ.get("WEBDRIVER_THREADS", 16)))
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在线程池中执行 fn(*args, **kwargs) 并等待结果"""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="webdriver")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(fn, *args, **kwargs))
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+_default_executor: Optional[DriverExecutor] = None
+
+
+def default_driver_executor() -> DriverExecutor:
+    """进程内共享的WebDriver线程池"""
+    global _default_executor
+    if _default_executor is None:
+        _default_executor = DriverExecutor.from_env()
+    return _default_executor
+
+
+@dataclass
+class PooledBrowser:
+    """池中的一个浏览器会话"""
+    session_id: Optional[str]
+    driver: Any
+    created_at: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+    uses: int = 0
+
+
+class BrowserFactory:
+    """浏览器会话工厂接口"""
+
+    async def create(self) -> PooledBrowser:
+        raise NotImplementedError
+
+    async def destroy(self, browser: PooledBrowser):
+        raise NotImplementedError
+
+
+def check_browser(driver: Any) -> bool:
+    """会话是否仍可用"""
+    try:
+        driver.execute_script(HEALTH_CHECK_SCRIPT)
+        return True
+    except Exception:
+        return False
+
+
+def reset_browser(driver: Any):
+    """清除上一次租用留下的状态，失败时抛出异常"""
+    handles = list(driver.window_handles)
+    for handle in handles[1:]:
+        driver.switch_to.window(handle)
+        driver.close()
+    driver.switch_to.window(handles[0])
+    # Chromium驱动可以一次清除所有域的cookie与缓存，其他驱动只能清除当前页面所在域的
+    if hasattr(driver, "execute_cdp_cmd"):
+        driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+        driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+    driver.delete_all_cookies()
+    driver.execute_script(CLEAR_STORAGE_SCRIPT)
+    driver.get(BLANK_URL)
+
+
+class BrowserPool:
+    """可复用的浏览器会话池"""
+
+    def __init__(self, factory: BrowserFactory, config: Optional[BrowserPoolConfig] = None,
+                 executor: Optional[DriverExecutor] = None):
+        """
+        初始化会话池
+
+        Args:
+            factory: 会话工厂
+            config: 池配置，默认使用BrowserPoolConfig()
+            executor: 执行健康检查与状态重置的线程池，默认使用进程内共享的线程池
+        """
+        self.factory = factory
+        self.config = config or BrowserPoolConfig()
+        self.executor = executor if executor is not None else default_driver_executor()
+        self.closed = False
+        self._idle: Deque[PooledBrowser] = deque()
+        # 包括空闲、已租出与正在创建的会话
+        self._size = 0
+        self._available = asyncio.Condition()
+        self._reaper: Optional[asyncio.Task] = None
+        # 最近一次租用或归还的时间，用于判断整个池是否闲置
+        self._last_active = time.monotonic()
+        self._stats = {"created": 0, "reused": 0, "destroyed": 0, "health_failures": 0, "reset_failures": 0,
+                       "waits": 0}
+
+    async def start(self):
+        """预热到 min_size 并启动空闲回收"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_loop())
+        await self._fill()
+
+    async def close(self):
+        """停止回收并销毁空闲会话，租出中的会话在归还时销毁"""
+        self.closed = True
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        while self._idle:
+            await self._destroy(self._idle.popleft())
+        async with self._available:
+            self._available.notify_all()
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[PooledBrowser]:
+        """租用一个会话，退出时归还；使用过程中抛出异常的会话不再复用"""
+        browser = await self.acquire()
+        try:
+            yield browser
+        except BaseException:
+            await self.release(browser, discard=True)
+            raise
+        await self.release(browser)
+
+    async def acquire(self) -> PooledBrowser:
+        """
+        取出一个健康的空闲会话，没有时创建新会话，达到上限时等待
+
+        Raises:
+            BrowserPoolTimeout: acquire_timeout 秒内没有可用会话
+        """
+        if self._reaper is None and not self.closed:
+            self._reaper = asyncio.create_task(self._reap_loop())
+        self.touch()
+        deadline = time.monotonic() + self.config.acquire_timeout
+        while True:
+            if self.closed:
+                raise BrowserPoolError("浏览器会话池已关闭")
+            while self._idle:
+                # 后进先出：优先使用最近归还的会话，让长时间空闲的会话自然过期
+                browser = self._idle.pop()
+                if self._expired(browser, time.monotonic()):
+                    await self._destroy(browser)
+                    continue
+                if not await self.executor.run(check_browser, browser.driver):
+                    self._stats["health_failures"] += 1
+                    logger.warning(f"浏览器会话 {browser.session_id} 健康检查失败，已丢弃")
+                    await self._destroy(browser)
+                    continue
+                self._stats["reused"] += 1
+                return self._checkout(browser)
+            if self._size < self.config.max_size:
+                return self._checkout(await self._create())
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise BrowserPoolTimeout(f"等待浏览器会话超时（上限 {self.config.max_size}）")
+            self._stats["waits"] += 1
+            async with self._available:
+                try:
+                    await asyncio.wait_for(self._available.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, browser: PooledBrowser, discard: bool = False):
+        """归还会话：重置状态后放回空闲队列，discard 或已达使用上限时销毁"""
+        if discard or self.closed or self._worn_out(browser, time.monotonic()):
+            await self._destroy(browser)
+        else:
+            try:
+                await self.executor.run(reset_browser, browser.driver)
+            except Exception as e:
+                self._stats["reset_failures"] += 1
+                logger.warning(f"浏览器会话 {browser.session_id} 重置失败，已丢弃: {str(e)}")
+                await self._destroy(browser)
+            else:
+                browser.last_used = time.monotonic()
+                self._idle.append(browser)
+        self.touch()
+        async with self._available:
+            self._available.notify()
+
+    def touch(self):
+        """标记池正在使用（即将租用），推迟闲置关闭"""
+        self._last_active = time.monotonic()
+
+    def idle_for(self, now: float) -> float:
+        """没有租出的会话时，距最近一次租用或归还的秒数；有租出的会话时为0"""
+        if self._size > len(self._idle):
+            return 0.0
+        return now - self._last_active
+
+    def _checkout(self, browser: PooledBrowser) -> PooledBrowser:
+        browser.uses += 1
+        browser.last_used = time.monotonic()
+        return browser
+
+    def _worn_out(self, browser: PooledBrowser, now: float) -> bool:
+        return browser.uses >= self.config.max_uses or now - browser.created_at >= self.config.max_age
+
+    def _expired(self, browser: PooledBrowser, now: float) -> bool:
+        return self._worn_out(browser, now) or now - browser.last_used >= self.config.idle_timeout
+
+    async def _create(self) -> PooledBrowser:
+        self._size += 1
+        try:
+            browser = await self.factory.create()
+        except BaseException:
+            self._size -= 1
+            async with self._available:
+                self._available.notify()
+            raise
+        self._stats["created"] += 1
+        return browser
+
+    async def _destroy(self, browser: PooledBrowser):
+        self._size -= 1
+        self._stats["destroyed"] += 1
+        try:
+            await self.factory.destroy(browser)
+        except Exception as e:
+            logger.warning(f"销毁浏览器会话 {browser.session_id} 失败: {str(e)}")
+
+    async def _fill(self):
+        """补足到 min_size 个会话"""
+        while not self.closed and self._size < min(self.config.min_size, self.config.max_size):
+            try:
+                browser = await self._create()
+            except Exception as e:
+                logger.warning(f"预热浏览器会话失败: {str(e)}")
+                return
+            self._idle.append(browser)
+            async with self._available:
+                self._available.notify()
+
+    async def evict(self):
+        """回收过期的空闲会话并补足到 min_size"""
+        now = time.monotonic()
+        for browser in [b for b in self._idle if self._expired(b, now)]:
+            # 销毁是异步的，期间会话可能已被租出
+            if browser in self._idle:
+                self._idle.remove(browser)
+                await self._destroy(browser)
+        await self._fill()
+
+    async def _reap_loop(self):
+        timeouts = [self.config.idle_timeout, self.config.max_age]
+        if self.config.close_after_idle > 0:
+            timeouts.append(self.config.close_after_idle)
+        interval = max(0.01, min(timeouts) / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if 0 < self.config.close_after_idle <= self.idle_for(time.monotonic()):
+                    logger.info(f"浏览器会话池闲置超过 {self.config.close_after_idle} 秒，已关闭")
+                    # 由回收任务自身关闭，close() 不能等待当前任务
+                    self._reaper = None
+                    await self.close()
+                    return
+                await self.evict()
+            except Exception as e:
+                logger.error(f"浏览器会话回收失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "leased": self._size - len(self._idle),
+            **self._stats,
+        }
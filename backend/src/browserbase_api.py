@@ -5,14 +5,18 @@ Browserbase自动化工具的API接口
 
 from fastapi import APIRouter, HTTPException, BackgroundTasks
 from pydantic import BaseModel, Field
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Set
+from collections import OrderedDict
 import asyncio
+import hashlib
 import json
 import os
 from datetime import datetime
 
+from .browser_pool import BrowserPool, BrowserPoolConfig
 from .browserbase_automation import (
     BrowserbaseAutomation, 
+    BrowserbaseSessionFactory,
     AutomationConfig, 
     FormAction, 
     ActionType, 
@@ -20,6 +24,7 @@ from .browserbase_automation import (
     create_login_automation,
     create_contact_form_automation
 )
+from .storage import ExecutionRecord, get_storage
 
 # 创建路由器
 router = APIRouter(prefix="/browserbase", tags=["browserbase"])
@@ -87,8 +92,73 @@ class AutomationResponseModel(BaseModel):
     timestamp: str
 
 
-# 全局变量存储任务状态
-automation_tasks = {}
+# 任务状态保存在持久化存储中（按TTL自动清理）
+AUTOMATION_TASK_KIND = "automation"
+
+
+def _task_store():
+    return get_storage().executions
+
+
+# 浏览器会话池，按 API密钥、项目与浏览器配置 的摘要分组（不保存明文密钥），跨请求复用已连接的会话；
+# 最多保留 BROWSER_POOLS_MAX 个池（超出时关闭最久未用的），闲置的池由其自身的回收任务关闭；
+# BROWSER_POOL_MAX_SIZE=0 时关闭
+_pool_config = BrowserPoolConfig.from_env()
+_max_pools = int(os.environ.get("BROWSER_POOLS_MAX", 16))
+_browser_pools: "OrderedDict[str, BrowserPool]" = OrderedDict()
+# 被淘汰、正在关闭的池：保留任务引用，关闭应用时等待其完成
+_closing_pools: Set[asyncio.Task] = set()
+
+
+def _pool_key(api_key: str, project_id: str, browser_config: Optional[Dict[str, Any]]) -> str:
+    material = json.dumps([api_key, project_id, browser_config], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _browser_pool(api_key: str, project_id: str, browser_config: Optional[Dict[str, Any]] = None) -> Optional[BrowserPool]:
+    """获取（必要时创建）一组配置对应的会话池，池中会话都按该浏览器配置创建"""
+    if _pool_config.max_size <= 0:
+        return None
+    for stale in [key for key, pool in _browser_pools.items() if pool.closed]:
+        del _browser_pools[stale]
+    key = _pool_key(api_key, project_id, browser_config)
+    pool = _browser_pools.get(key)
+    if pool is None:
+        pool = _browser_pools[key] = BrowserPool(
+            BrowserbaseSessionFactory(api_key, project_id, browser_config), _pool_config
+        )
+        while len(_browser_pools) > _max_pools:
+            _, evicted = _browser_pools.popitem(last=False)
+            task = asyncio.get_running_loop().create_task(evicted.close())
+            _closing_pools.add(task)
+            task.add_done_callback(_closing_pools.discard)
+    _browser_pools.move_to_end(key)
+    pool.touch()
+    return pool
+
+
+def _create_automation(browserbase_config: BrowserbaseConfigModel,
+                       browser_config: Optional[Dict[str, Any]] = None) -> BrowserbaseAutomation:
+    """创建使用共享会话池的自动化工具实例"""
+    return BrowserbaseAutomation(
+        api_key=browserbase_config.api_key,
+        project_id=browserbase_config.project_id,
+        pool=_browser_pool(browserbase_config.api_key, browserbase_config.project_id, browser_config),
+    )
+
+
+def browser_pool_stats() -> List[Dict[str, Any]]:
+    """各会话池的统计（不含API密钥）"""
+    return [{"project_id": pool.factory.project_id, **pool.stats()} for pool in _browser_pools.values()]
+
+
+async def close_browser_pools():
+    """关闭所有会话池，结束空闲的远程会话"""
+    pools = list(_browser_pools.values())
+    _browser_pools.clear()
+    for pool in pools:
+        await pool.close()
+    await asyncio.gather(*_closing_pools, return_exceptions=True)
 
 
 @router.post("/execute", response_model=AutomationResponseModel)
@@ -103,15 +173,12 @@ async def execute_automation(request: AutomationRequestModel):
         执行结果
     """
     try:
-        # 创建自动化工具实例
-        automation = BrowserbaseAutomation(
-            api_key=request.browserbase_config.api_key,
-            project_id=request.browserbase_config.project_id
-        )
-        
         # 转换配置
         config = _convert_to_automation_config(request.automation_config)
         
+        # 创建自动化工具实例（同一配置的请求共用会话池）
+        automation = _create_automation(request.browserbase_config, config.browser_config)
+        
         # 记录开始时间
         start_time = datetime.now()
         
@@ -151,22 +218,18 @@ async def execute_automation_async(request: AutomationRequestModel, background_t
     Returns:
         任务ID
     """
-    import uuid
-    
-    task_id = str(uuid.uuid4())
-    
     # 初始化任务状态
-    automation_tasks[task_id] = {
-        "status": "pending",
-        "result": None,
-        "error": None,
-        "created_at": datetime.now().isoformat()
-    }
+    task = ExecutionRecord(
+        kind=AUTOMATION_TASK_KIND,
+        status="pending",
+        data={"result": None, "error": None, "created_at": datetime.now().isoformat()},
+    )
+    await _task_store().save(task)
     
     # 添加后台任务
-    background_tasks.add_task(_execute_automation_background, task_id, request)
+    background_tasks.add_task(_execute_automation_background, task.id, request)
     
-    return {"task_id": task_id, "status": "pending"}
+    return {"task_id": task.id, "status": "pending"}
 
 
 @router.get("/task/{task_id}")
@@ -180,10 +243,11 @@ async def get_task_status(task_id: str):
     Returns:
         任务状态
     """
-    if task_id not in automation_tasks:
+    task = await _task_store().get(task_id, kind=AUTOMATION_TASK_KIND)
+    if task is None:
         raise HTTPException(status_code=404, detail="任务不存在")
     
-    return automation_tasks[task_id]
+    return {"status": task.status, **task.data}
 
 
 @router.post("/login", response_model=AutomationResponseModel)
@@ -203,10 +267,7 @@ async def execute_login_automation(
     """
     try:
         # 创建自动化工具实例
-        automation = BrowserbaseAutomation(
-            api_key=browserbase_config.api_key,
-            project_id=browserbase_config.project_id
-        )
+        automation = _create_automation(browserbase_config)
         
         # 创建登录自动化配置
         config = create_login_automation(
@@ -262,10 +323,7 @@ async def execute_contact_form_automation(
     """
     try:
         # 创建自动化工具实例
-        automation = BrowserbaseAutomation(
-            api_key=browserbase_config.api_key,
-            project_id=browserbase_config.project_id
-        )
+        automation = _create_automation(browserbase_config)
         
         # 创建联系表单自动化配置
         config = create_contact_form_automation(
@@ -386,19 +444,22 @@ async def _execute_automation_background(task_id: str, request: AutomationReques
         task_id: 任务ID
         request: 自动化请求
     """
+    store = _task_store()
+    task = await store.get(task_id, kind=AUTOMATION_TASK_KIND)
+    if task is None:
+        return
+    
     try:
         # 更新任务状态
-        automation_tasks[task_id]["status"] = "running"
-        
-        # 创建自动化工具实例
-        automation = BrowserbaseAutomation(
-            api_key=request.browserbase_config.api_key,
-            project_id=request.browserbase_config.project_id
-        )
+        task.status = "running"
+        await store.save(task)
         
         # 转换配置
         config = _convert_to_automation_config(request.automation_config)
         
+        # 创建自动化工具实例（同一配置的请求共用会话池）
+        automation = _create_automation(request.browserbase_config, config.browser_config)
+        
         # 记录开始时间
         start_time = datetime.now()
         
@@ -421,10 +482,12 @@ async def _execute_automation_background(task_id: str, request: AutomationReques
         }
         
         # 更新任务状态
-        automation_tasks[task_id]["status"] = "completed"
-        automation_tasks[task_id]["result"] = response
+        task.status = "completed"
+        task.data["result"] = response
+        await store.save(task)
         
     except Exception as e:
         # 更新任务状态为失败
-        automation_tasks[task_id]["status"] = "failed"
-        automation_tasks[task_id]["error"] = str(e)
+        task.status = "failed"
+        task.data["error"] = str(e)
+        await store.save(task)
@@ -20,6 +20,8 @@ from selenium.webdriver.common.action_chains import ActionChains
 from selenium.common.exceptions import TimeoutException, NoSuchElementException
 import httpx
 
+from .browser_pool import BrowserFactory, BrowserPool, DriverExecutor, PooledBrowser, default_driver_executor
+
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
@@ -79,17 +81,24 @@ class AutomationConfig:
 class BrowserbaseAutomation:
     """Browserbase浏览器自动化工具"""
     
-    def __init__(self, api_key: str, project_id: str):
+    def __init__(self, api_key: str, project_id: str, pool: Optional[BrowserPool] = None,
+                 executor: Optional[DriverExecutor] = None):
         """
         初始化Browserbase自动化工具
         
         Args:
             api_key: Browserbase API密钥
             project_id: Browserbase项目ID
+            pool: 浏览器会话池，设置后从池中租用会话，用完归还而不是销毁
+            executor: 执行阻塞WebDriver调用的线程池，默认使用会话池的或进程内共享的线程池
         """
         self.api_key = api_key
         self.project_id = project_id
         self.base_url = "https://www.browserbase.com/v1"
+        self.pool = pool
+        if executor is None:
+            executor = pool.executor if pool is not None else default_driver_executor()
+        self.executor = executor
         self.driver = None
         self.session_id = None
         
@@ -257,9 +266,9 @@ class BrowserbaseAutomation:
             logger.error(f"元素未找到: {selector_type.value}='{selector_value}'")
             raise
     
-    def execute_action(self, action: FormAction) -> bool:
+    async def execute_action(self, action: FormAction) -> bool:
         """
-        执行单个表单操作
+        执行单个表单操作，WebDriver调用在线程池中进行，等待不占用线程
         
         Args:
             action: 表单操作配置
@@ -267,17 +276,27 @@ class BrowserbaseAutomation:
         Returns:
             操作是否成功
         """
+        logger.info(f"执行操作: {action.description or action.action_type.value}")
+        
+        if action.action_type == ActionType.WAIT:
+            await asyncio.sleep(action.wait_time or 1)
+            return True
+        
+        success = await self.executor.run(self._perform_action, action)
+        
+        # 操作后等待
+        if success and action.wait_time:
+            await asyncio.sleep(action.wait_time)
+        
+        return success
+    
+    def _perform_action(self, action: FormAction) -> bool:
+        """执行单个表单操作中的WebDriver调用（阻塞，在线程池中运行）"""
         try:
-            logger.info(f"执行操作: {action.description or action.action_type.value}")
-            
             if action.action_type == ActionType.NAVIGATE:
                 self.driver.get(action.input_value)
                 return True
             
-            elif action.action_type == ActionType.WAIT:
-                time.sleep(action.wait_time or 1)
-                return True
-            
             elif action.action_type == ActionType.SCREENSHOT:
                 screenshot_path = action.input_value or f"screenshot_{int(time.time())}.png"
                 self.driver.save_screenshot(screenshot_path)
@@ -328,10 +347,6 @@ class BrowserbaseAutomation:
                 
             elif action.action_type == ActionType.SUBMIT_FORM:
                 element.submit()
-            
-            # 操作后等待
-            if action.wait_time:
-                time.sleep(action.wait_time)
                 
             return True
             
@@ -362,7 +377,15 @@ class BrowserbaseAutomation:
             
         Returns:
             执行结果
+            
+        Raises:
+            ValueError: 使用会话池时 config.browser_config 与池的浏览器配置不同（池中的会话已按池的配置创建）
         """
+        if self.pool is not None and config.browser_config:
+            pool_browser_config = getattr(self.pool.factory, "browser_config", None)
+            if config.browser_config != pool_browser_config:
+                raise ValueError("浏览器配置与会话池的配置不同，请使用该配置对应的会话池或不使用会话池")
+        
         results = {
             "success": False,
             "session_id": None,
@@ -372,23 +395,33 @@ class BrowserbaseAutomation:
             "screenshots": []
         }
         
+        browser = None
+        completed = False
+        
         try:
-            # 创建浏览器会话
-            session_id = await self.create_session(config.browser_config)
-            results["session_id"] = session_id
-            
-            # 获取会话连接URL
-            session_info = await self.get_session_info(session_id)
-            session_url = session_info.get("connectUrl")
-            
-            if not session_url:
-                raise Exception("无法获取会话连接URL")
-            
-            # 设置WebDriver
-            self.setup_driver(session_url)
+            if self.pool is not None:
+                # 从会话池租用已连接的会话（浏览器配置由池的会话工厂决定）
+                browser = await self.pool.acquire()
+                self.session_id = browser.session_id
+                self.driver = browser.driver
+                results["session_id"] = self.session_id
+            else:
+                # 创建浏览器会话
+                session_id = await self.create_session(config.browser_config)
+                results["session_id"] = session_id
+                
+                # 获取会话连接URL
+                session_info = await self.get_session_info(session_id)
+                session_url = session_info.get("connectUrl")
+                
+                if not session_url:
+                    raise Exception("无法获取会话连接URL")
+                
+                # 设置WebDriver
+                await self.executor.run(self.setup_driver, session_url)
             
             # 导航到目标URL
-            self.driver.get(config.url)
+            await self.executor.run(self.driver.get, config.url)
             logger.info(f"导航到: {config.url}")
             
             # 执行操作序列
@@ -398,7 +431,7 @@ class BrowserbaseAutomation:
                 
                 while retry_count < action.retry_count and not success:
                     try:
-                        success = self.execute_action(action)
+                        success = await self.execute_action(action)
                         if success:
                             results["executed_actions"] += 1
                             logger.info(f"操作 {i+1} 执行成功")
@@ -406,7 +439,7 @@ class BrowserbaseAutomation:
                             retry_count += 1
                             if retry_count < action.retry_count:
                                 logger.warning(f"操作 {i+1} 失败，重试 {retry_count}/{action.retry_count}")
-                                time.sleep(1)
+                                await asyncio.sleep(1)
                     except Exception as e:
                         retry_count += 1
                         error_msg = f"操作 {i+1} 执行异常: {str(e)}"
@@ -416,13 +449,13 @@ class BrowserbaseAutomation:
                         if config.screenshot_on_error:
                             screenshot_path = f"error_screenshot_{i+1}_{int(time.time())}.png"
                             try:
-                                self.driver.save_screenshot(screenshot_path)
+                                await self.executor.run(self.driver.save_screenshot, screenshot_path)
                                 results["screenshots"].append(screenshot_path)
                             except:
                                 pass
                         
                         if retry_count < action.retry_count:
-                            time.sleep(2)
+                            await asyncio.sleep(2)
                 
                 if not success:
                     results["failed_actions"] += 1
@@ -431,12 +464,13 @@ class BrowserbaseAutomation:
             # 最终截图
             final_screenshot = f"final_screenshot_{int(time.time())}.png"
             try:
-                self.driver.save_screenshot(final_screenshot)
+                await self.executor.run(self.driver.save_screenshot, final_screenshot)
                 results["screenshots"].append(final_screenshot)
             except:
                 pass
             
             results["success"] = results["failed_actions"] == 0
+            completed = True
             
         except Exception as e:
             error_msg = f"自动化流程执行失败: {str(e)}"
@@ -444,19 +478,25 @@ class BrowserbaseAutomation:
             results["errors"].append(error_msg)
             
         finally:
-            # 清理资源
-            if self.driver:
-                try:
-                    self.driver.quit()
-                except:
-                    pass
-            
-            # 结束浏览器会话
-            if self.session_id:
-                try:
-                    await self.end_session(self.session_id)
-                except:
-                    pass
+            if browser is not None:
+                # 归还会话，由会话池重置状态后复用；流程异常中断时会话状态未知，不再复用
+                self.driver = None
+                self.session_id = None
+                await self.pool.release(browser, discard=not completed)
+            else:
+                # 清理资源
+                if self.driver:
+                    try:
+                        await self.executor.run(self.driver.quit)
+                    except:
+                        pass
+                
+                # 结束浏览器会话
+                if self.session_id:
+                    try:
+                        await self.end_session(self.session_id)
+                    except:
+                        pass
         
         return results
     
@@ -501,6 +541,78 @@ class BrowserbaseAutomation:
             raise
 
 
+class BrowserbaseSessionFactory(BrowserFactory):
+    """为会话池创建Browserbase远程会话"""
+    
+    def __init__(self, api_key: str, project_id: str, browser_config: Optional[Dict[str, Any]] = None,
+                 executor: Optional[DriverExecutor] = None):
+        """
+        Args:
+            api_key: Browserbase API密钥
+            project_id: Browserbase项目ID
+            browser_config: 创建会话时使用的浏览器配置
+            executor: 建立与关闭WebDriver的线程池，默认使用进程内共享的线程池
+        """
+        self.api_key = api_key
+        self.project_id = project_id
+        self.browser_config = browser_config
+        self.executor = executor if executor is not None else default_driver_executor()
+    
+    async def create(self) -> PooledBrowser:
+        automation = BrowserbaseAutomation(self.api_key, self.project_id)
+        session_id = await automation.create_session(self.browser_config)
+        try:
+            session_info = await automation.get_session_info(session_id)
+            session_url = session_info.get("connectUrl")
+            if not session_url:
+                raise Exception("无法获取会话连接URL")
+            driver = await self.executor.run(automation.setup_driver, session_url)
+        except Exception:
+            await automation.end_session(session_id)
+            raise
+        return PooledBrowser(session_id=session_id, driver=driver)
+    
+    async def destroy(self, browser: PooledBrowser):
+        try:
+            await self.executor.run(browser.driver.quit)
+        except Exception as e:
+            logger.warning(f"关闭WebDriver失败: {str(e)}")
+        if browser.session_id:
+            await BrowserbaseAutomation(self.api_key, self.project_id).end_session(browser.session_id)
+
+
+class RemoteWebDriverFactory(BrowserFactory):
+    """为会话池连接本地或自建的Selenium/WebDriver服务（如 selenium/standalone-chrome、chromedriver）"""
+    
+    def __init__(self, command_executor: str, options: Optional[Any] = None,
+                 executor: Optional[DriverExecutor] = None):
+        """
+        Args:
+            command_executor: WebDriver服务地址，如 http://127.0.0.1:4444/wd/hub
+            options: 浏览器选项，默认无头Chrome
+            executor: 建立与关闭WebDriver的线程池，默认使用进程内共享的线程池
+        """
+        self.command_executor = command_executor
+        self.options = options
+        self.executor = executor if executor is not None else default_driver_executor()
+    
+    def _connect(self) -> webdriver.Remote:
+        options = self.options
+        if options is None:
+            options = webdriver.ChromeOptions()
+            options.add_argument('--headless=new')
+            options.add_argument('--no-sandbox')
+            options.add_argument('--disable-dev-shm-usage')
+        return webdriver.Remote(command_executor=self.command_executor, options=options)
+    
+    async def create(self) -> PooledBrowser:
+        driver = await self.executor.run(self._connect)
+        return PooledBrowser(session_id=driver.session_id, driver=driver)
+    
+    async def destroy(self, browser: PooledBrowser):
+        await self.executor.run(browser.driver.quit)
+
+
 # 便捷函数
 def create_login_automation(url: str, username: str, password: str, 
                           username_selector: str = "input[name='username']",
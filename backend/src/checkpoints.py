@@ -0,0 +1,203 @@
+"""
+节点检查点
+执行过程中每个成功节点的输出写入检查点，worker崩溃或执行失败后恢复时跳过已完成的节点，
+避免重复调用上游的HTTP/AI等昂贵节点。
+热路径上只把结果放入缓冲，序列化与批量写入在线程中完成。
+含流式响应体的输出不写入检查点（恢复时这些节点重新执行），以免把大响应体整体读入内存。
+已结束或记录已不存在的执行，其检查点保留 max_age 秒（供失败后恢复）后由定期清理删除
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, LargeBinary, String, Table, delete, exists, select
+from sqlalchemy.engine import Engine
+
+from . import serialization
+from .execution_context import ExecutionContext
+from .job_queue import FINISHED_STATUSES
+from .storage import SqlStoreBase, executions_table, metadata
+
+logger = logging.getLogger("workflow-engine")
+
+checkpoints_table = Table(
+    "checkpoints", metadata,
+    Column("execution_id", String(64), primary_key=True),
+    Column("node_id", String(255), primary_key=True),
+    Column("plan_hash", String(64), nullable=False),
+    Column("payload", LargeBinary, nullable=False),
+    Column("created_at", Float, nullable=False),
+)
+
+# 已结束执行的检查点默认保留时间（秒）
+DEFAULT_CHECKPOINT_MAX_AGE = 7 * 24 * 3600
+
+
+class CheckpointStore:
+    """检查点存储接口"""
+
+    def record(self, execution_id: str, plan_hash: str, node_id: str, result: Any):
+        """记录节点输出（同步调用，不阻塞事件循环）"""
+        raise NotImplementedError
+
+    async def load(self, execution_id: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        """读取执行的检查点，返回 (执行计划哈希, {节点ID: 输出})"""
+        raise NotImplementedError
+
+    async def delete(self, execution_id: str):
+        raise NotImplementedError
+
+    async def flush(self):
+        """把缓冲中的检查点落盘"""
+
+    async def purge_finished(self, max_age: float = DEFAULT_CHECKPOINT_MAX_AGE) -> int:
+        """删除已结束或记录已不存在、且早于 max_age 秒的执行的检查点，返回删除的行数"""
+        raise NotImplementedError
+
+    def start_retention(self, interval: float = 3600.0, max_age: float = DEFAULT_CHECKPOINT_MAX_AGE):
+        """启动后台定期清理（每 interval 秒执行一次 purge_finished）"""
+
+    def stop_retention(self):
+        """停止后台定期清理"""
+
+    def attach(self, context: ExecutionContext):
+        """让上下文在每个节点成功完成时写入检查点"""
+        def on_result(node_id: str, result: Any):
+            if context.plan_hash is not None and not (isinstance(result, dict) and "error" in result):
+                self.record(context.execution_id, context.plan_hash, node_id, result)
+        context.on_result = on_result
+
+    async def restore(self, context: ExecutionContext) -> int:
+        """把已有检查点恢复到上下文中，返回恢复的节点数"""
+        await self.flush()
+        plan_hash, results = await self.load(context.execution_id)
+        if results:
+            context.restore(results, plan_hash)
+        return len(results)
+
+
+class SqlCheckpointStore(SqlStoreBase, CheckpointStore):
+    """基于SQLAlchemy的检查点存储，缓冲达到 batch_size 条或 flush_interval 秒后批量写入"""
+
+    def __init__(self, engine: Engine, batch_size: int = 200, flush_interval: float = 0.2):
+        super().__init__(engine)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer: Dict[Tuple[str, str], Tuple[str, Any, float]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+        self._retention_task: Optional[asyncio.Task] = None
+
+    def record(self, execution_id: str, plan_hash: str, node_id: str, result: Any):
+        self._buffer[(execution_id, node_id)] = (plan_hash, result, time.time())
+        if len(self._buffer) >= self.batch_size:
+            self._spawn(self.flush())
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        self._spawn(self.flush())
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            pending, self._buffer = self._buffer, {}
+            try:
+                await asyncio.to_thread(self._write, self._upsert, pending)
+            except Exception as e:
+                logger.error(f"写入检查点失败: {str(e)}")
+                for key, value in pending.items():
+                    self._buffer.setdefault(key, value)
+
+    async def load(self, execution_id: str) -> Tuple[Optional[str], Dict[str, Any]]:
+        rows = await asyncio.to_thread(self._read, self._select, execution_id)
+        plan_hash = None
+        results = {}
+        for row in rows:
+            plan_hash = row.plan_hash
+            results[row.node_id] = serialization.loads(row.payload)
+        return plan_hash, results
+
+    async def delete(self, execution_id: str):
+        for key in [key for key in self._buffer if key[0] == execution_id]:
+            del self._buffer[key]
+        await asyncio.to_thread(
+            self._write,
+            lambda conn: conn.execute(delete(checkpoints_table).where(checkpoints_table.c.execution_id == execution_id)),
+        )
+
+    def start_retention(self, interval: float = 3600.0, max_age: float = DEFAULT_CHECKPOINT_MAX_AGE):
+        if self._retention_task is None or self._retention_task.done():
+            self._retention_task = asyncio.ensure_future(self._retention_loop(interval, max_age))
+
+    def stop_retention(self):
+        if self._retention_task is not None:
+            self._retention_task.cancel()
+            self._retention_task = None
+
+    async def _retention_loop(self, interval: float, max_age: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.purge_finished(max_age)
+            except Exception as e:
+                logger.error(f"清理检查点失败: {str(e)}")
+
+    async def purge_finished(self, max_age: float = DEFAULT_CHECKPOINT_MAX_AGE) -> int:
+        deleted = await asyncio.to_thread(self._write, self._delete_finished, time.time() - max_age)
+        if deleted:
+            logger.info(f"清理已结束执行的检查点 {deleted} 条")
+        return deleted
+
+    @staticmethod
+    def _delete_finished(conn, cutoff: float) -> int:
+        # 执行记录存在且尚未结束（排队、运行、挂起）时保留
+        unfinished = select(executions_table.c.id).where(
+            executions_table.c.id == checkpoints_table.c.execution_id,
+            executions_table.c.status.notin_(FINISHED_STATUSES),
+        )
+        return conn.execute(
+            delete(checkpoints_table).where(checkpoints_table.c.created_at < cutoff, ~exists(unfinished))
+        ).rowcount
+
+    def _upsert(self, conn, pending: Dict[Tuple[str, str], Tuple[str, Any, float]]):
+        # 序列化在写入线程中进行，不占用事件循环
+        rows: List[Dict[str, Any]] = []
+        for (execution_id, node_id), (plan_hash, result, created_at) in pending.items():
+            try:
+                payload = serialization.dumps(result)
+            except serialization.StreamedBodyError:
+                continue
+            rows.append({
+                "execution_id": execution_id,
+                "node_id": node_id,
+                "plan_hash": plan_hash,
+                "payload": payload,
+                "created_at": created_at,
+            })
+        # 跳过的节点同样删除旧检查点，恢复时重新执行
+        keys = list(pending)
+        table = checkpoints_table
+        for execution_id in {key[0] for key in keys}:
+            node_ids = [node_id for eid, node_id in keys if eid == execution_id]
+            conn.execute(delete(table).where(table.c.execution_id == execution_id, table.c.node_id.in_(node_ids)))
+        if rows:
+            conn.execute(table.insert(), rows)
+
+    @staticmethod
+    def _select(conn, execution_id: str):
+        return conn.execute(select(checkpoints_table).where(checkpoints_table.c.execution_id == execution_id)).all()
+
+
+def create_checkpoint_store(engine: Engine) -> SqlCheckpointStore:
+    """在存储所用的数据库上创建检查点存储"""
+    metadata.create_all(engine, tables=[checkpoints_table])
+    return SqlCheckpointStore(engine)
@@ -1,19 +1,49 @@
 import json
 import asyncio
 import httpx
-from typing import Dict, Any, List, Callable
+from typing import Dict, Any, Iterator, List, Callable, Optional, Tuple
 import logging
+import time
 import traceback
+from contextvars import ContextVar
+from urllib.parse import urlsplit
+
+from .execution_context import ExecutionContext
+from .expressions import ExpressionError, compile_expression
+from .function_runner import FunctionRunner, compile_function_code
+from .ai_cache import AICacheOptions, AIResponseCache
+from .ai_providers import AIConfig, AIGateway
+from .http_body import BodyTooLargeError, DEFAULT_LOAD_LIMIT, DEFAULT_SPILL_THRESHOLD, StreamedBody, read_response_body
+from .http_cache import HttpResponseCache
+from .http_pool import HttpClientPool, HttpPoolConfig
+from .paths import compile_mapping, compile_path
+from .resilience import CircuitBreakerRegistry, NodePolicy, PolicyError
+from .singleflight import SingleFlight, make_key
+from .templates import compile_template, precompile_value, render_value
+from .workflow_plan import ExecutionPlan, PlanCache
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("workflow-engine")
 
+# 当前执行所属的工作流ID，节点任务继承自 execute_workflow（用于按工作流统计）
+current_workflow_id: ContextVar[Any] = ContextVar("current_workflow_id", default=None)
+# 当前节点输出流式片段的回调，由 _execute_node 为开启 stream 的节点设置
+current_partial: ContextVar[Optional[Callable[[str], None]]] = ContextVar("current_partial", default=None)
+
+
+def _cancelling() -> bool:
+    """当前任务是否有未处理的取消请求（Task.cancelling 需要Python 3.11，更早的版本视为没有）"""
+    task = asyncio.current_task()
+    cancelling = getattr(task, "cancelling", None)
+    return bool(cancelling and cancelling())
+
+
 class WorkflowEngine:
     """
     工作流执行引擎，负责执行工作流中的节点并处理它们之间的数据传递
     """
     
-    def __init__(self):
+    def __init__(self, max_concurrency: Optional[int] = None, plan_cache_size: int = 128, http_config: Optional[HttpPoolConfig] = None, http_cache: Optional[HttpResponseCache] = None, coalesce: bool = True, function_runner: Optional[FunctionRunner] = None, suspend_threshold: Optional[float] = 60.0, circuit_breakers: Optional[CircuitBreakerRegistry] = None, ai_config: Optional[AIConfig] = None, ai_cache: Optional[AIResponseCache] = None):
         # 注册可用的节点类型及其处理函数
         self.node_handlers = {
             "http": self.handle_http_node,
@@ -25,131 +55,341 @@ class WorkflowEngine:
             "conditional": self.handle_conditional_node,
         }
         
-        # 节点执行结果缓存
-        self.execution_results = {}
+        # 单个工作流内同时执行的节点数上限（None 表示不限制）
+        self.max_concurrency = max_concurrency
+        
+        # 已编译执行计划的缓存，按工作流内容哈希失效
+        self.plan_cache = PlanCache(max_size=plan_cache_size, on_compile=self._prepare_plan)
+        
+        # HTTP节点共享的连接池，按目标主机复用连接
+        self.http_pool = HttpClientPool(http_config)
+        
+        # HTTP节点可选的响应缓存（节点配置 cache 开启）
+        self.http_cache = http_cache or HttpResponseCache()
+        
+        # 并发相同请求的合并（HTTP GET与AI调用），节点可通过 coalesce 配置关闭
+        self.coalesce = coalesce
+        self.single_flight = SingleFlight()
+        
+        # 函数节点执行器（代码对象缓存、线程池与进程池）
+        self.function_runner = function_runner or FunctionRunner()
+        
+        # 不短于该时长（秒）的延迟在可挂起的执行中不占用协程，而是挂起执行、到时由任务队列恢复
+        self.suspend_threshold = suspend_threshold
+        
+        # 节点策略启用熔断时按目标主机共享的熔断器
+        self.circuit_breakers = circuit_breakers or CircuitBreakerRegistry()
+        
+        # AI节点的模型调用（提供方、按模型限流与微批），与HTTP节点共享连接池
+        self.ai = AIGateway(ai_config, self.http_pool)
+        
+        # AI节点可选的响应缓存（节点配置 cache 开启），按工作流统计命中率
+        self.ai_cache = ai_cache or AIResponseCache()
+        
+    async def start(self):
+        """在应用启动时调用：把HTTP连接池绑定到当前事件循环"""
+        await self.http_pool.start()
+        
+    async def aclose(self):
+        """释放引擎持有的资源（连接池、函数节点进程池等），写入缓冲中的AI缓存统计"""
+        await self.ai_cache.flush()
+        await self.http_pool.aclose()
+        self.function_runner.shutdown()
         
-    async def execute_workflow(self, workflow: Dict[str, Any], initial_data: Dict[str, Any] = None) -> Dict[str, Any]:
+    def _prepare_plan(self, plan: ExecutionPlan):
+        """新编译的执行计划：预编译节点中的模板、路径映射、条件表达式与函数代码，首次执行时无需再解析"""
+        for node_id, node in plan.nodes.items():
+            config = node.get("config") or {}
+            try:
+                NodePolicy.from_node(node)
+            except PolicyError as e:
+                logger.warning(f"节点 {node_id} 的执行策略无效: {str(e)}")
+            if node.get("type") == "http":
+                for key in ("url", "headers", "params", "data"):
+                    precompile_value(config.get(key))
+            elif node.get("type") == "ai":
+                precompile_value(config.get("prompt"))
+            elif node.get("type") == "transform" and isinstance(config.get("mapping"), dict):
+                compile_mapping(config["mapping"])
+            if node.get("type") == "function" and config.get("code") and str(config.get("language", "")).lower() == "python":
+                try:
+                    compile_function_code(config["code"])
+                except SyntaxError as e:
+                    logger.warning(f"节点 {node_id} 的函数代码存在语法错误: {str(e)}")
+                continue
+            condition = config.get("condition")
+            if not condition or node.get("type") not in ("filter", "conditional"):
+                continue
+            names = ("item",) if node.get("type") == "filter" else ("data",)
+            try:
+                compile_expression(condition, names)
+            except ExpressionError as e:
+                logger.warning(f"节点 {node_id} 的条件表达式无效: {str(e)}")
+        
+    async def execute_workflow(self, workflow: Dict[str, Any], initial_data: Dict[str, Any] = None, max_concurrency: Optional[int] = None, context: Optional[ExecutionContext] = None) -> Dict[str, Any]:
         """执行完整的工作流，并返回最终结果"""
+        # 每次执行的状态保存在独立的上下文中，引擎本身不保存执行状态
+        if context is None:
+            context = ExecutionContext()
+        if initial_data:
+            # 将初始数据设置为工作流的起始点
+            context.workflow_input = initial_data
+        
+        context.start()
+        workflow_token = current_workflow_id.set(workflow.get("id"))
         try:
-            self.execution_results = {}
-            
-            if initial_data:
-                # 将初始数据设置为工作流的起始点
-                self.execution_results["workflow_input"] = initial_data
-            
-            nodes = workflow.get("nodes", [])
-            connections = workflow.get("connections", [])
-            
-            # 构建依赖图
-            dependencies = self._build_dependency_graph(nodes, connections)
+            # 编译执行计划（工作流定义未变化时复用缓存的计划）
+            plan = self.plan_cache.get_plan(workflow)
+            context.plan_hash = plan.plan_hash
+            if context.restored_plan_hash not in (None, plan.plan_hash):
+                # 检查点来自不同的工作流定义，不能复用
+                logger.warning(f"执行 {context.execution_id} 的检查点与当前工作流定义不一致，重新执行所有节点")
+                context.discard_restored()
+            
+            if not plan.start_nodes:
+                logger.warning("没有找到起始节点，工作流无法执行")
+                return {"status": "error", "execution_id": context.execution_id, "message": "没有找到起始节点"}
             
-            # 找出起始节点（没有输入连接的节点）
-            start_nodes = self._find_start_nodes(nodes, dependencies)
+            # 并发上限：调用参数 > 工作流配置 > 引擎默认值
+            if max_concurrency is None:
+                max_concurrency = workflow.get("max_concurrency") or self.max_concurrency
             
-            if not start_nodes:
-                logger.warning("没有找到起始节点，工作流无法执行")
-                return {"status": "error", "message": "没有找到起始节点"}
+            # 按拓扑顺序调度执行，互不依赖的分支并发运行
+            final_results = await self._schedule_nodes(plan, context, max_concurrency)
             
-            # 从起始节点开始执行
-            final_results = {}
-            for node_id in start_nodes:
-                result = await self._execute_node_and_dependents(node_id, nodes, dependencies)
-                final_results.update(result)
+            if context.suspended:
+                # 长延迟挂起：已完成的节点结果在检查点中，到 resume_at 后恢复执行
+                return {
+                    "status": "suspended",
+                    "execution_id": context.execution_id,
+                    "resume_at": context.resume_at,
+                    "wake_times": dict(context.wake_times),
+                    "results": final_results,
+                }
                 
-            return {"status": "success", "results": final_results}
+            return {"status": "success", "execution_id": context.execution_id, "results": final_results}
             
         except Exception as e:
             logger.error(f"工作流执行失败: {str(e)}")
             logger.error(traceback.format_exc())
-            return {"status": "error", "message": str(e)}
+            return {"status": "error", "execution_id": context.execution_id, "message": str(e)}
+        
+        finally:
+            current_workflow_id.reset(workflow_token)
+            context.finish()
+    
+    async def _schedule_nodes(self, plan: ExecutionPlan, context: ExecutionContext, max_concurrency: Optional[int] = None) -> Dict[str, Any]:
+        """拓扑调度：节点的所有上游完成后立即执行，独立分支在事件循环上并发运行"""
+        # 入度计数：每个节点尚未完成的上游数量，归零时节点就绪且只会就绪一次
+        pending_inputs = {node_id: len(sources) for node_id, sources in plan.predecessors.items()}
+        
+        semaphore = asyncio.Semaphore(max_concurrency) if max_concurrency and max_concurrency > 0 else None
+        final_results = {}
+        running = set()
+        # 在上游流式输出期间提前启动的节点，上游完成后不再重复调度
+        started_early = set()
+        wakeup = None
+        
+        def launch(node_id: str):
+            task = asyncio.create_task(self._execute_node(node_id, plan, context, semaphore))
+            running.add(task)
+        
+        def ready(node_id: str):
+            # 从检查点恢复的节点直接视为完成，沿下游继续推进（用栈避免长链递归）
+            stack = [node_id]
+            while stack:
+                current = stack.pop()
+                if current in started_early:
+                    continue
+                if current not in context.restored:
+                    launch(current)
+                    continue
+                final_results[current] = context.results[current]
+                for dep_node_id in plan.successors.get(current, ()):
+                    pending_inputs[dep_node_id] -= 1
+                    if pending_inputs[dep_node_id] == 0:
+                        stack.append(dep_node_id)
+        
+        def on_partial(node_id: str, delta: str):
+            # 声明 start_on_partial 的下游在其余上游都已完成、且部分输出足够长时立即启动
+            for dep_node_id in plan.successors.get(node_id, ()):
+                min_chars = plan.partial_starts.get(dep_node_id)
+                if min_chars is None or dep_node_id in started_early or pending_inputs[dep_node_id] != 1:
+                    continue
+                if dep_node_id in context.restored or len(context.partial_text(node_id)) < min_chars:
+                    continue
+                started_early.add(dep_node_id)
+                launch(dep_node_id)
+                if wakeup is not None and not wakeup.done():
+                    wakeup.set_result(None)
+        
+        if plan.partial_starts:
+            context.partial_listeners.append(on_partial)
+        
+        for node_id in plan.start_nodes:
+            ready(node_id)
+        
+        try:
+            while running:
+                if plan.partial_starts:
+                    # 提前启动的节点不在本轮等待的集合中，启动时唤醒调度循环
+                    wakeup = asyncio.get_running_loop().create_future()
+                    done, _ = await asyncio.wait(running | {wakeup}, return_when=asyncio.FIRST_COMPLETED)
+                    done.discard(wakeup)
+                    wakeup.cancel()
+                else:
+                    done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    running.discard(task)
+                    node_id, result = task.result()
+                    if node_id in context.suspended:
+                        # 挂起的延迟节点：下游等恢复执行后再调度
+                        continue
+                    final_results[node_id] = result
+                    
+                    # 下游节点的所有上游都完成后才进入就绪状态
+                    for dep_node_id in plan.successors.get(node_id, ()):
+                        pending_inputs[dep_node_id] -= 1
+                        if pending_inputs[dep_node_id] == 0:
+                            ready(dep_node_id)
+        finally:
+            # 工作流被取消或出错时，不留下孤立的节点任务
+            for task in running:
+                task.cancel()
+            if plan.partial_starts:
+                context.partial_listeners.remove(on_partial)
+        
+        return final_results
     
-    async def _execute_node_and_dependents(self, node_id: str, all_nodes: List[Dict[str, Any]], dependencies: Dict[str, List[str]]) -> Dict[str, Any]:
-        """执行当前节点及其所有依赖节点"""
-        # 如果节点已经执行过，直接返回结果
-        if node_id in self.execution_results:
-            return {node_id: self.execution_results[node_id]}
-        
-        # 找到当前节点
-        node = next((n for n in all_nodes if n["id"] == node_id), None)
+    async def _execute_node(self, node_id: str, plan: ExecutionPlan, context: ExecutionContext, semaphore: Optional[asyncio.Semaphore] = None) -> Tuple[str, Dict[str, Any]]:
+        """执行单个节点，返回 (节点ID, 执行结果)"""
+        node = plan.nodes.get(node_id)
         if not node:
             logger.error(f"找不到节点 ID: {node_id}")
-            return {node_id: {"error": f"节点 {node_id} 不存在"}}
+            result = {"error": f"节点 {node_id} 不存在"}
+            context.set_result(node_id, result)
+            return node_id, result
         
-        # 执行节点
         try:
             # 获取输入数据
-            input_data = self._get_input_data_for_node(node_id, all_nodes, dependencies)
+            input_data = context.get_input_data(node_id, plan)
             
             # 根据节点类型调用相应的处理函数
             node_type = node.get("type", "unknown")
             handler = self.node_handlers.get(node_type, self.handle_unknown_node)
             
             logger.info(f"执行节点 {node_id} (类型: {node_type})")
-            result = await handler(node, input_data)
-            
-            # 存储执行结果
-            self.execution_results[node_id] = result
-            
-            # 执行所有依赖于当前节点的下游节点
-            downstream_results = {}
-            for dep_node_id in dependencies.get(node_id, []):
-                dep_result = await self._execute_node_and_dependents(dep_node_id, all_nodes, dependencies)
-                downstream_results.update(dep_result)
-                
-            return {**{node_id: result}, **downstream_results}
+            if context.suspendable and handler == self.handle_delay_node:
+                wake_at = self._delay_wake_time(node, node_id, context)
+                if wake_at is not None and wake_at - time.time() >= (self.suspend_threshold or float("inf")):
+                    logger.info(f"延迟节点 {node_id} 挂起，{wake_at - time.time():.0f}秒后恢复")
+                    context.suspend(node_id, wake_at)
+                    return node_id, None
+                if wake_at is not None:
+                    # 未达到挂起阈值（或恢复执行后）只等待剩余的时间
+                    node = {**node, "config": {**node.get("config", {}), "delay": max(0.0, wake_at - time.time())}}
+            if node.get("config", {}).get("stream"):
+                # 流式节点通过 current_partial 输出片段
+                current_partial.set(lambda delta: context.emit_partial(node_id, delta))
+            policy = NodePolicy.from_node(node)
+            if policy.active:
+                result = await self._run_with_policy(node_id, node, handler, input_data, policy, context, semaphore)
+            elif semaphore:
+                async with semaphore:
+                    context.node_started(node_id)
+                    result = await handler(node, input_data)
+            else:
+                context.node_started(node_id)
+                result = await handler(node, input_data)
             
         except Exception as e:
             error_msg = f"节点 {node_id} 执行失败: {str(e)}"
             logger.error(error_msg)
             logger.error(traceback.format_exc())
-            self.execution_results[node_id] = {"error": error_msg}
-            return {node_id: {"error": error_msg}}
-    
-    def _build_dependency_graph(self, nodes: List[Dict[str, Any]], connections: List[Dict[str, Any]]) -> Dict[str, List[str]]:
-        """构建节点依赖关系图"""
-        # 记录每个节点的下游节点
-        dependencies = {}
-        
-        for connection in connections:
-            source = connection.get("source")
-            target = connection.get("target")
-            
-            if source and target:
-                if source not in dependencies:
-                    dependencies[source] = []
-                dependencies[source].append(target)
-                
-        return dependencies
+            result = {"error": error_msg}
+        
+        # 存储执行结果
+        context.set_result(node_id, result)
+        return node_id, result
     
-    def _find_start_nodes(self, nodes: List[Dict[str, Any]], dependencies: Dict[str, List[str]]) -> List[str]:
-        """找出没有输入连接的起始节点"""
-        # 所有节点ID
-        all_node_ids = {node["id"] for node in nodes}
+    async def _run_with_policy(self, node_id: str, node: Dict[str, Any], handler: Callable, input_data: Dict[str, Any], policy: NodePolicy, context: ExecutionContext, semaphore: Optional[asyncio.Semaphore]) -> Dict[str, Any]:
+        """按节点策略执行：每次尝试限时，失败后退避重试，目标熔断时直接失败；退避等待期间不占用并发名额"""
+        breaker = None
+        if policy.circuit_breaker:
+            circuit_key = self._circuit_key(node, input_data, policy)
+            if circuit_key:
+                breaker = self.circuit_breakers.get(circuit_key)
         
-        # 有输入的节点ID（即所有connections中的target）
-        nodes_with_inputs = set()
-        for deps in dependencies.values():
-            nodes_with_inputs.update(deps)
-            
-        # 起始节点 = 所有节点 - 有输入的节点
-        start_nodes = list(all_node_ids - nodes_with_inputs)
+        context.node_started(node_id)
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow():
+                logger.warning(f"节点 {node_id} 的目标 {circuit_key} 已熔断，跳过调用")
+                result = {"error": f"目标 {circuit_key} 已熔断，{breaker.retry_in:.0f}秒后恢复试探", "circuit_open": True}
+                break
+            try:
+                result = await self._attempt_node(node, handler, input_data, policy.timeout, semaphore)
+            except asyncio.CancelledError:
+                # 执行被取消不说明目标不可用，不计入熔断
+                if breaker is not None:
+                    breaker.release()
+                raise
+            if _cancelling():
+                # 取消被处理函数吞掉或表现为超时/错误结果：同样不计入熔断，也不再重试
+                if breaker is not None:
+                    breaker.release()
+                raise asyncio.CancelledError()
+            failed = policy.is_failure(result)
+            if breaker is not None:
+                if failed:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+            if not failed or attempt >= policy.retries:
+                break
+            delay = policy.retry_delay(attempt, result)
+            attempt += 1
+            logger.warning(f"节点 {node_id} 第{attempt}次执行失败，{delay:.2f}秒后重试")
+            await asyncio.sleep(delay)
         
-        return start_nodes
+        if attempt and isinstance(result, dict):
+            result = {**result, "attempts": attempt + 1}
+        return result
     
-    def _get_input_data_for_node(self, node_id: str, all_nodes: List[Dict[str, Any]], dependencies: Dict[str, List[str]]) -> Dict[str, Any]:
-        """获取节点的输入数据"""
-        # 找出所有以当前节点为target的连接对应的source节点
-        input_data = {}
-        
-        for source_id, targets in dependencies.items():
-            if node_id in targets and source_id in self.execution_results:
-                input_data[source_id] = self.execution_results[source_id]
-                
-        # 如果没有输入数据，使用工作流初始数据（如果有的话）
-        if not input_data and "workflow_input" in self.execution_results:
-            input_data["workflow_input"] = self.execution_results["workflow_input"]
-            
-        return input_data
+    async def _attempt_node(self, node: Dict[str, Any], handler: Callable, input_data: Dict[str, Any], timeout: Optional[float], semaphore: Optional[asyncio.Semaphore]) -> Dict[str, Any]:
+        """执行一次节点处理函数，超时（不含等待并发名额的时间）或抛出异常时返回错误结果"""
+        if semaphore:
+            async with semaphore:
+                return await self._attempt_node(node, handler, input_data, timeout, None)
+        try:
+            return await asyncio.wait_for(handler(node, input_data), timeout)
+        except asyncio.TimeoutError:
+            return {"error": f"执行超时（{timeout}秒）", "timeout": True}
+        except Exception as e:
+            return {"error": str(e)}
+    
+    def _circuit_key(self, node: Dict[str, Any], input_data: Dict[str, Any], policy: NodePolicy) -> Optional[str]:
+        """熔断器的键：显式配置的 circuit_key，否则HTTP节点为目标主机，AI节点为模型"""
+        if policy.circuit_key:
+            return policy.circuit_key
+        config = node.get("config", {})
+        if node.get("type") == "http":
+            host = urlsplit(self._replace_variables(config.get("url", ""), input_data)).hostname
+            return f"http:{host}" if host else None
+        if node.get("type") == "ai":
+            return f"ai:{config.get('model', 'gpt-3.5-turbo')}"
+        return None
+    
+    def _delay_wake_time(self, node: Dict[str, Any], node_id: str, context: ExecutionContext) -> Optional[float]:
+        """延迟节点的唤醒时间：首次到达时由延迟时长计算，恢复执行时沿用上次的值；配置无效时返回None"""
+        wake_at = context.wake_times.get(node_id)
+        if wake_at is None:
+            try:
+                wake_at = time.time() + float(node.get("config", {}).get("delay", 0))
+            except (TypeError, ValueError):
+                return None
+            context.wake_times[node_id] = wake_at
+        return wake_at
     
     # 节点处理函数
     
@@ -163,8 +403,11 @@ class WorkflowEngine:
             params = config.get("params", {})
             data = config.get("data", {})
             
-            # 支持从输入数据中替换变量
+            # 支持从输入数据中替换变量（URL、请求头、查询参数与请求体）
             url = self._replace_variables(url, input_data)
+            headers = render_value(headers, input_data)
+            params = render_value(params, input_data)
+            data = render_value(data, input_data)
             
             # 处理请求体（支持JSON格式）
             if isinstance(data, str):
@@ -173,36 +416,110 @@ class WorkflowEngine:
                 except:
                     pass
                     
+            if method not in ("GET", "POST", "PUT", "DELETE"):
+                return {"error": f"不支持的HTTP方法: {method}"}
+                
             logger.info(f"HTTP请求: {method} {url}")
             
-            async with httpx.AsyncClient() as client:
-                if method == "GET":
-                    response = await client.get(url, headers=headers, params=params)
-                elif method == "POST":
-                    response = await client.post(url, headers=headers, params=params, json=data if isinstance(data, dict) else data)
-                elif method == "PUT":
-                    response = await client.put(url, headers=headers, params=params, json=data)
-                elif method == "DELETE":
-                    response = await client.delete(url, headers=headers, params=params)
-                else:
-                    return {"error": f"不支持的HTTP方法: {method}"}
-                
-                # 尝试解析JSON响应
-                try:
-                    response_data = response.json()
-                except:
-                    response_data = response.text
-                    
-                return {
-                    "status_code": response.status_code,
-                    "headers": dict(response.headers),
-                    "data": response_data
-                }
+            # 复用引擎共享的连接池，节点可单独配置超时时间
+            client = self.http_pool.get_client(url)
+            request_kwargs = {"headers": headers, "params": params}
+            if method in ("POST", "PUT"):
+                request_kwargs["json"] = data
+            if config.get("timeout") is not None:
+                request_kwargs["timeout"] = float(config["timeout"])
+            
+            send = lambda: self._send_http_request(client, method, url, request_kwargs, config)
+            
+            # 并发的相同GET请求合并为一次调用（流式响应不合并）
+            if method == "GET" and not config.get("stream"):
+                coalesce_key = self._coalesce_key(config, input_data, "http", method, url, request_kwargs)
+                if coalesce_key:
+                    return await self.single_flight.do(coalesce_key, send)
+            return await send()
                 
         except Exception as e:
             logger.error(f"HTTP节点执行失败: {str(e)}")
             return {"error": str(e)}
     
+    async def _send_http_request(self, client: httpx.AsyncClient, method: str, url: str, request_kwargs: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+        """发送HTTP请求并构建节点结果"""
+        # 流式模式或配置了体积上限时，边读边检查大小，大响应体写入临时文件
+        if config.get("stream") or config.get("max_body_size") is not None:
+            return await self._stream_http_response(client, method, url, request_kwargs, config)
+        
+        # 可选的GET响应缓存
+        cache_config = config.get("cache")
+        if cache_config and method == "GET":
+            return await self._cached_http_request(client, url, request_kwargs, cache_config)
+        
+        response = await client.request(method, url, **request_kwargs)
+        
+        # 尝试解析JSON响应
+        try:
+            response_data = response.json()
+        except:
+            response_data = response.text
+            
+        return {
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "data": response_data
+        }
+    
+    async def _cached_http_request(self, client: httpx.AsyncClient, url: str, request_kwargs: Dict[str, Any], cache_config: Any) -> Dict[str, Any]:
+        """通过响应缓存执行GET请求，cache配置可为 true 或 {"ttl": 秒, "vary": [请求头]}"""
+        options = cache_config if isinstance(cache_config, dict) else {}
+        entry, cache_status = await self.http_cache.fetch(
+            client, url, request_kwargs,
+            ttl=options.get("ttl"),
+            vary=options.get("vary"),
+        )
+        
+        # 尝试解析JSON响应
+        try:
+            response_data = json.loads(entry.content)
+        except:
+            response_data = entry.content.decode("utf-8", errors="replace")
+        
+        return {
+            "status_code": entry.status_code,
+            "headers": entry.headers,
+            "data": response_data,
+            "cache": cache_status
+        }
+    
+    async def _stream_http_response(self, client: httpx.AsyncClient, method: str, url: str, request_kwargs: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+        """流式读取HTTP响应，内存占用不随响应体大小增长"""
+        max_body_size = config.get("max_body_size")
+        spill_threshold = config.get("spill_threshold", DEFAULT_SPILL_THRESHOLD)
+        
+        try:
+            async with client.stream(method, url, **request_kwargs) as response:
+                body = await read_response_body(
+                    response,
+                    max_body_size=int(max_body_size) if max_body_size is not None else None,
+                    spill_threshold=int(spill_threshold),
+                    fmt=config.get("response_format"),
+                )
+        except BodyTooLargeError as e:
+            logger.warning(f"HTTP响应体过大: {method} {url}")
+            return {"error": str(e)}
+        
+        # 流式模式下把响应体交给下游节点按需逐条消费
+        if config.get("stream"):
+            response_data = body
+        else:
+            response_data = body.load()
+            body.close()
+        
+        return {
+            "status_code": response.status_code,
+            "headers": dict(response.headers),
+            "data": response_data,
+            "size": body.size
+        }
+    
     async def handle_function_node(self, node: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """处理函数节点，执行自定义JavaScript或Python代码"""
         try:
@@ -214,39 +531,16 @@ class WorkflowEngine:
                 return {"error": "未提供代码"}
                 
             if language == "python":
-                # 实际环境中应该使用更安全的执行方式，例如通过API调用隔离的执行环境
-                # 这里只是演示
-                
-                # 准备一个本地命名空间
-                local_vars = {"input_data": input_data, "result": {}}
-                
-                # 添加安全的Python内置函数
-                allowed_builtins = {
-                    "dict": dict,
-                    "list": list,
-                    "set": set,
-                    "str": str,
-                    "int": int,
-                    "float": float,
-                    "bool": bool,
-                    "len": len,
-                    "range": range,
-                    "sum": sum,
-                    "max": max,
-                    "min": min,
-                    "sorted": sorted,
-                    "filter": filter,
-                    "map": map,
-                    "zip": zip,
-                    "enumerate": enumerate,
-                    "print": lambda *args: logger.info(" ".join(str(a) for a in args))
-                }
-                
-                # 执行代码
-                exec(code, {"__builtins__": allowed_builtins}, local_vars)
-                
-                # 返回结果
-                return local_vars.get("result", {})
+                # 编译后的代码对象按源码哈希缓存；CPU密集的代码可放到常驻进程池执行，
+                # 避免阻塞事件循环上的其他工作流
+                return await self.function_runner.run(
+                    code,
+                    input_data,
+                    mode=config.get("execution"),
+                    timeout=config.get("timeout"),
+                    cpu_seconds=config.get("cpu_time_limit"),
+                    memory_mb=config.get("memory_limit_mb"),
+                )
             else:
                 return {"error": f"不支持的语言: {language}"}
                 
@@ -266,21 +560,71 @@ class WorkflowEngine:
             
             logger.info(f"AI请求: 模型={model}, 提示词长度={len(prompt)}")
             
-            # 这里应该连接到实际的AI API，例如OpenAI API
-            # 为了演示，我们返回模拟数据
-            await asyncio.sleep(1)  # 模拟API调用延迟
+            send = lambda: self._call_ai_model(model, prompt, config)
             
-            return {
-                "model": model,
-                "prompt": prompt,
-                "response": f"这是对提示词的AI响应: {prompt[:30]}...",
-                "tokens": len(prompt) // 4
-            }
+            # 并发的相同提示词合并为一次调用
+            params = {k: v for k, v in config.items() if k not in ("prompt", "coalesce")}
+            # 流式调用的片段只推送给本节点，不与其他调用合并
+            coalesce_key = None if config.get("stream") else self._coalesce_key(config, input_data, "ai", model, prompt, params)
+            call = (lambda: self.single_flight.do(coalesce_key, send)) if coalesce_key else send
+            
+            cache_options = AICacheOptions.from_config(config.get("cache"))
+            if cache_options is not None:
+                return await self._cached_ai_call(model, prompt, config, cache_options, call)
+            return await call()
             
         except Exception as e:
             logger.error(f"AI节点执行失败: {str(e)}")
             return {"error": str(e)}
     
+    async def _cached_ai_call(self, model: str, prompt: str, config: Dict[str, Any], options: AICacheOptions, call: Callable) -> Dict[str, Any]:
+        """通过AI响应缓存调用模型，cache配置可为 true 或 {"ttl": 秒, "normalize": true / ["whitespace", "case"]}"""
+        key = self.ai_cache.make_key(model, prompt, config, options.normalize)
+        cached = await self.ai_cache.lookup(key, current_workflow_id.get())
+        if cached is not None:
+            emit = current_partial.get()
+            if emit is not None:
+                emit(cached["text"])
+            return {
+                "model": model,
+                "prompt": prompt,
+                "response": cached["text"],
+                "tokens": cached["usage"]["total_tokens"],
+                "usage": cached["usage"],
+                "cache": "hit",
+            }
+        result = await call()
+        if "error" not in result:
+            await self.ai_cache.save(key, model, {"text": result["response"], "usage": result["usage"]}, options.ttl)
+        return {**result, "cache": "miss"}
+    
+    async def _call_ai_model(self, model: str, prompt: str, config: Dict[str, Any]) -> Dict[str, Any]:
+        """调用AI模型，节点开启 stream 时逐段输出到 current_partial"""
+        emit = current_partial.get()
+        if config.get("stream") and emit is not None:
+            result = await self._stream_ai_model(model, prompt, config, emit)
+        else:
+            result = await self.ai.complete(model, prompt, config, provider=config.get("provider"))
+        return {
+            "model": model,
+            "prompt": prompt,
+            "response": result["text"],
+            "tokens": result["usage"]["total_tokens"],
+            "usage": result["usage"],
+        }
+    
+    async def _stream_ai_model(self, model: str, prompt: str, config: Dict[str, Any], emit: Callable[[str], None]) -> Dict[str, Any]:
+        """流式调用AI模型，返回与非流式调用相同结构的完整结果"""
+        pieces = []
+        usage = None
+        async for item in self.ai.stream(model, prompt, config, provider=config.get("provider")):
+            if "usage" in item:
+                usage = item["usage"]
+                continue
+            pieces.append(item["delta"])
+            emit(item["delta"])
+        return {"text": "".join(pieces), "usage": usage}
+    
     async def handle_filter_node(self, node: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """处理过滤节点，根据条件过滤数据"""
         try:
@@ -298,25 +642,24 @@ class WorkflowEngine:
                 else:
                     data_to_filter[source_id] = data
             
-            # 实际环境中应该使用更安全的条件评估方式
-            # 这里用简化的方式处理一些基本情况
+            # 条件按源码编译一次（经AST校验的受限表达式），之后对每条记录直接调用
+            try:
+                expression = compile_expression(condition, ("item",))
+            except ExpressionError as e:
+                return {"error": f"条件表达式无效: {str(e)}"}
+            
             filtered_data = {}
             for source_id, data in data_to_filter.items():
-                if isinstance(data, list):
-                    # 如果是列表，尝试过滤列表项
-                    filtered_list = []
-                    for item in data:
-                        # 在实际应用中，这应该用一个表达式引擎来评估条件
-                        # 这里只是简单演示
-                        if "item" in condition and isinstance(item, dict):
-                            # 非常简化的条件评估
-                            try:
-                                local_vars = {"item": item}
-                                if eval(condition, {"__builtins__": {}}, local_vars):
-                                    filtered_list.append(item)
-                            except:
-                                pass
-                    filtered_data[source_id] = filtered_list
+                # 流式响应体逐条解析后过滤，无需整体加载到内存
+                if isinstance(data, StreamedBody):
+                    data = data.records() if data.is_sequence else self._load_body(data, config)
+                
+                if isinstance(data, (list, Iterator)):
+                    # 如果是列表，过滤其中的字典记录
+                    filtered_data[source_id] = expression.filter(data) if "item" in condition else []
+                elif config.get("columnar") and isinstance(data, dict) and all(isinstance(v, list) for v in data.values()):
+                    # 列式数据 {"字段": [值, ...]}，简单条件按列向量化求值
+                    filtered_data[source_id] = expression.filter_columns(data)
                 else:
                     # 如果不是列表，直接传递数据
                     filtered_data[source_id] = data
@@ -345,14 +688,27 @@ class WorkflowEngine:
                     data_to_transform = data
                 break  # 只处理第一个输入源
             
-            # 根据映射转换数据
-            transformed_data = {}
-            for target_key, source_path in mapping.items():
-                value = self._get_value_by_path(data_to_transform, source_path)
-                if value is not None:
-                    transformed_data[target_key] = value
+            # 映射按内容缓存编译结果，路径已预先拆分为访问器
+            compiled_mapping = compile_mapping(mapping)
+            
+            # 批量模式下记录序列逐条映射，不整体加载；其余情况需要完整数据
+            if isinstance(data_to_transform, StreamedBody):
+                if (config.get("batch") and data_to_transform.is_sequence
+                        and compiled_mapping.iterates_root(config.get("records_path"))):
+                    data_to_transform = data_to_transform.records()
+                else:
+                    data_to_transform = self._load_body(data_to_transform, config)
+            
+            # 批量模式：一次遍历把映射应用到记录列表的每条记录，输出行式或列式结果
+            if config.get("batch"):
+                return {"data": compiled_mapping.apply_batch(
+                    data_to_transform,
+                    output=config.get("output", "rows"),
+                    records_path=config.get("records_path"),
+                )}
             
-            return {"data": transformed_data}
+            # 根据映射转换数据
+            return {"data": compiled_mapping.apply(data_to_transform)}
             
         except Exception as e:
             logger.error(f"转换节点执行失败: {str(e)}")
@@ -394,15 +750,19 @@ class WorkflowEngine:
                     data_to_evaluate = data
                 break  # 只处理第一个输入源
             
-            # 在实际应用中，这应该用一个表达式引擎来评估条件
+            # 条件表达式需要完整数据；流式响应体只在求值时加载，向下游传递的仍是流式响应体
+            data_to_pass = data_to_evaluate
+            if isinstance(data_to_evaluate, StreamedBody):
+                data_to_evaluate = self._load_body(data_to_evaluate, config)
+            
+            # 条件按源码编译一次，之后直接调用编译好的函数
             try:
-                local_vars = {"data": data_to_evaluate}
-                result = eval(condition, {"__builtins__": {}}, local_vars)
+                result = compile_expression(condition, ("data",)).evaluate(data_to_evaluate)
                 
                 return {
                     "condition_result": result,
                     "branch": true_branch if result else false_branch,
-                    "data": data_to_evaluate
+                    "data": data_to_pass
                 }
                 
             except Exception as e:
@@ -413,6 +773,20 @@ class WorkflowEngine:
             logger.error(f"条件节点执行失败: {str(e)}")
             return {"error": str(e)}
     
+    def _load_body(self, body: StreamedBody, config: Dict[str, Any]) -> Any:
+        """整体加载流式响应体，上限为节点配置的 max_body_size（默认 DEFAULT_LOAD_LIMIT），超过时抛出BodyTooLargeError"""
+        limit = config.get("max_body_size", DEFAULT_LOAD_LIMIT)
+        return body.load(max_size=int(limit) if limit is not None else None)
+    
+    def _coalesce_key(self, config: Dict[str, Any], input_data: Dict[str, Any], *parts: Any) -> Optional[str]:
+        """计算请求合并键；节点配置 coalesce: false 时不合并，coalesce: {"key": 模板} 时使用自定义键"""
+        option = config.get("coalesce", self.coalesce)
+        if not option:
+            return None
+        if isinstance(option, dict) and option.get("key"):
+            return make_key(parts[0], self._replace_variables(option["key"], input_data))
+        return make_key(*parts)
+    
     async def handle_unknown_node(self, node: Dict[str, Any], input_data: Dict[str, Any]) -> Dict[str, Any]:
         """处理未知类型的节点"""
         node_type = node.get("type", "unknown")
@@ -424,49 +798,15 @@ class WorkflowEngine:
         if not template or not isinstance(template, str):
             return template
             
-        # 用简单的 {{变量名}} 语法来替换变量
-        import re
-        
-        def replace_var(match):
-            var_name = match.group(1).strip()
-            parts = var_name.split('.')
-            
-            current = data
-            for part in parts:
-                if isinstance(current, dict) and part in current:
-                    current = current[part]
-                else:
-                    # 变量不存在，保留原始占位符
-                    return match.group(0)
-            
-            # 如果值是复杂类型，转换为JSON字符串
-            if isinstance(current, (dict, list)):
-                return json.dumps(current)
-            
-            # 否则直接转换为字符串
-            return str(current)
-        
-        # 替换所有 {{变量}} 形式的占位符
-        return re.sub(r'\{\{\s*(.+?)\s*\}\}', replace_var, template)
+        # 模板按内容缓存编译结果，渲染时只拼接预先拆分好的片段
+        return compile_template(template).render(data)
     
     def _get_value_by_path(self, data: Any, path: str) -> Any:
         """根据路径获取嵌套数据中的值"""
         if not path:
             return None
             
-        parts = path.split('.')
-        current = data
-        
-        for part in parts:
-            if isinstance(current, dict) and part in current:
-                current = current[part]
-            elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
-                current = current[int(part)]
-            else:
-                return None
-                
-        return current
-
+        return compile_path(path).get(data)
 
 # 示例用法
 async def test_engine():
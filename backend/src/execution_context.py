@@ -0,0 +1,139 @@
+"""
+工作流执行上下文
+保存单次执行的输入、节点结果与耗时，使同一个引擎可以并发执行多个工作流
+"""
+
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from .workflow_plan import ExecutionPlan
+
+
+@dataclass
+class NodeTiming:
+    """单个节点的执行耗时"""
+    started_at: float
+    finished_at: Optional[float] = None
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+@dataclass
+class ExecutionContext:
+    """单次工作流执行的状态"""
+    execution_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    workflow_input: Optional[Dict[str, Any]] = None
+    results: Dict[str, Any] = field(default_factory=dict)
+    timings: Dict[str, NodeTiming] = field(default_factory=dict)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    # 当前执行计划的哈希（由引擎设置）
+    plan_hash: Optional[str] = None
+    # 从检查点恢复、无需重新执行的节点
+    restored: Set[str] = field(default_factory=set)
+    restored_plan_hash: Optional[str] = None
+    # 节点完成时的回调 (节点ID, 结果)，用于写入检查点
+    on_result: Optional[Callable[[str, Any], None]] = None
+    # 是否允许长延迟挂起执行（需要检查点与任务队列支持恢复）
+    suspendable: bool = False
+    # 延迟节点的唤醒时间（时间戳），恢复执行时沿用上次计算的唤醒时间
+    wake_times: Dict[str, float] = field(default_factory=dict)
+    # 本次执行中挂起等待的延迟节点
+    suspended: Dict[str, float] = field(default_factory=dict)
+    # 流式节点（如 stream 开启的AI节点）已输出的文本片段
+    partials: Dict[str, List[str]] = field(default_factory=dict)
+    # 流式节点产出片段时的回调 (节点ID, 文本片段)，用于推送给API客户端与提前启动下游节点
+    partial_listeners: List[Callable[[str, str], None]] = field(default_factory=list)
+
+    def start(self):
+        """标记执行开始"""
+        self.started_at = time.time()
+
+    def finish(self):
+        """标记执行结束"""
+        self.finished_at = time.time()
+
+    @property
+    def duration(self) -> Optional[float]:
+        """执行总耗时（秒）"""
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def node_started(self, node_id: str):
+        """记录节点开始执行"""
+        self.timings[node_id] = NodeTiming(started_at=time.time())
+
+    def set_result(self, node_id: str, result: Any):
+        """保存节点结果并记录结束时间"""
+        self.results[node_id] = result
+        timing = self.timings.get(node_id)
+        if timing is not None:
+            timing.finished_at = time.time()
+        if self.on_result is not None:
+            self.on_result(node_id, result)
+
+    def suspend(self, node_id: str, wake_at: float):
+        """延迟节点挂起到 wake_at，其下游节点本次不再调度"""
+        self.wake_times[node_id] = wake_at
+        self.suspended[node_id] = wake_at
+
+    def emit_partial(self, node_id: str, delta: str):
+        """记录流式节点输出的片段并通知监听者"""
+        self.partials.setdefault(node_id, []).append(delta)
+        for listener in self.partial_listeners:
+            listener(node_id, delta)
+
+    def partial_text(self, node_id: str) -> str:
+        """流式节点目前为止的输出"""
+        return "".join(self.partials.get(node_id, ()))
+
+    @property
+    def resume_at(self) -> Optional[float]:
+        """最早需要恢复执行的时间"""
+        return min(self.suspended.values()) if self.suspended else None
+
+    def restore(self, results: Dict[str, Any], plan_hash: Optional[str] = None):
+        """恢复已完成节点的结果，调度时跳过这些节点"""
+        self.results.update(results)
+        self.restored.update(results)
+        self.restored_plan_hash = plan_hash
+
+    def discard_restored(self):
+        """丢弃恢复的结果（工作流定义已变化时）"""
+        for node_id in self.restored:
+            self.results.pop(node_id, None)
+        self.restored.clear()
+        self.restored_plan_hash = None
+
+    def get_input_data(self, node_id: str, plan: ExecutionPlan) -> Dict[str, Any]:
+        """
+        获取节点的输入数据
+
+        Args:
+            node_id: 节点ID
+            plan: 执行计划
+
+        Returns:
+            以上游节点ID为键的输入数据，没有上游结果时使用工作流初始数据
+        """
+        input_data = {}
+
+        # 只查看当前节点的上游节点，无需扫描整个依赖图
+        for source_id in plan.predecessors.get(node_id, ()):
+            if source_id in self.results:
+                input_data[source_id] = self.results[source_id]
+            elif source_id in self.partials:
+                # 在上游流式输出期间提前启动的节点，拿到的是目前为止的部分输出
+                input_data[source_id] = {"response": self.partial_text(source_id), "partial": True}
+
+        if not input_data and self.workflow_input:
+            input_data["workflow_input"] = self.workflow_input
+
+        return input_data
@@ -0,0 +1,126 @@
+"""
+执行事件流
+把进程内正在运行的执行的事件推送给订阅者（API的服务端事件流接口）：
+
+- partial：流式节点输出的文本片段 {"event": "partial", "node": 节点ID, "delta": 片段}
+- node：节点完成 {"event": "node", "node": 节点ID, "status": "success" / "error", "result": 结果}
+- done：执行结束 {"event": "done", "status": 执行状态, ...}
+
+订阅时先重放已发生的事件（最多 max_events 条）再接收新事件，执行结束后流保留 linger 秒供迟到的订阅者读取。
+只有在本进程执行的工作流（流式执行接口、内嵌worker）有片段级事件
+"""
+
+import asyncio
+import json
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+from .execution_context import ExecutionContext
+
+
+def _dumps(value: Any) -> str:
+    if orjson is not None:
+        return orjson.dumps(value, default=str).decode("utf-8")
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def sse_message(event: Dict[str, Any]) -> str:
+    """格式化为服务端事件流（text/event-stream）的一条消息"""
+    return f"event: {event['event']}\ndata: {_dumps(event)}\n\n"
+
+
+class ExecutionStream:
+    """单个执行的事件流"""
+
+    def __init__(self, execution_id: str, max_events: int = 10000):
+        self.execution_id = execution_id
+        self.events: "deque[Dict[str, Any]]" = deque(maxlen=max_events)
+        self.closed = False
+        self._subscribers: List[asyncio.Queue] = []
+
+    def publish(self, event: Dict[str, Any]):
+        if self.closed:
+            return
+        self.events.append(event)
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def close(self, event: Dict[str, Any]):
+        self.publish(event)
+        self.closed = True
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    async def subscribe(self) -> AsyncIterator[Dict[str, Any]]:
+        """已发生的事件加上之后的新事件，执行结束后迭代结束"""
+        # 复制历史与注册队列之间没有await，不会漏掉事件
+        backlog = list(self.events)
+        closed = self.closed
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        try:
+            for event in backlog:
+                yield event
+            if closed:
+                return
+            while True:
+                event = await queue.get()
+                if event is None:
+                    return
+                yield event
+        finally:
+            self._subscribers.remove(queue)
+
+
+class ExecutionStreamBroker:
+    """进程内各执行的事件流"""
+
+    def __init__(self, max_events: int = 10000, linger: float = 60.0):
+        """
+        Args:
+            max_events: 每个执行保留用于重放的事件数
+            linger: 执行结束后事件流保留的秒数
+        """
+        self.max_events = max_events
+        self.linger = linger
+        self._streams: Dict[str, ExecutionStream] = {}
+
+    def get(self, execution_id: str) -> Optional[ExecutionStream]:
+        return self._streams.get(execution_id)
+
+    def attach(self, context: ExecutionContext) -> ExecutionStream:
+        """为执行创建事件流，并让上下文在流式片段与节点完成时发布事件"""
+        stream = self._streams.get(context.execution_id)
+        if stream is None or stream.closed:
+            stream = self._streams[context.execution_id] = ExecutionStream(context.execution_id, self.max_events)
+
+        def on_partial(node_id: str, delta: str):
+            stream.publish({"event": "partial", "node": node_id, "delta": delta})
+        context.partial_listeners.append(on_partial)
+
+        previous = context.on_result
+        def on_result(node_id: str, result: Any):
+            if previous is not None:
+                previous(node_id, result)
+            failed = isinstance(result, dict) and "error" in result
+            stream.publish({"event": "node", "node": node_id, "status": "error" if failed else "success",
+                            "result": result})
+        context.on_result = on_result
+        return stream
+
+    def close(self, execution_id: str, status: str, **data):
+        """发布 done 事件并结束事件流，linger 秒后移除"""
+        stream = self._streams.get(execution_id)
+        if stream is None or stream.closed:
+            return
+        stream.close({"event": "done", "execution_id": execution_id, "status": status, **data})
+        asyncio.get_running_loop().call_later(self.linger, self._remove, stream)
+
+    def _remove(self, stream: ExecutionStream):
+        if self._streams.get(stream.execution_id) is stream:
+            del self._streams[stream.execution_id]
@@ -0,0 +1,294 @@
+"""
+表达式引擎
+过滤/条件节点使用的受限表达式：经AST校验后编译为Python函数，按源码缓存，只编译一次。
+乘方与乘法经检查后执行，结果过大（如 9 ** 9 ** 9、"a" * 10 ** 12）时报错，不会卡住事件循环或耗尽内存
+"""
+
+import ast
+import operator
+from functools import lru_cache
+from itertools import compress, repeat
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# 表达式中可用的内置函数
+SAFE_BUILTINS = {
+    "abs": abs,
+    "all": all,
+    "any": any,
+    "bool": bool,
+    "dict": dict,
+    "float": float,
+    "int": int,
+    "isinstance": isinstance,
+    "len": len,
+    "list": list,
+    "max": max,
+    "min": min,
+    "round": round,
+    "set": set,
+    "sorted": sorted,
+    "str": str,
+    "sum": sum,
+    "tuple": tuple,
+}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.IfExp,
+    ast.Name, ast.Load, ast.Store, ast.Constant, ast.Attribute, ast.Subscript, ast.Slice,
+    ast.Tuple, ast.List, ast.Dict, ast.Set, ast.Call, ast.keyword,
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp, ast.comprehension,
+    ast.And, ast.Or, ast.Not, ast.Invert, ast.UAdd, ast.USub,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+)
+
+_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+
+# 乘方/乘法结果的上限：整数位数与序列（字符串、列表等）长度
+MAX_INT_BITS = 4096
+MAX_SEQUENCE_LENGTH = 1_000_000
+
+# 可借以访问解释器内部对象的属性（帧、代码对象、格式化字符串中的属性访问）
+_FORBIDDEN_ATTRS = {"format", "format_map", "mro"}
+_FORBIDDEN_ATTR_PREFIXES = ("_", "gi_", "cr_", "ag_", "f_", "co_", "tb_")
+
+
+class ExpressionError(ValueError):
+    """表达式语法错误或包含不允许的操作"""
+
+
+def _checked_pow(base: Any, exponent: Any) -> Any:
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0 and abs(base) > 1:
+        if (abs(base).bit_length() - 1) * exponent > MAX_INT_BITS:
+            raise ExpressionError(f"乘方结果超过 {MAX_INT_BITS} 位")
+    return base ** exponent
+
+
+def _checked_mul(left: Any, right: Any) -> Any:
+    if isinstance(left, int) and isinstance(right, int):
+        if left.bit_length() + right.bit_length() > MAX_INT_BITS:
+            raise ExpressionError(f"乘法结果超过 {MAX_INT_BITS} 位")
+    elif isinstance(right, int) and hasattr(left, "__len__"):
+        if len(left) * right > MAX_SEQUENCE_LENGTH:
+            raise ExpressionError(f"重复后的长度超过 {MAX_SEQUENCE_LENGTH}")
+    elif isinstance(left, int) and hasattr(right, "__len__"):
+        if len(right) * left > MAX_SEQUENCE_LENGTH:
+            raise ExpressionError(f"重复后的长度超过 {MAX_SEQUENCE_LENGTH}")
+    return left * right
+
+
+# 编译后的表达式中检查过的运算（以下划线开头，表达式本身无法引用）
+_CHECKED_OPS = {ast.Pow: "_checked_pow", ast.Mult: "_checked_mul"}
+_EXPRESSION_GLOBALS = {"__builtins__": SAFE_BUILTINS, "_checked_pow": _checked_pow, "_checked_mul": _checked_mul}
+
+
+class _CheckedArithmetic(ast.NodeTransformer):
+    """把乘方与乘法替换为带结果大小检查的函数调用；与浮点常量相乘不会产生过大的结果，保持原样"""
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        name = _CHECKED_OPS.get(type(node.op))
+        if name is None or any(isinstance(operand, ast.Constant) and isinstance(operand.value, float)
+                               for operand in (node.left, node.right)):
+            return node
+        call = ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return ast.copy_location(call, node)
+
+
+class _Validator(ast.NodeVisitor):
+    """校验表达式只包含允许的语法与名称，禁止访问内部属性"""
+
+    def __init__(self, names: Tuple[str, ...]):
+        self.names = set(names) | set(SAFE_BUILTINS)
+
+    def validate(self, tree: ast.AST):
+        # 推导式引入的循环变量可在表达式中使用
+        for node in ast.walk(tree):
+            if isinstance(node, ast.comprehension):
+                for target in ast.walk(node.target):
+                    if isinstance(target, ast.Name):
+                        self.names.add(target.id)
+        self.visit(tree)
+
+    def generic_visit(self, node):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise ExpressionError(f"表达式不允许使用 {type(node).__name__}")
+        super().generic_visit(node)
+
+    def visit_Attribute(self, node):
+        if node.attr in _FORBIDDEN_ATTRS or node.attr.startswith(_FORBIDDEN_ATTR_PREFIXES):
+            raise ExpressionError(f"表达式不允许访问属性 {node.attr}")
+        self.generic_visit(node)
+
+    def visit_Name(self, node):
+        if node.id.startswith("_") or node.id not in self.names:
+            raise ExpressionError(f"表达式不允许使用名称 {node.id}")
+        self.generic_visit(node)
+
+
+class CompiledExpression:
+    """编译后的表达式"""
+
+    def __init__(self, source: str, names: Tuple[str, ...]):
+        self.source = source
+        self.names = names
+        try:
+            tree = ast.parse(source.strip(), mode="eval")
+        except SyntaxError as e:
+            raise ExpressionError(f"表达式语法错误: {e.msg}") from None
+        _Validator(names).validate(tree)
+
+        # 形如 item['a'] > 1 and item.get('b') == 'x' 的简单条件可按列向量化求值
+        self.column_conditions = _extract_column_conditions(tree.body, names)
+
+        # 编译为以变量名为参数的lambda，求值时不再需要构造局部命名空间
+        lambda_tree = ast.Expression(body=ast.Lambda(
+            args=ast.arguments(
+                posonlyargs=[], args=[ast.arg(arg=name) for name in names],
+                kwonlyargs=[], kw_defaults=[], defaults=[],
+            ),
+            body=_CheckedArithmetic().visit(tree.body),
+        ))
+        ast.fix_missing_locations(lambda_tree)
+        code = compile(lambda_tree, "<expression>", "eval")
+        self.function: Callable[..., Any] = eval(code, _EXPRESSION_GLOBALS)
+
+    def evaluate(self, *args: Any) -> Any:
+        """按 names 的顺序传入变量并求值"""
+        return self.function(*args)
+
+    def filter(self, items: Iterable[Any]) -> List[Any]:
+        """
+        用单变量表达式过滤字典记录
+
+        非字典记录与求值出错的记录会被跳过
+        """
+        predicate = self.function
+        if isinstance(items, list):
+            try:
+                return [item for item in items if isinstance(item, dict) and predicate(item)]
+            except Exception:
+                pass
+        return [item for item in items if isinstance(item, dict) and _safe_call(predicate, item)]
+
+    def filter_columns(self, columns: Dict[str, List[Any]]) -> Dict[str, List[Any]]:
+        """
+        过滤列式数据 {"字段": [值, ...]}
+
+        简单条件按列计算掩码后整体压缩，其余条件逐行求值
+        """
+        if not columns:
+            return {}
+        row_count = min(len(values) for values in columns.values())
+
+        if self.column_conditions is not None:
+            mask = self._column_mask(columns, row_count)
+        else:
+            names = list(columns)
+            predicate = self.function
+            mask = [
+                _safe_call(predicate, dict(zip(names, row)))
+                for row in zip(*(columns[name] for name in names))
+            ]
+        return {name: list(compress(values, mask)) for name, values in columns.items()}
+
+    def _column_mask(self, columns: Dict[str, List[Any]], row_count: int) -> List[bool]:
+        combinator, conditions = self.column_conditions
+        mask: Optional[List[bool]] = None
+        for field_name, use_get, compare, constant in conditions:
+            values = columns.get(field_name)
+            if values is None:
+                # 缺失的列：item.get() 得到 None，item[...] 会出错（视为不匹配）
+                current = [_safe_compare(compare, None, constant) if use_get else False] * row_count
+            else:
+                column = values if len(values) == row_count else values[:row_count]
+                try:
+                    current = list(map(compare, column, repeat(constant, row_count)))
+                except TypeError:
+                    # 列中存在不可比较的值时逐个比较
+                    current = [_safe_compare(compare, value, constant) for value in column]
+            if mask is None:
+                mask = current
+            elif combinator == "and":
+                mask = list(map(operator.and_, mask, current))
+            else:
+                mask = list(map(operator.or_, mask, current))
+        return mask or [False] * row_count
+
+
+def _safe_call(predicate: Callable[[Any], Any], item: Any) -> bool:
+    try:
+        return bool(predicate(item))
+    except Exception:
+        return False
+
+
+def _safe_compare(compare: Callable[[Any, Any], bool], value: Any, constant: Any) -> bool:
+    try:
+        return bool(compare(value, constant))
+    except TypeError:
+        return False
+
+
+def _extract_column_conditions(body: ast.AST, names: Tuple[str, ...]):
+    """识别 (字段 比较 常量) 及其 and/or 组合，返回 (组合方式, [(字段, 比较函数, 常量)])"""
+    if len(names) != 1:
+        return None
+    if isinstance(body, ast.BoolOp):
+        combinator = "and" if isinstance(body.op, ast.And) else "or"
+        conditions = [_column_comparison(value, names[0]) for value in body.values]
+    else:
+        combinator = "and"
+        conditions = [_column_comparison(body, names[0])]
+    if any(condition is None for condition in conditions):
+        return None
+    return combinator, conditions
+
+
+def _column_comparison(node: ast.AST, var_name: str):
+    if not (isinstance(node, ast.Compare) and len(node.ops) == 1 and type(node.ops[0]) in _COMPARE_OPS):
+        return None
+    access = _field_access(node.left, var_name)
+    right = node.comparators[0]
+    if access is None or not isinstance(right, ast.Constant):
+        return None
+    field_name, use_get = access
+    return field_name, use_get, _COMPARE_OPS[type(node.ops[0])], right.value
+
+
+def _field_access(node: ast.AST, var_name: str) -> Optional[Tuple[str, bool]]:
+    """识别 item['field'] 或 item.get('field')，返回 (字段名, 是否为get访问)"""
+    if (isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name) and node.value.id == var_name
+            and isinstance(node.slice, ast.Constant) and isinstance(node.slice.value, str)):
+        return node.slice.value, False
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "get"
+            and isinstance(node.func.value, ast.Name) and node.func.value.id == var_name
+            and len(node.args) == 1 and not node.keywords
+            and isinstance(node.args[0], ast.Constant) and isinstance(node.args[0].value, str)):
+        return node.args[0].value, True
+    return None
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(source: str, names: Tuple[str, ...] = ("item",)) -> CompiledExpression:
+    """
+    编译表达式，相同源码只编译一次
+
+    Args:
+        source: 表达式源码
+        names: 表达式可使用的变量名，求值时按此顺序传参
+
+    Returns:
+        CompiledExpression对象
+
+    Raises:
+        ExpressionError: 表达式语法错误或包含不允许的操作
+    """
+    return CompiledExpression(source, names)
@@ -0,0 +1,274 @@
+"""
+函数节点执行器
+缓存编译后的代码对象，并在常驻进程池（默认）或线程池中执行用户代码，不占用事件循环。
+进程池模式下可为每个节点设置CPU时间与内存上限；超时的代码会被停止：
+进程池中按超时时间收紧CPU上限，到期仍未结束的worker进程连同进程池一起回收，
+线程池中通过跟踪函数在超时后抛出异常
+"""
+
+import asyncio
+import hashlib
+import logging
+import multiprocessing
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from types import CodeType
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+    import signal
+except ImportError:  # Windows 不支持 rlimit，进程池模式下忽略资源限制
+    resource = None
+    signal = None
+
+logger = logging.getLogger("workflow-engine")
+
+EXECUTION_MODES = ("inline", "thread", "process")
+COMPILE_CACHE_SIZE = 512
+# 超时后等待进程池worker自行停止（CPU超限信号）的时间，之后回收整个进程池
+PROCESS_KILL_GRACE = 2.0
+
+
+class FunctionLimitExceeded(Exception):
+    """函数节点超出CPU时间或内存限制"""
+
+
+def _log_print(*args):
+    logger.info(" ".join(str(a) for a in args))
+
+
+# 函数节点可用的Python内置函数
+ALLOWED_BUILTINS = {
+    "dict": dict,
+    "list": list,
+    "set": set,
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "len": len,
+    "range": range,
+    "sum": sum,
+    "max": max,
+    "min": min,
+    "sorted": sorted,
+    "filter": filter,
+    "map": map,
+    "zip": zip,
+    "enumerate": enumerate,
+    "print": _log_print,
+}
+
+
+def code_hash(code: str) -> str:
+    """源码哈希，作为编译缓存的键"""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+_compiled: "OrderedDict[str, CodeType]" = OrderedDict()
+_compiled_lock = threading.Lock()
+
+
+def compile_function_code(code: str) -> CodeType:
+    """编译函数节点源码，相同源码只编译一次（按源码哈希缓存，缓存中不保留源码）"""
+    digest = code_hash(code)
+    with _compiled_lock:
+        compiled = _compiled.get(digest)
+        if compiled is not None:
+            _compiled.move_to_end(digest)
+            return compiled
+    compiled = compile(code, f"<function-node {digest[:12]}>", "exec")
+    with _compiled_lock:
+        _compiled[digest] = compiled
+        if len(_compiled) > COMPILE_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+
+def run_function_code(code: str, input_data: Dict[str, Any]) -> Any:
+    """执行函数节点代码，返回代码中赋值的 result"""
+    local_vars = {"input_data": input_data, "result": {}}
+    exec(compile_function_code(code), {"__builtins__": ALLOWED_BUILTINS}, local_vars)
+    return local_vars.get("result", {})
+
+
+def _run_with_deadline(code: str, input_data: Dict[str, Any], timeout: Optional[float]) -> Any:
+    """在线程池中执行：设置了超时时通过跟踪函数在到期后抛出异常，释放线程"""
+    if not timeout:
+        return run_function_code(code, input_data)
+    deadline = time.monotonic() + timeout
+
+    def trace(frame, event, arg):
+        if time.monotonic() > deadline:
+            raise FunctionLimitExceeded(f"函数节点执行超时（{timeout}秒）")
+        return trace
+
+    sys.settrace(trace)
+    try:
+        return run_function_code(code, input_data)
+    finally:
+        sys.settrace(None)
+
+
+def _terminate_workers(pool: ProcessPoolExecutor):
+    """结束进程池的所有worker进程（Python 3.14起有公开接口）"""
+    terminate = getattr(pool, "terminate_workers", None)
+    if terminate is not None:
+        terminate()
+        return
+    for process in list((getattr(pool, "_processes", None) or {}).values()):
+        process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _raise_cpu_limit(signum, frame):
+    raise FunctionLimitExceeded("函数节点超出CPU时间限制")
+
+
+def _init_worker():
+    """进程池worker初始化：CPU超限时抛出异常而不是终止进程"""
+    if signal is not None and hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+
+
+def _run_with_limits(code: str, input_data: Dict[str, Any], cpu_seconds: Optional[float],
+                     memory_mb: Optional[int]) -> Any:
+    """在进程池worker中执行，临时收紧本进程的rlimit，执行后恢复"""
+    if resource is None or (not cpu_seconds and not memory_mb):
+        return run_function_code(code, input_data)
+
+    saved_cpu = resource.getrlimit(resource.RLIMIT_CPU)
+    saved_as = resource.getrlimit(resource.RLIMIT_AS)
+    try:
+        if cpu_seconds:
+            # RLIMIT_CPU 按进程累计，在已用CPU时间的基础上增加本次预算
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = int(usage.ru_utime + usage.ru_stime)
+            soft = used + max(1, int(cpu_seconds + 0.999))
+            if saved_cpu[1] != resource.RLIM_INFINITY:
+                soft = min(soft, saved_cpu[1])
+            resource.setrlimit(resource.RLIMIT_CPU, (soft, saved_cpu[1]))
+        if memory_mb:
+            soft = int(memory_mb) * 1024 * 1024
+            if saved_as[1] != resource.RLIM_INFINITY:
+                soft = min(soft, saved_as[1])
+            resource.setrlimit(resource.RLIMIT_AS, (soft, saved_as[1]))
+        return run_function_code(code, input_data)
+    except MemoryError:
+        raise FunctionLimitExceeded("函数节点超出内存限制") from None
+    finally:
+        resource.setrlimit(resource.RLIMIT_CPU, saved_cpu)
+        resource.setrlimit(resource.RLIMIT_AS, saved_as)
+
+
+class FunctionRunner:
+    """函数节点执行器，持有线程池与常驻进程池"""
+
+    def __init__(self, default_mode: str = "process", process_workers: Optional[int] = None,
+                 thread_workers: Optional[int] = None):
+        """
+        初始化执行器
+
+        Args:
+            default_mode: 节点未指定时的执行方式：process（默认）/ thread / inline（在事件循环上执行，仅适合极短的代码）
+            process_workers: 进程池大小，默认为CPU核数
+            thread_workers: 线程池大小
+        """
+        if default_mode not in EXECUTION_MODES:
+            raise ValueError(f"不支持的执行方式: {default_mode}")
+        self.default_mode = default_mode
+        self.process_workers = process_workers
+        self.thread_workers = thread_workers
+        self._process_pool: Optional[ProcessPoolExecutor] = None
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.process_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return self._process_pool
+
+    def _get_thread_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.thread_workers, thread_name_prefix="function-node"
+            )
+        return self._thread_pool
+
+    async def warm_up(self):
+        """预先启动进程池中的所有worker"""
+        pool = self._get_process_pool()
+        loop = asyncio.get_running_loop()
+        workers = pool._max_workers
+        await asyncio.gather(*[
+            loop.run_in_executor(pool, _run_with_limits, "result = 0", {}, None, None)
+            for _ in range(workers)
+        ])
+
+    async def run(self, code: str, input_data: Dict[str, Any], mode: Optional[str] = None,
+                  timeout: Optional[float] = None, cpu_seconds: Optional[float] = None,
+                  memory_mb: Optional[int] = None) -> Any:
+        """
+        执行函数节点代码
+
+        Args:
+            code: Python源码
+            input_data: 节点输入数据
+            mode: 执行方式，默认使用default_mode
+            timeout: 超时时间（秒），到期后停止代码（inline模式不支持）
+            cpu_seconds: CPU时间上限（仅进程池模式）
+            memory_mb: 内存上限（仅进程池模式）
+
+        Returns:
+            代码中赋值的 result
+
+        Raises:
+            FunctionLimitExceeded: 超时或超出CPU时间、内存限制
+        """
+        mode = mode or self.default_mode
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"不支持的执行方式: {mode}")
+
+        if mode == "inline":
+            return run_function_code(code, input_data)
+
+        if mode == "thread":
+            future = self._get_thread_pool().submit(_run_with_deadline, code, input_data, timeout)
+        else:
+            # 函数节点不能导入模块或休眠，耗时几乎都是CPU时间，按超时时间收紧CPU上限即可让worker自行停止
+            if timeout:
+                cpu_seconds = min(cpu_seconds, timeout) if cpu_seconds else timeout
+            pool = self._get_process_pool()
+            future = pool.submit(_run_with_limits, code, input_data, cpu_seconds, memory_mb)
+
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or None)
+        except asyncio.TimeoutError:
+            if mode == "process":
+                asyncio.get_running_loop().call_later(PROCESS_KILL_GRACE, self._recycle_if_stuck, pool, future)
+            raise FunctionLimitExceeded(f"函数节点执行超时（{timeout}秒）") from None
+
+    def _recycle_if_stuck(self, pool: ProcessPoolExecutor, future: Future):
+        """超时的代码仍未停止（如长时间的C调用不响应信号）：回收进程池，之后的调用使用新进程池"""
+        if future.done():
+            return
+        logger.warning("函数节点超时后仍未停止，回收进程池")
+        if self._process_pool is pool:
+            self._process_pool = None
+        _terminate_workers(pool)
+
+    def shutdown(self):
+        """关闭线程池与进程池"""
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=False, cancel_futures=True)
+            self._thread_pool = None
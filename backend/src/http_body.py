@@ -0,0 +1,302 @@
+"""
+HTTP响应体处理
+流式读取响应体：限制最大体积，超过阈值时写入临时文件，并支持JSON数组/NDJSON的增量解析
+"""
+
+import codecs
+import json
+import os
+import tempfile
+import weakref
+from typing import Any, Dict, Iterator, List, Optional
+
+import httpx
+
+# 内存中最多缓存的响应体字节数，超过后写入临时文件
+DEFAULT_SPILL_THRESHOLD = 1024 * 1024
+READ_CHUNK_SIZE = 64 * 1024
+# 节点需要整体加载（load）响应体时默认允许的最大字节数
+DEFAULT_LOAD_LIMIT = 64 * 1024 * 1024
+
+_WHITESPACE = " \t\r\n"
+
+
+class BodyTooLargeError(Exception):
+    """响应体超过配置的最大体积"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        super().__init__(f"响应体超过上限 {limit} 字节")
+
+
+def detect_format(content_type: str) -> str:
+    """根据Content-Type推断响应格式：json / ndjson / text"""
+    content_type = (content_type or "").lower()
+    if "ndjson" in content_type or "jsonl" in content_type or "json-seq" in content_type:
+        return "ndjson"
+    if "json" in content_type:
+        return "json"
+    return "text"
+
+
+class StreamedBody:
+    """
+    已读取完毕的响应体，小体积保存在内存中，大体积保存在临时文件中
+
+    下游节点可以通过 records() 逐条消费JSON数组或NDJSON记录，无需整体加载
+    """
+
+    def __init__(self, content: Optional[bytes] = None, path: Optional[str] = None,
+                 size: int = 0, fmt: str = "text", encoding: str = "utf-8"):
+        self._content = content
+        self.path = path
+        self.size = size
+        self.format = fmt
+        self.encoding = encoding
+        self._is_sequence: Optional[bool] = None
+        # 对象被回收时删除临时文件
+        self._finalizer = weakref.finalize(self, _remove_file, path) if path else None
+
+    @property
+    def spilled(self) -> bool:
+        """响应体是否写入了临时文件"""
+        return self.path is not None
+
+    @property
+    def is_sequence(self) -> bool:
+        """响应体是否为可逐条消费的记录序列（JSON数组或NDJSON）"""
+        if self._is_sequence is None:
+            if self.format == "ndjson":
+                self._is_sequence = True
+            elif self.format == "json":
+                self._is_sequence = self._first_char() == "["
+            else:
+                self._is_sequence = False
+        return self._is_sequence
+
+    def iter_bytes(self, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[bytes]:
+        """按块迭代原始字节"""
+        if self._content is not None:
+            for start in range(0, len(self._content), chunk_size):
+                yield self._content[start:start + chunk_size]
+            return
+        if self.path is None:
+            return
+        with open(self.path, "rb") as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def iter_text(self, chunk_size: int = READ_CHUNK_SIZE) -> Iterator[str]:
+        """按块迭代解码后的文本"""
+        decoder = codecs.getincrementaldecoder(self.encoding)(errors="replace")
+        for chunk in self.iter_bytes(chunk_size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+        tail = decoder.decode(b"", final=True)
+        if tail:
+            yield tail
+
+    def read(self) -> bytes:
+        """读取完整响应体"""
+        return b"".join(self.iter_bytes())
+
+    def text(self) -> str:
+        """读取完整响应体文本"""
+        return "".join(self.iter_text())
+
+    def load(self, max_size: Optional[int] = None) -> Any:
+        """
+        整体解析响应体，解析失败时返回文本
+
+        Raises:
+            BodyTooLargeError: 响应体超过 max_size 字节
+        """
+        if max_size is not None and self.size > max_size:
+            raise BodyTooLargeError(max_size)
+        if self.format == "ndjson":
+            return list(self.records())
+        text = self.text()
+        if self.format == "json":
+            try:
+                return json.loads(text)
+            except ValueError:
+                pass
+        return text
+
+    def records(self) -> Iterator[Any]:
+        """逐条迭代JSON数组元素或NDJSON记录"""
+        if self.format == "ndjson":
+            return _iter_ndjson(self.iter_bytes())
+        if self.is_sequence:
+            return _iter_json_array(self.iter_text())
+        return iter([self.load()])
+
+    def summary(self) -> Dict[str, Any]:
+        """可序列化的响应体描述"""
+        return {"format": self.format, "size": self.size, "spilled": self.spilled}
+
+    def close(self):
+        """立即删除临时文件"""
+        if self._finalizer is not None:
+            self._finalizer()
+        self._content = None
+
+    def _first_char(self) -> str:
+        for text in self.iter_text():
+            stripped = text.lstrip(_WHITESPACE)
+            if stripped:
+                return stripped[0]
+        return ""
+
+    def __repr__(self) -> str:
+        return f"StreamedBody(format={self.format!r}, size={self.size}, spilled={self.spilled})"
+
+
+def _remove_file(path: str):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
+def _iter_ndjson(chunks: Iterator[bytes]) -> Iterator[Any]:
+    # 尚未遇到换行的片段先收集起来，遇到换行时才拼接，长行不会被反复复制
+    pending: List[bytes] = []
+    for chunk in chunks:
+        if b"\n" not in chunk:
+            pending.append(chunk)
+            continue
+        lines = chunk.split(b"\n")
+        pending.append(lines[0])
+        lines[0] = b"".join(pending)
+        pending = [lines.pop()]
+        for line in lines:
+            if line.strip():
+                yield json.loads(line)
+    tail = b"".join(pending)
+    if tail.strip():
+        yield json.loads(tail)
+
+
+def _iter_json_array(chunks: Iterator[str]) -> Iterator[Any]:
+    """增量解析顶层JSON数组，每次只在内存中保留当前元素"""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    exhausted = False
+    started = False
+
+    def fill() -> bool:
+        # 至少读入与未解析部分等量的数据（几何增长）再拼接：跨越大量分块的长元素
+        # 只需重试解码 O(log n) 次，拼接与解码的总代价与元素大小成线性
+        nonlocal buffer, pos, exhausted
+        pending = [buffer[pos:]]
+        wanted = max(len(pending[0]), 1)
+        received = 0
+        while received < wanted:
+            try:
+                chunk = next(chunks)
+            except StopIteration:
+                exhausted = True
+                break
+            pending.append(chunk)
+            received += len(chunk)
+        buffer = "".join(pending)
+        pos = 0
+        return received > 0
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= len(buffer):
+            if exhausted or not fill():
+                raise ValueError("JSON数组不完整")
+            continue
+
+        char = buffer[pos]
+        if not started:
+            if char != "[":
+                raise ValueError("响应体不是JSON数组")
+            started = True
+            pos += 1
+            continue
+        if char == "]":
+            return
+        if char == ",":
+            pos += 1
+            continue
+
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if exhausted or not fill():
+                raise
+            continue
+        # 数字等值可能被分块截断（如 "-3." 被解析为 -3），确认其后紧跟分隔符后再产出
+        after = end
+        while after < len(buffer) and buffer[after] in _WHITESPACE:
+            after += 1
+        if after >= len(buffer) or buffer[after] not in ",]":
+            if not exhausted and fill():
+                continue
+            if after < len(buffer):
+                raise ValueError(f"JSON数组格式错误，位置 {after}")
+        pos = end
+        yield value
+
+
+async def read_response_body(response: httpx.Response, max_body_size: Optional[int] = None,
+                             spill_threshold: int = DEFAULT_SPILL_THRESHOLD,
+                             fmt: Optional[str] = None) -> StreamedBody:
+    """
+    流式读取响应体
+
+    Args:
+        response: 以 stream 方式发起的响应
+        max_body_size: 最大允许的字节数，None 表示不限制
+        spill_threshold: 内存缓存上限，超过后写入临时文件
+        fmt: 响应格式，未指定时根据Content-Type推断
+
+    Returns:
+        StreamedBody对象
+
+    Raises:
+        BodyTooLargeError: 响应体超过最大体积
+    """
+    fmt = fmt or detect_format(response.headers.get("content-type", ""))
+    encoding = response.charset_encoding or "utf-8"
+
+    declared = response.headers.get("content-length")
+    if max_body_size is not None and declared and declared.isdigit() and int(declared) > max_body_size:
+        raise BodyTooLargeError(max_body_size)
+
+    buffer = bytearray()
+    spill_file = None
+    size = 0
+    try:
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if max_body_size is not None and size > max_body_size:
+                raise BodyTooLargeError(max_body_size)
+            if spill_file is None and len(buffer) + len(chunk) > spill_threshold:
+                spill_file = tempfile.NamedTemporaryFile(prefix="n8n-lite-body-", delete=False)
+                spill_file.write(buffer)
+                buffer = bytearray()
+            if spill_file is not None:
+                spill_file.write(chunk)
+            else:
+                buffer.extend(chunk)
+    except BaseException:
+        if spill_file is not None:
+            spill_file.close()
+            _remove_file(spill_file.name)
+        raise
+
+    if spill_file is not None:
+        spill_file.close()
+        return StreamedBody(path=spill_file.name, size=size, fmt=fmt, encoding=encoding)
+    return StreamedBody(content=bytes(buffer), size=size, fmt=fmt, encoding=encoding)
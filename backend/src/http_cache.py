@@ -0,0 +1,389 @@
+"""
+HTTP响应缓存
+HTTP节点可选的GET响应缓存：支持TTL、Cache-Control、ETag/Last-Modified重新验证，
+以按字节计量的LRU淘汰，后端可在进程内存与文件目录之间切换（文件后端可供多个worker共享）
+
+缓存在工作流与worker之间共享，按共享缓存的规则处理凭据：凭据请求头参与缓存键，
+Cache-Control: private 的响应不缓存，带凭据的请求只缓存声明了 public 或 s-maxage 的响应
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+DEFAULT_TTL = 60.0
+# 携带用户凭据的请求头
+CREDENTIAL_HEADERS = ("authorization", "cookie")
+
+
+@dataclass
+class CacheEntry:
+    """缓存的HTTP响应"""
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    stored_at: float
+    expires_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    must_revalidate: bool = False
+    vary: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        """按字节计量的条目大小"""
+        return len(self.content) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    @property
+    def fresh(self) -> bool:
+        return not self.must_revalidate and time.time() < self.expires_at
+
+    @property
+    def revalidatable(self) -> bool:
+        return bool(self.etag or self.last_modified)
+
+
+class CacheBackend:
+    """缓存后端接口"""
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    async def set(self, key: str, entry: CacheEntry):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def clear(self):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内LRU缓存，按字节总量与条目数限制容量"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_entries: int = 10000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.total_bytes = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: CacheEntry):
+        if entry.size > self.max_bytes:
+            return
+        await self.delete(key)
+        self._entries[key] = entry
+        self.total_bytes += entry.size
+        while self.total_bytes > self.max_bytes or len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted.size
+            self.evictions += 1
+
+    async def delete(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry.size
+
+    async def clear(self):
+        self._entries.clear()
+        self.total_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    基于目录的缓存，多个worker进程可共享同一目录
+
+    每个条目一个文件：第一行为JSON元数据，其后为响应体原始字节。
+    写入采用临时文件+原子重命名，读取时更新mtime，淘汰时删除mtime最早的文件。
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 256 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self.total_bytes = self._scan_size()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.cache")
+
+    def _scan_size(self) -> int:
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".cache"):
+                total += entry.stat().st_size
+        return total
+
+    async def get(self, key: str) -> Optional[CacheEntry]:
+        return await asyncio.to_thread(self._read, key)
+
+    async def set(self, key: str, entry: CacheEntry):
+        await asyncio.to_thread(self._write, key, entry)
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self._remove, key)
+
+    async def clear(self):
+        await asyncio.to_thread(self._clear)
+
+    def _read(self, key: str) -> Optional[CacheEntry]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                meta = json.loads(f.readline())
+                content = f.read()
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(content=content, **meta)
+
+    def _write(self, key: str, entry: CacheEntry):
+        meta = asdict(entry)
+        meta.pop("content")
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(json.dumps(meta).encode("utf-8") + b"\n")
+                f.write(entry.content)
+            size = os.path.getsize(tmp_path)
+            self._remove(key)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.total_bytes += size
+        if self.total_bytes > self.max_bytes:
+            self._evict()
+
+    def _remove(self, key: str):
+        path = self._path(key)
+        try:
+            size = os.path.getsize(path)
+            os.unlink(path)
+            self.total_bytes -= size
+        except OSError:
+            pass
+
+    def _evict(self):
+        # 其他worker也可能写入，淘汰前重新统计目录中的实际占用
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".cache"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        files.sort()
+        self.total_bytes = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self.total_bytes <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+                self.total_bytes -= size
+                self.evictions += 1
+            except OSError:
+                pass
+
+    def _clear(self):
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".cache"):
+                try:
+                    os.unlink(entry.path)
+                except OSError:
+                    pass
+        self.total_bytes = 0
+
+
+def parse_cache_control(value: str) -> Dict[str, Optional[str]]:
+    """解析Cache-Control头"""
+    directives = {}
+    for part in (value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, arg = part.partition("=")
+        directives[name.strip().lower()] = arg.strip().strip('"') or None
+    return directives
+
+
+class HttpResponseCache:
+    """HTTP节点的响应缓存"""
+
+    def __init__(self, backend: Optional[CacheBackend] = None, default_ttl: float = DEFAULT_TTL):
+        """
+        初始化响应缓存
+
+        Args:
+            backend: 缓存后端，默认使用进程内LRU
+            default_ttl: 响应未声明max-age时的缓存秒数
+        """
+        self.backend = backend or MemoryCacheBackend()
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率统计"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "bytes": getattr(self.backend, "total_bytes", None),
+            "evictions": getattr(self.backend, "evictions", None),
+        }
+
+    @staticmethod
+    def make_key(method: str, url: str, params: Optional[Dict[str, Any]],
+                 headers: Optional[Dict[str, str]], vary: List[str]) -> str:
+        """由 方法+URL+参数+凭据请求头+Vary请求头 计算缓存键（键为摘要，不含凭据原文）"""
+        lowered = {k.lower(): str(v) for k, v in (headers or {}).items()}
+        parts = {
+            "method": method.upper(),
+            "url": url,
+            "params": sorted((str(k), str(v)) for k, v in (params or {}).items()),
+            "credentials": [lowered.get(name, "") for name in CREDENTIAL_HEADERS],
+            "vary": sorted((name.lower(), lowered.get(name.lower(), "")) for name in vary),
+        }
+        return hashlib.sha256(json.dumps(parts, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+    async def fetch(self, client: httpx.AsyncClient, url: str, request_kwargs: Dict[str, Any],
+                    ttl: Optional[float] = None, vary: Optional[List[str]] = None) -> Tuple[CacheEntry, str]:
+        """
+        通过缓存执行GET请求
+
+        Args:
+            client: HTTP客户端
+            url: 请求URL
+            request_kwargs: 传给client.request的参数（headers、params、timeout）
+            ttl: 响应未声明max-age时的缓存秒数，默认使用default_ttl
+            vary: 参与缓存键计算的请求头
+
+        Returns:
+            (缓存条目, 缓存状态: hit / miss / revalidated)
+        """
+        headers = dict(request_kwargs.get("headers") or {})
+        key = self.make_key("GET", url, request_kwargs.get("params"), headers, vary or [])
+        entry = await self.backend.get(key)
+
+        if entry is not None and not self._vary_matches(entry, headers):
+            entry = None
+
+        if entry is not None and entry.fresh:
+            self.hits += 1
+            return entry, "hit"
+
+        # 过期但带有验证器的条目，发起条件请求
+        if entry is not None and entry.revalidatable:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        response = await client.request("GET", url, **{**request_kwargs, "headers": headers})
+
+        if response.status_code == 304 and entry is not None:
+            self.hits += 1
+            self.revalidations += 1
+            refreshed = self._build_entry(response, request_kwargs.get("headers"), ttl, previous=entry)
+            if refreshed is not None:
+                await self.backend.set(key, refreshed)
+                entry = refreshed
+            return entry, "revalidated"
+
+        self.misses += 1
+        new_entry = self._build_entry(response, request_kwargs.get("headers"), ttl)
+        if new_entry is not None:
+            await self.backend.set(key, new_entry)
+        else:
+            await self.backend.delete(key)
+            new_entry = CacheEntry(
+                status_code=response.status_code,
+                headers=dict(response.headers),
+                content=response.content,
+                stored_at=time.time(),
+                expires_at=0,
+            )
+        return new_entry, "miss"
+
+    def _vary_matches(self, entry: CacheEntry, headers: Dict[str, str]) -> bool:
+        lowered = {k.lower(): str(v) for k, v in headers.items()}
+        return all(lowered.get(name, "") == value for name, value in entry.vary.items())
+
+    def _build_entry(self, response: httpx.Response, request_headers: Optional[Dict[str, str]],
+                     ttl: Optional[float], previous: Optional[CacheEntry] = None) -> Optional[CacheEntry]:
+        """根据响应构建缓存条目，不可缓存时返回None"""
+        if previous is None and response.status_code != 200:
+            return None
+
+        directives = parse_cache_control(response.headers.get("cache-control", ""))
+        if "no-store" in directives or "private" in directives:
+            return None
+
+        # 带凭据请求的响应只有显式声明可共享时才缓存
+        lowered = {k.lower(): str(v) for k, v in (request_headers or {}).items()}
+        if any(lowered.get(name) for name in CREDENTIAL_HEADERS):
+            if "public" not in directives and "s-maxage" not in directives:
+                return None
+
+        vary_header = response.headers.get("vary", "")
+        if vary_header.strip() == "*":
+            return None
+
+        # 共享缓存优先使用 s-maxage
+        max_age = directives.get("s-maxage") or directives.get("max-age")
+        if max_age is not None and max_age.isdigit():
+            lifetime = float(max_age)
+        else:
+            lifetime = self.default_ttl if ttl is None else float(ttl)
+
+        now = time.time()
+        vary = {
+            name.strip().lower(): lowered.get(name.strip().lower(), "")
+            for name in vary_header.split(",") if name.strip()
+        }
+
+        if previous is not None:
+            # 304响应只更新元数据，响应体沿用缓存中的内容
+            headers = {**previous.headers}
+            for name, value in response.headers.items():
+                if name.lower() not in ("content-length", "content-encoding", "transfer-encoding"):
+                    headers[name] = value
+            status_code, content = previous.status_code, previous.content
+        else:
+            headers = dict(response.headers)
+            status_code, content = response.status_code, response.content
+
+        return CacheEntry(
+            status_code=status_code,
+            headers=headers,
+            content=content,
+            stored_at=now,
+            expires_at=now + lifetime,
+            etag=response.headers.get("etag") or (previous.etag if previous else None),
+            last_modified=response.headers.get("last-modified") or (previous.last_modified if previous else None),
+            must_revalidate="no-cache" in directives,
+            vary=vary or (previous.vary if previous else {}),
+        )
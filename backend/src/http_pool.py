@@ -0,0 +1,138 @@
+"""
+HTTP连接池
+由引擎持有的共享httpx.AsyncClient，按目标主机复用连接（keep-alive，可选HTTP/2）。
+连接池的生命周期与事件循环绑定：启动时 start()，关闭时 aclose()，期间不能在其他事件循环中使用
+"""
+
+import asyncio
+import logging
+import os
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+logger = logging.getLogger("workflow-engine")
+
+
+@dataclass
+class HttpPoolConfig:
+    """HTTP连接池配置"""
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    timeout: float = 30.0
+    # 自定义传输层（如ASGI或测试用的MockTransport），设置后连接数限制由传输层自行负责
+    transport: Optional[httpx.AsyncBaseTransport] = None
+
+    @classmethod
+    def from_env(cls) -> "HttpPoolConfig":
+        """由环境变量 HTTP_MAX_CONNECTIONS、HTTP_MAX_KEEPALIVE、HTTP_KEEPALIVE_EXPIRY、HTTP2_ENABLED 构建"""
+        return cls(
+            max_connections=int(os.environ.get("HTTP_MAX_CONNECTIONS", 100)),
+            max_keepalive_connections=int(os.environ.get("HTTP_MAX_KEEPALIVE", 20)),
+            keepalive_expiry=float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30)),
+            http2=os.environ.get("HTTP2_ENABLED", "").lower() in ("1", "true"),
+        )
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class HttpClientPool:
+    """按 scheme://host:port 分组的共享AsyncClient池"""
+
+    def __init__(self, config: Optional[HttpPoolConfig] = None):
+        """
+        初始化连接池
+
+        Args:
+            config: 连接池配置，默认使用HttpPoolConfig()
+        """
+        self.config = config or HttpPoolConfig()
+        self._clients: Dict[Tuple[str, str, Optional[int]], httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self._http2 = self.config.http2
+        if self._http2 and not _http2_available():
+            logger.warning("未安装h2，HTTP/2已禁用（pip install httpx[http2]）")
+            self._http2 = False
+
+    async def start(self):
+        """
+        把连接池绑定到当前事件循环（应用启动时调用），此后各主机的客户端都在该循环上创建，直到 aclose()
+
+        Raises:
+            RuntimeError: 连接池已绑定在另一个事件循环上
+        """
+        self._bind(asyncio.get_running_loop())
+
+    def get_client(self, url: str) -> httpx.AsyncClient:
+        """
+        获取目标URL所属主机的共享客户端（未调用 start() 时绑定到当前事件循环）
+
+        Args:
+            url: 请求URL
+
+        Returns:
+            httpx.AsyncClient对象
+
+        Raises:
+            RuntimeError: 连接池已绑定在另一个事件循环上
+        """
+        self._bind(asyncio.get_running_loop())
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname or "", parts.port)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = self._create_client()
+            self._clients[key] = client
+        return client
+
+    def _bind(self, loop: asyncio.AbstractEventLoop):
+        # 连接绑定在创建它的事件循环上，不能在其他循环中使用或关闭
+        if self._loop is None:
+            self._loop = loop
+        elif self._loop is not loop:
+            raise RuntimeError("HTTP连接池已绑定在另一个事件循环上，需在该循环中 aclose() 后才能在新循环中使用")
+
+    def _create_client(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=self.config.max_connections,
+            max_keepalive_connections=self.config.max_keepalive_connections,
+            keepalive_expiry=self.config.keepalive_expiry,
+        )
+        return httpx.AsyncClient(
+            limits=limits,
+            http2=self._http2,
+            timeout=self.config.timeout,
+            transport=self.config.transport,
+        )
+
+    async def aclose(self):
+        """
+        关闭所有客户端及其连接，解除与事件循环的绑定（应用关闭时调用）
+
+        Raises:
+            RuntimeError: 不在连接池绑定的事件循环中调用
+        """
+        if self._loop is None:
+            return
+        self._bind(asyncio.get_running_loop())
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            try:
+                await client.aclose()
+            except Exception as e:
+                logger.warning(f"关闭HTTP客户端失败: {str(e)}")
+        self._loop = None
+
+    def __len__(self) -> int:
+        return len(self._clients)
@@ -0,0 +1,608 @@
+"""
+工作流执行队列
+API进程只负责把执行写入持久化任务队列（队列满时拒绝，由API返回429），
+独立的worker进程（见 worker.py）租用任务并执行。租约带可见性超时：
+worker崩溃后租约到期，任务重新可见并由其他worker重试。
+默认队列基于SQLAlchemy（SQLite），MemoryJobQueue 为进程内的本地替身
+"""
+
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, Integer, String, Table, Text, delete, func, select, text, update
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from .storage import ExecutionRecord, ExecutionStore, SqlStoreBase, metadata
+
+logger = logging.getLogger("workflow-engine")
+
+WORKFLOW_EXECUTION_KIND = "workflow"
+FINISHED_STATUSES = ("success", "error")
+# PostgreSQL上串行化有上限的入队的事务级advisory锁
+ENQUEUE_LOCK_KEY = 0x6E386E6C
+
+job_queue_table = Table(
+    "job_queue", metadata,
+    Column("id", String(64), primary_key=True),
+    Column("payload", Text, nullable=False),
+    # 任务可被租用的时间：排队中为可执行时间，租用中为租约到期时间
+    Column("visible_at", Float, nullable=False, index=True),
+    Column("lease_token", String(64), nullable=True),
+    Column("leased_by", String(128), nullable=True),
+    Column("attempts", Integer, nullable=False, default=0),
+    Column("max_attempts", Integer, nullable=False),
+    Column("enqueued_at", Float, nullable=False),
+)
+
+
+class QueueFullError(Exception):
+    """执行队列已满"""
+
+
+class ExecutionStateError(Exception):
+    """执行当前的状态不允许该操作（如恢复仍在运行的执行）"""
+
+
+@dataclass
+class QueuedJob:
+    """队列中的任务；lease_token 不为空表示当前被某个worker租用"""
+    payload: Dict[str, Any]
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    visible_at: float = field(default_factory=time.time)
+    lease_token: Optional[str] = None
+    leased_by: Optional[str] = None
+    attempts: int = 0
+    max_attempts: int = 3
+    enqueued_at: float = field(default_factory=time.time)
+
+    @property
+    def exhausted(self) -> bool:
+        """租用次数已超过上限（此前的worker均未完成）"""
+        return self.attempts > self.max_attempts
+
+
+class JobQueue:
+    """持久化任务队列接口"""
+
+    async def enqueue(self, job: QueuedJob, max_depth: Optional[int] = None) -> QueuedJob:
+        """
+        入队；指定 max_depth 时排队数的检查与写入是原子的
+
+        Raises:
+            QueueFullError: 入队后排队数会超过 max_depth，任务未写入
+        """
+        raise NotImplementedError
+
+    async def enqueue_many(self, jobs: List[QueuedJob], max_depth: Optional[int] = None):
+        """批量入队（默认实现逐个入队，指定 max_depth 时可能只写入一部分，子类应整批原子地写入）"""
+        for job in jobs:
+            await self.enqueue(job, max_depth)
+
+    async def lease(self, worker_id: str, visibility_timeout: float) -> Optional[QueuedJob]:
+        """租用一个可见的任务，租约期间对其他worker不可见"""
+        raise NotImplementedError
+
+    async def extend(self, job: QueuedJob, visibility_timeout: float) -> bool:
+        """续租；租约已过期并被他人租用时返回False"""
+        raise NotImplementedError
+
+    async def ack(self, job: QueuedJob) -> bool:
+        """任务完成，从队列删除"""
+        raise NotImplementedError
+
+    async def release(self, job: QueuedJob, delay: float = 0) -> bool:
+        """放弃租约，任务在delay秒后重新可见"""
+        raise NotImplementedError
+
+    async def reschedule(self, job: QueuedJob, visible_at: float, payload: Dict[str, Any]) -> bool:
+        """
+        放弃租约并把任务推迟到 visible_at 再次可见（挂起的执行），同时更新任务数据；
+        挂起不算作失败，租用次数清零
+        """
+        raise NotImplementedError
+
+    async def depth(self) -> int:
+        """已可执行、等待worker租用的任务数（不含推迟到未来的任务）"""
+        raise NotImplementedError
+
+    async def stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class MemoryJobQueue(JobQueue):
+    """
+    进程内的本地替身，语义与持久化队列相同，用于测试与单进程开发
+
+    任务按 visible_at 放入最小堆，租用时只查看堆顶，大量挂起等待的任务不影响租用开销；
+    续租/释放时压入新的堆项，旧的堆项在弹出时按 visible_at 不一致识别并丢弃
+    """
+
+    def __init__(self):
+        self._jobs: Dict[str, QueuedJob] = {}
+        self._heap: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def _push(self, job: QueuedJob):
+        heapq.heappush(self._heap, (job.visible_at, next(self._sequence), job.id))
+
+    async def enqueue(self, job: QueuedJob, max_depth: Optional[int] = None) -> QueuedJob:
+        await self.enqueue_many([job], max_depth)
+        return job
+
+    async def enqueue_many(self, jobs: List[QueuedJob], max_depth: Optional[int] = None):
+        with self._lock:
+            if max_depth is not None and self._depth(time.time()) + len(jobs) > max_depth:
+                raise QueueFullError(f"执行队列已满（{max_depth}）")
+            for job in jobs:
+                self._jobs[job.id] = job
+                self._push(job)
+
+    async def lease(self, worker_id: str, visibility_timeout: float) -> Optional[QueuedJob]:
+        now = time.time()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                visible_at, _, job_id = heapq.heappop(self._heap)
+                job = self._jobs.get(job_id)
+                if job is None or job.visible_at != visible_at:
+                    continue
+                job.lease_token = str(uuid.uuid4())
+                job.leased_by = worker_id
+                job.visible_at = now + visibility_timeout
+                job.attempts += 1
+                self._push(job)
+                return QueuedJob(**vars(job))
+            return None
+
+    def _leased(self, job: QueuedJob) -> Optional[QueuedJob]:
+        current = self._jobs.get(job.id)
+        if current is None or current.lease_token != job.lease_token:
+            return None
+        return current
+
+    async def extend(self, job: QueuedJob, visibility_timeout: float) -> bool:
+        with self._lock:
+            current = self._leased(job)
+            if current is None:
+                return False
+            current.visible_at = job.visible_at = time.time() + visibility_timeout
+            self._push(current)
+            return True
+
+    async def ack(self, job: QueuedJob) -> bool:
+        with self._lock:
+            if self._leased(job) is None:
+                return False
+            del self._jobs[job.id]
+            return True
+
+    async def release(self, job: QueuedJob, delay: float = 0) -> bool:
+        with self._lock:
+            current = self._leased(job)
+            if current is None:
+                return False
+            current.lease_token = current.leased_by = None
+            current.visible_at = time.time() + delay
+            self._push(current)
+            return True
+
+    async def reschedule(self, job: QueuedJob, visible_at: float, payload: Dict[str, Any]) -> bool:
+        with self._lock:
+            current = self._leased(job)
+            if current is None:
+                return False
+            current.lease_token = current.leased_by = None
+            current.visible_at = visible_at
+            current.payload = payload
+            current.attempts = 0
+            self._push(current)
+            return True
+
+    async def depth(self) -> int:
+        with self._lock:
+            return self._depth(time.time())
+
+    def _depth(self, now: float) -> int:
+        return sum(1 for job in self._jobs.values() if job.lease_token is None and job.visible_at <= now)
+
+    async def stats(self) -> Dict[str, int]:
+        now = time.time()
+        with self._lock:
+            leased = sum(1 for job in self._jobs.values() if job.lease_token is not None and job.visible_at > now)
+            delayed = sum(1 for job in self._jobs.values() if job.lease_token is None and job.visible_at > now)
+            return {"queued": len(self._jobs) - leased - delayed, "leased": leased, "delayed": delayed}
+
+
+class SqlJobQueue(SqlStoreBase, JobQueue):
+    """
+    基于SQLAlchemy的持久化任务队列，可被多个进程/机器上的worker共享
+
+    租用通过比较并交换（按原 visible_at 与 attempts 条件更新）实现，
+    多个worker同时竞争同一任务时只有一个更新成功，任务不会被重复租用。
+    PostgreSQL上选取候选任务时使用 FOR UPDATE SKIP LOCKED，并发的worker各自跳到不同的任务，
+    减少比较并交换失败的次数；SQLite不支持行锁（该子句被忽略），正确性完全依赖比较并交换
+    """
+
+    async def enqueue(self, job: QueuedJob, max_depth: Optional[int] = None) -> QueuedJob:
+        await asyncio.to_thread(self._write, self._insert_many, [job], max_depth)
+        return job
+
+    async def enqueue_many(self, jobs: List[QueuedJob], max_depth: Optional[int] = None):
+        if jobs:
+            await asyncio.to_thread(self._write, self._insert_many, jobs, max_depth)
+
+    async def lease(self, worker_id: str, visibility_timeout: float) -> Optional[QueuedJob]:
+        try:
+            return await asyncio.to_thread(self._write, self._lease, worker_id, visibility_timeout)
+        except OperationalError as e:
+            # 其他进程持有写锁：视为本轮没有租到任务，稍后再试
+            logger.debug(f"租用任务失败: {str(e)}")
+            return None
+
+    async def extend(self, job: QueuedJob, visibility_timeout: float) -> bool:
+        visible_at = time.time() + visibility_timeout
+        updated = await asyncio.to_thread(self._write, self._update_leased, job, {"visible_at": visible_at})
+        if updated:
+            job.visible_at = visible_at
+        return updated
+
+    async def ack(self, job: QueuedJob) -> bool:
+        return await asyncio.to_thread(self._write, self._delete_leased, job)
+
+    async def release(self, job: QueuedJob, delay: float = 0) -> bool:
+        values = {"visible_at": time.time() + delay, "lease_token": None, "leased_by": None}
+        return await asyncio.to_thread(self._write, self._update_leased, job, values)
+
+    async def reschedule(self, job: QueuedJob, visible_at: float, payload: Dict[str, Any]) -> bool:
+        values = {
+            "visible_at": visible_at,
+            "lease_token": None,
+            "leased_by": None,
+            "attempts": 0,
+            "payload": json.dumps(payload, ensure_ascii=False, separators=(",", ":"), default=str),
+        }
+        return await asyncio.to_thread(self._write, self._update_leased, job, values)
+
+    async def depth(self) -> int:
+        return await asyncio.to_thread(self._read, self._count_depth)
+
+    @staticmethod
+    def _count_depth(conn) -> int:
+        table = job_queue_table
+        # visible_at 有索引，只统计已到期的任务
+        query = select(func.count()).select_from(table).where(
+            table.c.visible_at <= time.time(), table.c.lease_token.is_(None)
+        )
+        return conn.execute(query).scalar_one()
+
+    async def stats(self) -> Dict[str, int]:
+        table = job_queue_table
+        now = time.time()
+        query = select(
+            func.count(),
+            func.count().filter((table.c.lease_token.isnot(None)) & (table.c.visible_at > now)),
+            func.count().filter((table.c.lease_token.is_(None)) & (table.c.visible_at > now)),
+        ).select_from(table)
+        total, leased, delayed = await asyncio.to_thread(self._read, lambda conn: conn.execute(query).one())
+        return {"queued": total - leased - delayed, "leased": leased, "delayed": delayed}
+
+    @staticmethod
+    def _to_row(job: QueuedJob) -> Dict[str, Any]:
+        row = dict(vars(job))
+        row["payload"] = json.dumps(job.payload, ensure_ascii=False, separators=(",", ":"), default=str)
+        return row
+
+    def _insert_many(self, conn, jobs: List[QueuedJob], max_depth: Optional[int] = None):
+        if max_depth is not None and conn.dialect.name == "postgresql":
+            # 有上限的入队之间互斥（事务结束时释放）；租用只会减少排队数，不需要互斥
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ENQUEUE_LOCK_KEY})
+        # 先写入再计数：SQLite的写事务独占写锁，计数包含所有已提交的任务与本次写入
+        conn.execute(job_queue_table.insert(), [self._to_row(job) for job in jobs])
+        if max_depth is not None and self._count_depth(conn) > max_depth:
+            # 抛出异常使事务回滚，本次写入作废
+            raise QueueFullError(f"执行队列已满（{max_depth}）")
+
+    @staticmethod
+    def _lease(conn, worker_id: str, visibility_timeout: float) -> Optional[QueuedJob]:
+        table = job_queue_table
+        now = time.time()
+        # SKIP LOCKED 只是减少竞争的优化（SQLite上无效）；防止重复租用的是下面的条件更新
+        row = conn.execute(
+            select(table).where(table.c.visible_at <= now).order_by(table.c.visible_at).limit(1)
+            .with_for_update(skip_locked=True)
+        ).first()
+        if row is None:
+            return None
+        job = QueuedJob(**{**row._asdict(), "payload": json.loads(row.payload)})
+        values = {
+            "lease_token": str(uuid.uuid4()),
+            "leased_by": worker_id,
+            "visible_at": now + visibility_timeout,
+            "attempts": job.attempts + 1,
+        }
+        result = conn.execute(
+            update(table)
+            .where(table.c.id == job.id, table.c.visible_at == job.visible_at, table.c.attempts == job.attempts)
+            .values(**values)
+        )
+        if result.rowcount != 1:
+            return None
+        for name, value in values.items():
+            setattr(job, name, value)
+        return job
+
+    @staticmethod
+    def _update_leased(conn, job: QueuedJob, values: Dict[str, Any]) -> bool:
+        table = job_queue_table
+        result = conn.execute(
+            update(table).where(table.c.id == job.id, table.c.lease_token == job.lease_token).values(**values)
+        )
+        return result.rowcount == 1
+
+    @staticmethod
+    def _delete_leased(conn, job: QueuedJob) -> bool:
+        table = job_queue_table
+        result = conn.execute(delete(table).where(table.c.id == job.id, table.c.lease_token == job.lease_token))
+        return result.rowcount == 1
+
+
+class LatencyStats:
+    """保留最近若干个样本的耗时统计"""
+
+    def __init__(self, window: int = 1000):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, value: float):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def summary(self) -> Dict[str, Optional[float]]:
+        """总次数、总平均值，以及最近窗口内的p50/p95/最大值（秒）"""
+        ordered = sorted(self.samples)
+
+        def percentile(p: float) -> Optional[float]:
+            if not ordered:
+                return None
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "avg": self.total / self.count if self.count else None,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "max": ordered[-1] if ordered else None,
+        }
+
+
+class ExecutionQueue:
+    """API侧的执行入口：创建执行记录并写入任务队列，不在本进程执行"""
+
+    def __init__(self, jobs: JobQueue, store: ExecutionStore, max_size: int = 1000, max_attempts: int = 3):
+        """
+        Args:
+            jobs: 任务队列
+            store: 执行记录存储
+            max_size: 排队上限，排队数达到该值时拒绝新的执行
+            max_attempts: worker崩溃等原因导致租约过期时的最大执行次数
+        """
+        self.jobs = jobs
+        self.store = store
+        self.max_size = max_size
+        self.max_attempts = max_attempts
+        self.submitted = 0
+        self.rejected = 0
+
+    async def submit(self, workflow_id: Optional[int], workflow: Dict[str, Any],
+                     input_data: Optional[Dict[str, Any]] = None, wait: bool = False,
+                     timeout: float = 30.0, execution_id: Optional[str] = None) -> ExecutionRecord:
+        """
+        提交一次执行
+
+        Args:
+            workflow_id: 工作流id
+            workflow: 工作流定义（nodes、connections等）
+            input_data: 初始输入数据
+            wait: 是否等待执行完成（同步模式）
+            timeout: 同步模式的最长等待时间（秒），超时返回当前状态
+            execution_id: 指定执行id，该执行已存在时不再重复提交（幂等提交）
+
+        Returns:
+            执行记录；同步模式下为执行完成后的记录
+
+        Raises:
+            QueueFullError: 队列已满
+            ExecutionStateError: 指定的执行id已被其他类型的记录（如自动化任务）使用
+        """
+        if execution_id is not None:
+            existing = await self.store.get(execution_id)
+            if existing is not None and existing.kind != WORKFLOW_EXECUTION_KIND:
+                raise ExecutionStateError(f"id {execution_id} 已被其他类型的记录使用")
+            if existing is not None:
+                if wait:
+                    return await self.wait(execution_id, timeout) or existing
+                return existing
+        # 明显已满时直接拒绝，不写入执行记录；并发提交由入队时的原子检查保证不超过上限
+        if await self.jobs.depth() >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(f"执行队列已满（{self.max_size}）")
+
+        record = ExecutionRecord(
+            kind=WORKFLOW_EXECUTION_KIND,
+            status="queued",
+            workflow_id=workflow_id,
+            data={"queued_at": time.time(), "input_data": input_data},
+        )
+        if execution_id is not None:
+            record.id = execution_id
+        try:
+            await self._enqueue(record, workflow, input_data)
+        except QueueFullError:
+            await self._reject([record])
+            raise
+        self.submitted += 1
+
+        if wait:
+            return await self.wait(record.id, timeout) or record
+        return record
+
+    async def submit_many(self, submissions: List[Tuple[Optional[int], Dict[str, Any], Optional[Dict[str, Any]], str]]
+                          ) -> List[ExecutionRecord]:
+        """
+        批量提交执行（定时触发等批量场景），执行记录与任务各在一个事务中写入
+
+        Args:
+            submissions: [(工作流id, 工作流定义, 输入数据, 执行id)]，执行id由调用方保证唯一
+
+        Returns:
+            执行记录列表
+
+        Raises:
+            QueueFullError: 排队数加上本批数量超过上限，整批都不执行
+        """
+        if not submissions:
+            return []
+        if await self.jobs.depth() + len(submissions) > self.max_size:
+            self.rejected += len(submissions)
+            raise QueueFullError(f"执行队列已满（{self.max_size}）")
+
+        now = time.time()
+        records = [
+            ExecutionRecord(
+                id=execution_id, kind=WORKFLOW_EXECUTION_KIND, status="queued", workflow_id=workflow_id,
+                data={"queued_at": now, "input_data": input_data},
+            )
+            for workflow_id, _, input_data, execution_id in submissions
+        ]
+        await self.store.save_many(records)
+        await self.store.flush()
+        try:
+            await self.jobs.enqueue_many([
+                QueuedJob(
+                    id=record.id,
+                    payload={"workflow_id": record.workflow_id, "workflow": workflow, "input_data": input_data},
+                    max_attempts=self.max_attempts,
+                )
+                for record, (_, workflow, input_data, _) in zip(records, submissions)
+            ], max_depth=self.max_size)
+        except QueueFullError:
+            await self._reject(records)
+            raise
+        self.submitted += len(records)
+        return records
+
+    async def resume(self, execution_id: str, workflow: Dict[str, Any]) -> Optional[ExecutionRecord]:
+        """
+        重新执行已结束（失败或被中断放弃）的执行，沿用原执行id与输入，
+        worker会从检查点恢复已成功的节点，只执行其余节点
+
+        Args:
+            execution_id: 执行id
+            workflow: 工作流定义，与原执行不一致时所有节点重新执行
+
+        Returns:
+            重新入队的执行记录，执行不存在时返回None
+
+        Raises:
+            ExecutionStateError: 执行尚未结束
+            QueueFullError: 队列已满
+        """
+        record = await self.get(execution_id)
+        if record is None:
+            return None
+        if record.status not in FINISHED_STATUSES:
+            raise ExecutionStateError(f"执行 {execution_id} 尚未结束（{record.status}）")
+        if await self.jobs.depth() >= self.max_size:
+            self.rejected += 1
+            raise QueueFullError(f"执行队列已满（{self.max_size}）")
+
+        input_data = record.data.get("input_data")
+        previous = record.status, record.data
+        record.status = "queued"
+        record.data = {
+            "queued_at": time.time(),
+            "input_data": input_data,
+            "resumed": record.data.get("resumed", 0) + 1,
+        }
+        try:
+            await self._enqueue(record, workflow, input_data)
+        except QueueFullError:
+            # 并发提交抢先占满队列：恢复原来的结束状态
+            self.rejected += 1
+            record.status, record.data = previous
+            await self.store.save(record)
+            raise
+        self.submitted += 1
+        return record
+
+    async def _enqueue(self, record: ExecutionRecord, workflow: Dict[str, Any],
+                       input_data: Optional[Dict[str, Any]]):
+        # 先落盘执行记录再入队，避免worker的状态更新被缓冲中的queued状态覆盖
+        await self.store.save(record)
+        await self.store.flush()
+        await self.jobs.enqueue(QueuedJob(
+            id=record.id,
+            payload={"workflow_id": record.workflow_id, "workflow": workflow, "input_data": input_data},
+            max_attempts=self.max_attempts,
+        ), max_depth=self.max_size)
+
+    async def _reject(self, records: List[ExecutionRecord]):
+        """执行记录已写入但入队时队列已满（并发提交抢先占满）：记为被拒绝的执行"""
+        self.rejected += len(records)
+        now = time.time()
+        for record in records:
+            record.status = "error"
+            record.data["message"] = f"执行队列已满（{self.max_size}），未执行"
+            record.data["finished_at"] = now
+        await self.store.save_many(records)
+
+    async def wait(self, execution_id: str, timeout: float) -> Optional[ExecutionRecord]:
+        """轮询执行记录直到完成或超时"""
+        deadline = time.monotonic() + timeout
+        interval = 0.01
+        while True:
+            record = await self.get(execution_id)
+            if record is None or record.status in FINISHED_STATUSES or time.monotonic() >= deadline:
+                return record
+            await asyncio.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+            interval = min(interval * 2, 0.5)
+
+    async def get(self, execution_id: str) -> Optional[ExecutionRecord]:
+        """查询工作流执行记录（同一存储中的自动化任务等其他类型的记录不可见）"""
+        return await self.store.get(execution_id, kind=WORKFLOW_EXECUTION_KIND)
+
+    async def metrics(self, sample_size: int = 500) -> Dict[str, Any]:
+        """队列深度、租用中的任务数，以及最近完成的执行的排队耗时与运行耗时（秒）"""
+        wait_time, run_time = LatencyStats(sample_size), LatencyStats(sample_size)
+        for record in await self.store.list(kind=WORKFLOW_EXECUTION_KIND, limit=sample_size):
+            if record.status in FINISHED_STATUSES and "run_time" in record.data:
+                wait_time.add(record.data["wait_time"])
+                run_time.add(record.data["run_time"])
+        return {
+            **await self.jobs.stats(),
+            "max_size": self.max_size,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "wait_time": wait_time.summary(),
+            "run_time": run_time.summary(),
+        }
+
+
+def create_job_queue(engine: Optional[Engine]) -> JobQueue:
+    """在存储所用的数据库上创建任务队列；没有SQL引擎时使用进程内队列"""
+    if engine is None:
+        return MemoryJobQueue()
+    metadata.create_all(engine, tables=[job_queue_table])
+    return SqlJobQueue(engine)
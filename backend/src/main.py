@@ -1,14 +1,38 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+import asyncio
+import logging
 import os
 import json
+import time
 
 # 导入Browserbase API路由
-from .browserbase_api import router as browserbase_router
+from .browserbase_api import browser_pool_stats, close_browser_pools, router as browserbase_router
+from .engine import WorkflowEngine
+from .ai_cache import AIResponseCache
+from .ai_providers import AIConfig
+from .http_pool import HttpPoolConfig
+from .resilience import CircuitBreakerRegistry
+from .checkpoints import create_checkpoint_store
+from .execution_context import ExecutionContext
+from .execution_streams import ExecutionStreamBroker, sse_message
+from .job_queue import (
+    FINISHED_STATUSES, WORKFLOW_EXECUTION_KIND, ExecutionQueue, ExecutionStateError, QueueFullError, create_job_queue,
+)
+from .scheduler import Trigger, TriggerError, WorkflowScheduler, create_schedule_store
+from .storage import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, ExecutionRecord, get_storage
+from .webhooks import (
+    DEFAULT_MAX_BODY_SIZE, WEBHOOK_TRIGGER_TYPE, WebhookEndpoint, WebhookError, WebhookIngestor, WebhookRoute,
+    WebhookRouter,
+)
+from .worker import ExecutionWorker
+
+logger = logging.getLogger("workflow-engine")
 
 # 创建FastAPI实例
 app = FastAPI(
@@ -29,8 +53,81 @@ app.add_middleware(
 # 包含Browserbase API路由
 app.include_router(browserbase_router)
 
+# 持久化存储（工作流与执行记录），由 DATABASE_URL 等环境变量配置
+storage = get_storage()
+
+# 全局工作流引擎（常驻，跨请求复用执行计划缓存与HTTP连接池）
+engine = WorkflowEngine(
+    http_config=HttpPoolConfig.from_env(),
+    suspend_threshold=float(os.environ.get("DELAY_SUSPEND_THRESHOLD", 60)),
+    circuit_breakers=CircuitBreakerRegistry.from_env(),
+    ai_config=AIConfig.from_env(),
+    ai_cache=AIResponseCache.from_env(storage.engine),
+)
+
+# 工作流执行队列：API进程只负责入队，最多排队 EXECUTION_QUEUE_SIZE 个执行，
+# 由API进程内的执行协程或独立的worker进程（run_worker.py）执行
+execution_queue = ExecutionQueue(
+    create_job_queue(storage.engine),
+    storage.executions,
+    max_size=int(os.environ.get("EXECUTION_QUEUE_SIZE", 1000)),
+    max_attempts=int(os.environ.get("EXECUTION_MAX_ATTEMPTS", 3)),
+)
+
+# 本进程内执行的事件流（流式节点的片段、节点完成与执行结束），通过 /executions/{id}/stream 订阅
+execution_streams = ExecutionStreamBroker()
+
+# 流式执行接口在API进程内直接执行工作流（不经过队列），最多同时 STREAM_EXECUTIONS 个
+stream_slots = asyncio.Semaphore(int(os.environ.get("STREAM_EXECUTIONS", 100)))
+# 进行中的流式执行任务：保留引用，避免运行中被垃圾回收，关闭时等待其完成
+streamed_executions: Set[asyncio.Task] = set()
+
+# API进程内的 EMBEDDED_WORKERS 个执行协程（默认1，单进程部署即可执行入队的工作流）；
+# 由独立的worker进程执行时设为0
+embedded_workers = int(os.environ.get("EMBEDDED_WORKERS", 1))
+embedded_worker = None
+if embedded_workers > 0:
+    embedded_worker = ExecutionWorker(
+        engine, execution_queue.jobs, storage.executions, concurrency=embedded_workers,
+        checkpoints=create_checkpoint_store(storage.engine), streams=execution_streams,
+    )
+
+# 定时触发调度器：按工作流的 cron / interval 触发器提交执行（SCHEDULER_ENABLED=0 时关闭，
+# 多个API实例部署时建议只在一个实例中开启）
+scheduler = WorkflowScheduler(execution_queue, storage.workflows, create_schedule_store(storage.engine))
+
+# Webhook触发：/webhook/{path} 挂载为独立的ASGI应用（不需要登录，不出现在OpenAPI文档中）
+webhook_router = WebhookRouter()
+webhook_ingestor = WebhookIngestor(execution_queue)
+app.mount("/webhook", WebhookEndpoint(
+    webhook_router, webhook_ingestor,
+    max_body_size=int(os.environ.get("WEBHOOK_MAX_BODY_SIZE", DEFAULT_MAX_BODY_SIZE)),
+))
+
+@app.on_event("startup")
+async def start_storage():
+    await engine.start()
+    storage.executions.start_retention(float(os.environ.get("RETENTION_SWEEP_INTERVAL", 300)))
+    if embedded_worker is not None:
+        embedded_worker.start()
+    else:
+        logger.warning("EMBEDDED_WORKERS=0：API进程不执行工作流，提交的执行需由 run_worker.py 执行")
+    if os.environ.get("SCHEDULER_ENABLED", "1") != "0":
+        await scheduler.start()
+    await webhook_router.load(storage.workflows)
+
+@app.on_event("shutdown")
+async def shutdown_engine():
+    await scheduler.stop()
+    await webhook_ingestor.flush()
+    if embedded_worker is not None:
+        await embedded_worker.stop()
+    await asyncio.gather(*streamed_executions, return_exceptions=True)
+    await engine.aclose()
+    await close_browser_pools()
+    await storage.close()
+
 # 模拟数据库
-workflows_db = []
 users_db = [
     {
         "id": 1,
@@ -63,10 +160,12 @@ class WorkflowBase(BaseModel):
     name: str
     description: Optional[str] = None
     active: bool = True
+    max_concurrency: Optional[int] = None  # 单次执行中并发运行的节点数上限
 
 class WorkflowCreate(WorkflowBase):
     nodes: List[dict] = []
     connections: List[dict] = []
+    triggers: List[dict] = []  # 定时触发器，如 {"type": "cron", "expression": "0 * * * *"}
 
 class Workflow(WorkflowBase):
     id: int
@@ -75,6 +174,7 @@ class Workflow(WorkflowBase):
     owner_id: int
     nodes: List[dict] = []
     connections: List[dict] = []
+    triggers: List[dict] = []
 
 # OAuth2 设置
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -128,28 +228,61 @@ async def root():
     return {"message": "欢迎使用N8N Lite API！"}
 
 @app.get("/workflows", response_model=List[Workflow])
-async def list_workflows(current_user: User = Depends(get_current_active_user)):
-    return workflows_db
+async def list_workflows(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    after_id: Optional[int] = Query(None, description="游标分页：返回id大于该值的工作流"),
+    current_user: User = Depends(get_current_active_user),
+):
+    # 总数通过响应头返回，响应体保持为工作流列表
+    response.headers["X-Total-Count"] = str(await storage.workflows.count())
+    return await storage.workflows.list(limit=limit, offset=offset, after_id=after_id)
+
+def validate_triggers(workflow_id: Optional[int], workflow: WorkflowCreate):
+    for config in workflow.triggers:
+        try:
+            if config.get("type") == WEBHOOK_TRIGGER_TYPE:
+                WebhookRoute.from_config(workflow_id, {}, config)
+            else:
+                Trigger.from_config(config)
+        except (TriggerError, WebhookError, TypeError, ValueError) as e:
+            raise HTTPException(status_code=400, detail=f"触发器无效: {str(e)}")
+    conflicts = webhook_router.conflicts({"id": workflow_id, **workflow.dict()})
+    if conflicts:
+        raise HTTPException(status_code=409, detail=f"webhook路径已被其他工作流使用: {', '.join(conflicts)}")
+
+async def sync_triggers(workflow: dict):
+    webhook_router.sync_workflow(workflow)
+    if scheduler.running:
+        await scheduler.sync_workflow(workflow)
 
 @app.post("/workflows", response_model=Workflow)
 async def create_workflow(workflow: WorkflowCreate, current_user: User = Depends(get_current_active_user)):
+    validate_triggers(None, workflow)
     now = datetime.now()
     new_workflow = {
-        "id": len(workflows_db) + 1,
         "created_at": now,
         "updated_at": now,
         "owner_id": 1,  # 假设用户ID为1
         **workflow.dict()
     }
-    workflows_db.append(new_workflow)
-    return new_workflow
+    created = await storage.workflows.create(new_workflow)
+    await sync_triggers(created)
+    return created
 
 @app.get("/workflows/{workflow_id}", response_model=Workflow)
 async def get_workflow(workflow_id: int, current_user: User = Depends(get_current_active_user)):
-    for workflow in workflows_db:
-        if workflow["id"] == workflow_id:
-            return workflow
-    raise HTTPException(status_code=404, detail="工作流未找到")
+    workflow = await storage.workflows.get(workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流未找到")
+    return workflow
+
+@app.get("/workflows/{workflow_id}/ai-cache")
+async def get_workflow_ai_cache_stats(workflow_id: int, current_user: User = Depends(get_current_active_user)):
+    """工作流AI节点的缓存命中率与节省的token数（所有worker累计）"""
+    stats = await engine.ai_cache.workflow_stats(workflow_id)
+    return stats.get(str(workflow_id)) or {"hits": 0, "misses": 0, "tokens_saved": 0, "hit_ratio": 0.0}
 
 @app.put("/workflows/{workflow_id}", response_model=Workflow)
 async def update_workflow(
@@ -157,31 +290,179 @@ async def update_workflow(
     workflow_update: WorkflowCreate, 
     current_user: User = Depends(get_current_active_user)
 ):
-    for i, workflow in enumerate(workflows_db):
-        if workflow["id"] == workflow_id:
-            workflows_db[i] = {
-                **workflow,
-                **workflow_update.dict(),
-                "updated_at": datetime.now()
-            }
-            return workflows_db[i]
-    raise HTTPException(status_code=404, detail="工作流未找到")
+    validate_triggers(workflow_id, workflow_update)
+    workflow = await storage.workflows.update(workflow_id, workflow_update.dict())
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流未找到")
+    await sync_triggers(workflow)
+    return workflow
 
 @app.delete("/workflows/{workflow_id}")
 async def delete_workflow(workflow_id: int, current_user: User = Depends(get_current_active_user)):
-    for i, workflow in enumerate(workflows_db):
-        if workflow["id"] == workflow_id:
-            del workflows_db[i]
-            return {"detail": "工作流已删除"}
-    raise HTTPException(status_code=404, detail="工作流未找到")
-
-@app.post("/workflows/{workflow_id}/execute")
-async def execute_workflow(workflow_id: int, current_user: User = Depends(get_current_active_user)):
-    for workflow in workflows_db:
-        if workflow["id"] == workflow_id:
-            # 这里应该实际执行工作流逻辑
-            return {"status": "success", "message": f"工作流 {workflow['name']} 执行成功"}
-    raise HTTPException(status_code=404, detail="工作流未找到")
+    if not await storage.workflows.delete(workflow_id):
+        raise HTTPException(status_code=404, detail="工作流未找到")
+    webhook_router.remove_workflow(workflow_id)
+    await scheduler.remove_workflow(workflow_id)
+    return {"detail": "工作流已删除"}
+
+@app.post("/workflows/{workflow_id}/execute", status_code=status.HTTP_202_ACCEPTED)
+async def execute_workflow(
+    workflow_id: int,
+    response: Response,
+    input_data: Optional[Dict[str, Any]] = Body(None),
+    wait: bool = Query(False, description="同步模式：等待执行完成后返回结果"),
+    current_user: User = Depends(get_current_active_user),
+):
+    workflow = await storage.workflows.get(workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流未找到")
+    
+    try:
+        record = await execution_queue.submit(
+            workflow_id, workflow, input_data, wait=wait,
+            timeout=float(os.environ.get("EXECUTE_WAIT_TIMEOUT", 30)),
+        )
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="执行队列已满，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
+    
+    if wait and record.status in FINISHED_STATUSES:
+        response.status_code = status.HTTP_200_OK
+        return {"execution_id": record.id, "status": record.status, **record.data}
+    return {"execution_id": record.id, "status": record.status}
+
+@app.post("/workflows/{workflow_id}/execute/stream")
+async def execute_workflow_stream(
+    workflow_id: int,
+    input_data: Optional[Dict[str, Any]] = Body(None),
+    current_user: User = Depends(get_current_active_user),
+):
+    """
+    在API进程内立即执行工作流，以服务端事件流（text/event-stream）返回执行事件：
+    partial（流式AI节点的输出片段）、node（节点完成）、done（执行结束）。
+    客户端断开后执行继续，结果仍写入执行记录
+    """
+    workflow = await storage.workflows.get(workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流未找到")
+    if stream_slots.locked():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="流式执行数已达上限，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
+    await stream_slots.acquire()
+    context = ExecutionContext()
+    stream = execution_streams.attach(context)
+    task = asyncio.ensure_future(run_streamed_execution(workflow, input_data, context))
+    streamed_executions.add(task)
+    task.add_done_callback(streamed_execution_done)
+    return StreamingResponse(
+        sse_stream(stream.subscribe()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Execution-Id": context.execution_id},
+    )
+
+async def run_streamed_execution(workflow: Dict[str, Any], input_data: Optional[Dict[str, Any]], context: ExecutionContext):
+    record = ExecutionRecord(
+        id=context.execution_id, kind=WORKFLOW_EXECUTION_KIND, status="running", workflow_id=workflow["id"],
+        data={"queued_at": time.time(), "started_at": time.time(), "wait_time": 0.0, "streamed": True},
+    )
+    try:
+        await storage.executions.save(record)
+        result = await engine.execute_workflow(workflow, input_data, context=context)
+        record.status = result.get("status", "error")
+        if record.status == "success":
+            record.data["results"] = result.get("results")
+        else:
+            record.data["message"] = result.get("message")
+    except Exception as e:
+        record.status = "error"
+        record.data["message"] = str(e)
+    finally:
+        stream_slots.release()
+    execution_streams.close(record.id, record.status, results=record.data.get("results"), message=record.data.get("message"))
+    record.data["finished_at"] = time.time()
+    record.data["run_time"] = record.data["finished_at"] - record.data["started_at"]
+    await storage.executions.save(record)
+
+def streamed_execution_done(task: asyncio.Future):
+    streamed_executions.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"流式执行失败: {str(task.exception())}")
+
+async def sse_stream(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[str]:
+    async for event in events:
+        yield sse_message(event)
+
+async def wait_remote_execution(record: ExecutionRecord) -> AsyncIterator[Dict[str, Any]]:
+    """在其他进程执行的工作流：没有片段级事件，状态变化时推送 status，完成后推送 done"""
+    last_status = None
+    while True:
+        if record.status != last_status:
+            last_status = record.status
+            if record.status in FINISHED_STATUSES:
+                yield {"event": "done", "execution_id": record.id, "status": record.status,
+                       "results": record.data.get("results"), "message": record.data.get("message")}
+                return
+            yield {"event": "status", "execution_id": record.id, "status": record.status}
+        record = await execution_queue.wait(record.id, 15) or record
+
+@app.get("/executions/metrics")
+async def get_execution_metrics(current_user: User = Depends(get_current_active_user)):
+    return {
+        **await execution_queue.metrics(),
+        "scheduler": scheduler.stats(),
+        "webhooks": {"routes": len(webhook_router.routes), **webhook_ingestor.stats()},
+        "ai": engine.ai.stats(),
+        "ai_cache": engine.ai_cache.stats(),
+        "browser_pools": browser_pool_stats(),
+    }
+
+@app.get("/executions/{execution_id}")
+async def get_execution(execution_id: str, current_user: User = Depends(get_current_active_user)):
+    record = await execution_queue.get(execution_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="执行记录未找到")
+    return {"execution_id": record.id, "workflow_id": record.workflow_id, "status": record.status, **record.data}
+
+@app.get("/executions/{execution_id}/stream")
+async def stream_execution(execution_id: str, current_user: User = Depends(get_current_active_user)):
+    """执行事件的服务端事件流，在本进程执行的工作流包含流式节点的片段"""
+    stream = execution_streams.get(execution_id)
+    if stream is not None:
+        events = stream.subscribe()
+    else:
+        record = await execution_queue.get(execution_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail="执行记录未找到")
+        events = wait_remote_execution(record)
+    return StreamingResponse(sse_stream(events), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.post("/executions/{execution_id}/resume", status_code=status.HTTP_202_ACCEPTED)
+async def resume_execution(execution_id: str, current_user: User = Depends(get_current_active_user)):
+    # 重新执行失败/中断的执行，已成功的节点从检查点恢复，不再重复执行
+    record = await execution_queue.get(execution_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="执行记录未找到")
+    workflow = await storage.workflows.get(record.workflow_id)
+    if workflow is None:
+        raise HTTPException(status_code=404, detail="工作流未找到")
+    
+    try:
+        record = await execution_queue.resume(execution_id, workflow)
+    except ExecutionStateError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except QueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="执行队列已满，请稍后重试",
+            headers={"Retry-After": "1"},
+        )
+    return {"execution_id": record.id, "status": record.status}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,186 @@
+"""
+路径访问器
+转换节点映射中的 a.b.0.c 路径只解析一次，编译为访问器；
+批量模式下 items.*.email 形式的通配路径在一次遍历中应用于整个记录列表
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+WILDCARD = "*"
+
+
+class PathAccessor:
+    """编译后的路径：每一段预先计算好字典键与列表下标"""
+
+    __slots__ = ("path", "steps", "wildcard", "get")
+
+    def __init__(self, path: str):
+        self.path = path
+        # (键, 下标)：下标为None表示该段不能用于列表
+        self.steps: Tuple[Tuple[str, Optional[int]], ...] = tuple(
+            (part, int(part) if part.isdigit() else None) for part in path.split('.')
+        ) if path else ()
+        self.wildcard = any(key == WILDCARD for key, _ in self.steps)
+        # get(data)：获取路径对应的值，不存在时返回None；通配段返回各元素取值组成的列表
+        if not self.steps:
+            self.get = _return_none
+        elif self.wildcard:
+            steps = self.steps
+            self.get = lambda data: _walk(data, steps)
+        else:
+            self.get = _build_getter(self.steps)
+
+    def split_wildcard(self) -> Tuple["PathAccessor", "PathAccessor"]:
+        """在第一个通配段处拆分为 (列表路径, 元素内路径)"""
+        parts = self.path.split('.')
+        index = parts.index(WILDCARD)
+        return compile_path('.'.join(parts[:index])), compile_path('.'.join(parts[index + 1:]))
+
+
+def _return_none(data: Any) -> None:
+    return None
+
+
+_MISSING = object()
+
+
+def _build_getter(steps: Tuple[Tuple[str, Optional[int]], ...]):
+    """为不含通配段的路径生成专用的取值函数，省去逐段的循环与类型分派"""
+    lines = ["def get(value):"]
+    for key, index in steps:
+        lines.append("    if isinstance(value, dict):")
+        lines.append(f"        value = value.get({key!r}, _MISSING)")
+        lines.append("        if value is _MISSING:")
+        lines.append("            return None")
+        if index is not None:
+            lines.append(f"    elif isinstance(value, list) and {index} < len(value):")
+            lines.append(f"        value = value[{index}]")
+        lines.append("    else:")
+        lines.append("        return None")
+    lines.append("    return value")
+    namespace = {"_MISSING": _MISSING}
+    exec("\n".join(lines), namespace)
+    return namespace["get"]
+
+
+def _walk(data: Any, steps: Tuple[Tuple[str, Optional[int]], ...]) -> Any:
+    current = data
+    for position, (key, index) in enumerate(steps):
+        if isinstance(current, dict) and key in current:
+            current = current[key]
+        elif key == WILDCARD and isinstance(current, list):
+            rest = steps[position + 1:]
+            if not rest:
+                return current
+            values = [_walk(item, rest) for item in current]
+            return [value for value in values if value is not None]
+        elif isinstance(current, list) and index is not None and index < len(current):
+            current = current[index]
+        else:
+            return None
+    return current
+
+
+@lru_cache(maxsize=4096)
+def compile_path(path: str) -> PathAccessor:
+    """编译路径，相同路径只解析一次"""
+    return PathAccessor(path)
+
+
+class CompiledMapping:
+    """编译后的转换映射 {目标字段: 源路径}"""
+
+    def __init__(self, items: Tuple[Tuple[str, str], ...]):
+        self.fields = tuple((target, compile_path(source)) for target, source in items)
+
+    def apply(self, data: Any) -> Dict[str, Any]:
+        """对单个数据应用映射，值为None的字段不输出"""
+        result = {}
+        for target, accessor in self.fields:
+            value = accessor.get(data)
+            if value is not None:
+                result[target] = value
+        return result
+
+    def iterates_root(self, records_path: Optional[str] = None) -> bool:
+        """批量模式下记录列表是否就是数据本身，此时可以直接传入记录迭代器而无需完整数据"""
+        if records_path:
+            return False
+        return all(not accessor.wildcard or not accessor.split_wildcard()[0].path for _, accessor in self.fields)
+
+    def apply_batch(self, data: Any, output: str = "rows", records_path: Optional[str] = None) -> Any:
+        """
+        批量模式：把映射应用到记录列表中的每条记录，只遍历一次
+
+        通配路径（如 items.*.email）的 * 之前为记录列表，之后为记录内的路径；
+        不含通配符的路径在 records_path 指定的记录上求值（未指定时数据本身即为记录列表），
+        若两者都没有则视为对根数据求值的常量字段。
+
+        Args:
+            data: 输入数据（记录列表本身也可以是迭代器）
+            output: rows 输出记录列表，columns 输出 {字段: [值, ...]}
+            records_path: 记录列表所在路径
+
+        Returns:
+            行式或列式结果
+        """
+        records, per_record, constants = self._plan_batch(data, records_path)
+
+        if output == "columns":
+            columns: Dict[str, Any] = {target: [] for target, _ in per_record}
+            appenders = [(columns[target].append, accessor.get) for target, accessor in per_record]
+            for record in records:
+                for append, get in appenders:
+                    append(get(record))
+            for target, value in constants.items():
+                columns[target] = value
+            return columns
+
+        rows = []
+        fields = [(target, accessor.get) for target, accessor in per_record]
+        for record in records:
+            row = dict(constants)
+            for target, get in fields:
+                value = get(record)
+                if value is not None:
+                    row[target] = value
+            rows.append(row)
+        return rows
+
+    def _plan_batch(self, data: Any, records_path: Optional[str]):
+        prefix: Optional[str] = records_path
+        per_record: List[Tuple[str, PathAccessor]] = []
+        constants: Dict[str, Any] = {}
+
+        for target, accessor in self.fields:
+            if accessor.wildcard:
+                list_path, inner = accessor.split_wildcard()
+                if prefix is not None and prefix != list_path.path:
+                    raise ValueError(f"批量模式下所有通配路径必须指向同一个列表: {prefix} / {list_path.path}")
+                prefix = list_path.path
+                per_record.append((target, inner))
+            elif records_path is not None or isinstance(data, (list, Iterator)):
+                per_record.append((target, accessor))
+            else:
+                value = accessor.get(data)
+                if value is not None:
+                    constants[target] = value
+
+        if prefix:
+            records = compile_path(prefix).get(data)
+        else:
+            records = data
+        if not isinstance(records, (list, Iterator)):
+            records = []
+        return records, per_record, constants
+
+
+@lru_cache(maxsize=1024)
+def _compile_mapping(items: Tuple[Tuple[str, str], ...]) -> CompiledMapping:
+    return CompiledMapping(items)
+
+
+def compile_mapping(mapping: Dict[str, str]) -> CompiledMapping:
+    """编译转换映射，相同映射只编译一次"""
+    return _compile_mapping(tuple((str(k), str(v)) for k, v in mapping.items()))
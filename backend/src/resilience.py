@@ -0,0 +1,206 @@
+"""
+节点执行策略
+节点通过 policy 声明超时、重试与熔断：
+
+    {"id": "fetch", "type": "http", "config": {...},
+     "policy": {"timeout": 10, "retries": 3, "backoff": 0.5, "max_backoff": 30, "jitter": 0.5,
+                "circuit_breaker": true}}
+
+- 超时：单次尝试超过 timeout 秒即取消并视为失败
+- 重试：失败后按指数退避（backoff * 2^n，上限 max_backoff）加随机抖动等待后重试，
+  429/503响应带 Retry-After 时按其等待
+- 熔断：按目标主机统计连续失败，达到阈值后一段时间内直接失败，不再请求该主机；
+  熔断器由引擎持有，在所有执行之间共享
+"""
+
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional
+
+# 视为失败、可重试的HTTP状态码
+DEFAULT_RETRY_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+
+class PolicyError(ValueError):
+    """节点策略配置无效"""
+
+
+@dataclass(frozen=True)
+class NodePolicy:
+    """单个节点的执行策略"""
+    timeout: Optional[float] = None
+    retries: int = 0
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    # 抖动比例：实际等待时间在 [delay * (1 - jitter), delay] 之间均匀分布
+    jitter: float = 0.5
+    retry_status: FrozenSet[int] = DEFAULT_RETRY_STATUS
+    circuit_breaker: bool = False
+    # 熔断器的键，默认HTTP节点为目标主机、AI节点为模型
+    circuit_key: Optional[str] = None
+
+    @property
+    def active(self) -> bool:
+        return self.timeout is not None or self.retries > 0 or self.circuit_breaker
+
+    @staticmethod
+    def from_node(node: Dict[str, Any]) -> "NodePolicy":
+        """
+        读取节点的 policy 配置，未配置时返回不生效的默认策略
+
+        Raises:
+            PolicyError: 配置无效
+        """
+        config = node.get("policy")
+        if not config:
+            return _NO_POLICY
+        if not isinstance(config, dict):
+            raise PolicyError("policy 必须是对象")
+        try:
+            timeout = config.get("timeout")
+            policy = NodePolicy(
+                timeout=float(timeout) if timeout is not None else None,
+                retries=int(config.get("retries", 0)),
+                backoff=float(config.get("backoff", 0.5)),
+                max_backoff=float(config.get("max_backoff", 30.0)),
+                jitter=float(config.get("jitter", 0.5)),
+                retry_status=frozenset(int(code) for code in config.get("retry_status", DEFAULT_RETRY_STATUS)),
+                circuit_breaker=bool(config.get("circuit_breaker", False)),
+                circuit_key=config.get("circuit_key"),
+            )
+        except (TypeError, ValueError) as e:
+            raise PolicyError(f"policy 配置无效: {str(e)}") from None
+        if (policy.timeout is not None and policy.timeout <= 0) or policy.retries < 0 or not 0 <= policy.jitter <= 1:
+            raise PolicyError("policy 配置无效: timeout 须大于0，retries 不能为负，jitter 须在0~1之间")
+        return policy
+
+    def is_failure(self, result: Any) -> bool:
+        """节点结果是否为失败：包含 error，或HTTP状态码属于 retry_status"""
+        if not isinstance(result, dict):
+            return False
+        if "error" in result:
+            return True
+        return result.get("status_code") in self.retry_status
+
+    def retry_delay(self, attempt: int, result: Any = None) -> float:
+        """第 attempt 次（从0开始）失败后的等待时间（秒）"""
+        retry_after = _retry_after(result)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        delay = min(self.backoff * (2 ** attempt), self.max_backoff)
+        return delay * (1 - self.jitter * random.random())
+
+
+_NO_POLICY = NodePolicy()
+
+
+def _retry_after(result: Any) -> Optional[float]:
+    if not isinstance(result, dict) or result.get("status_code") not in (429, 503):
+        return None
+    headers = result.get("headers") or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """
+    单个目标的熔断器
+
+    关闭：正常放行，连续失败 failure_threshold 次后打开；
+    打开：直接拒绝，reset_timeout 秒后进入半开；
+    半开：只放行 half_open_calls 个探测调用，成功则关闭，失败则重新打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        """是否放行本次调用；放行的调用结束后须调用 record_success、record_failure 或（被取消时）release"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self._probes = 0
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self.rejected += 1
+                return False
+            self._probes += 1
+        return True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+
+    def release(self):
+        """放行的调用因执行被取消而没有结果：不计为成功或失败，归还半开状态下占用的探测名额"""
+        if self.state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    @property
+    def retry_in(self) -> float:
+        """打开状态下距离进入半开的剩余秒数"""
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class CircuitBreakerRegistry:
+    """按目标（主机名等）管理熔断器，同一引擎的所有执行共享"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_calls: int = 1):
+        """
+        Args:
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多少秒进入半开状态试探
+            half_open_calls: 半开状态下放行的探测调用数
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_calls = half_open_calls
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    @classmethod
+    def from_env(cls) -> "CircuitBreakerRegistry":
+        """由环境变量 CIRCUIT_FAILURE_THRESHOLD、CIRCUIT_RESET_TIMEOUT 配置"""
+        return cls(
+            failure_threshold=int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5)),
+            reset_timeout=float(os.environ.get("CIRCUIT_RESET_TIMEOUT", 30)),
+        )
+
+    def get(self, key: str) -> CircuitBreaker:
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker(
+                self.failure_threshold, self.reset_timeout, self.half_open_calls
+            )
+        return breaker
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """未处于关闭状态或有失败记录的熔断器"""
+        return {
+            key: {"state": breaker.state, "failures": breaker.failures, "rejected": breaker.rejected}
+            for key, breaker in self._breakers.items()
+            if breaker.state != CircuitBreaker.CLOSED or breaker.failures
+        }
@@ -0,0 +1,606 @@
+"""
+定时触发调度器
+加载启用状态的工作流中的 cron / interval 触发器，按下次触发时间维护最小堆，
+到期时把执行提交到执行队列。每次调度 O(log n)，不做逐秒扫描。
+
+每个触发器的下次触发时间保存在 schedules 表中，触发分三步：
+1. 比较并交换地把 next_fire_at 推进到下一次，同时记下 pending_fire_at（抢占本次触发）
+2. 以 (触发器, 触发时间) 生成确定的执行id提交执行，已存在则跳过
+3. 清除 pending_fire_at
+进程在任意一步之间退出，重启后都能补上或跳过本次触发，不会重复触发
+"""
+
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import Column, Float, Integer, String, Table, bindparam, delete, insert, select, update
+from sqlalchemy.engine import Engine
+
+from .job_queue import ExecutionQueue, QueueFullError
+from .storage import SqlStoreBase, WorkflowStore, metadata
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:  # Python 3.8
+    ZoneInfo = None
+
+logger = logging.getLogger("workflow-engine")
+
+MISFIRE_POLICIES = ("run_once", "skip")
+# 由调度器处理的触发器类型，其余类型（如webhook）由各自的模块处理
+SCHEDULE_TRIGGER_TYPES = ("cron", "interval")
+DEFAULT_MISFIRE_GRACE = 60.0
+
+schedules_table = Table(
+    "schedules", metadata,
+    Column("key", String(128), primary_key=True),
+    Column("workflow_id", Integer, nullable=False, index=True),
+    Column("next_fire_at", Float, nullable=False),
+    # 已抢占但尚未确认提交的触发时间
+    Column("pending_fire_at", Float, nullable=True),
+    Column("last_fire_at", Float, nullable=True),
+)
+
+_CLAIM = (
+    update(schedules_table)
+    .where(schedules_table.c.key == bindparam("k"), schedules_table.c.next_fire_at == bindparam("due"),
+           schedules_table.c.pending_fire_at.is_(None))
+    .values(next_fire_at=bindparam("next"), pending_fire_at=bindparam("due"))
+)
+_SKIP = (
+    update(schedules_table)
+    .where(schedules_table.c.key == bindparam("k"), schedules_table.c.next_fire_at == bindparam("due"))
+    .values(next_fire_at=bindparam("next"))
+)
+_COMPLETE = (
+    update(schedules_table)
+    .where(schedules_table.c.key == bindparam("k"), schedules_table.c.pending_fire_at == bindparam("due"))
+    .values(pending_fire_at=None, last_fire_at=bindparam("due"))
+)
+
+# 执行id命名空间：相同触发器在相同触发时间得到相同的执行id
+_EXECUTION_NAMESPACE = uuid.UUID("0d4f1e9c-5b7a-4c1e-9a57-3f1f2b6d8e21")
+
+
+class TriggerError(ValueError):
+    """触发器配置无效"""
+
+
+_CRON_ALIASES = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+_MONTH_NAMES = {name: i + 1 for i, name in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])}
+_DAY_NAMES = {name: i for i, name in enumerate(["sun", "mon", "tue", "wed", "thu", "fri", "sat"])}
+
+
+def _parse_cron_field(field: str, low: int, high: int, names: Dict[str, int]) -> FrozenSet[int]:
+    values = set()
+    for part in field.lower().split(","):
+        step = 1
+        stepped = "/" in part
+        if stepped:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise TriggerError(f"cron步长无效: {field}")
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = names.get(start_text, None), names.get(end_text, None)
+            start = int(start_text) if start is None else start
+            end = int(end_text) if end is None else end
+        else:
+            start = names[part] if part in names else int(part)
+            # a/n 表示从a开始到上限（包括 a/1）
+            end = high if stepped else start
+        if start < low or end > high or start > end:
+            raise TriggerError(f"cron字段超出范围: {field}")
+        values.update(range(start, end + 1, step))
+    return frozenset(values)
+
+
+class CronExpression:
+    """五段式cron表达式：分 时 日 月 周（周日为0或7），支持 * a-b */n a,b 与月份/星期英文缩写"""
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = _CRON_ALIASES.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise TriggerError(f"cron表达式需要5个字段: {expression}")
+        try:
+            self.minutes = _parse_cron_field(fields[0], 0, 59, {})
+            self.hours = _parse_cron_field(fields[1], 0, 23, {})
+            self.days = _parse_cron_field(fields[2], 1, 31, {})
+            self.months = _parse_cron_field(fields[3], 1, 12, _MONTH_NAMES)
+            weekdays = _parse_cron_field(fields[4], 0, 7, _DAY_NAMES)
+        except (KeyError, ValueError) as e:
+            if isinstance(e, TriggerError):
+                raise
+            raise TriggerError(f"cron表达式无效: {expression}") from None
+        # cron的周日为0，datetime.weekday()的周一为0
+        self.weekdays = frozenset((day - 1) % 7 for day in weekdays)
+        # 以*开头（如 */2）或覆盖全部取值（如 */1、1-31、0-6）的日/周字段视为不限制
+        self._any_day = fields[2].startswith("*") or len(self.days) == 31
+        self._any_weekday = fields[4].startswith("*") or len(self.weekdays) == 7
+        self._sorted_minutes = sorted(self.minutes)
+        self._sorted_hours = sorted(self.hours)
+
+    def _day_matches(self, moment: datetime) -> bool:
+        in_days = moment.day in self.days
+        in_weekdays = moment.weekday() in self.weekdays
+        # 日与周都有限制时满足其一即可（标准cron语义）
+        if not self._any_day and not self._any_weekday:
+            return in_days or in_weekdays
+        return in_days and in_weekdays
+
+    def next_after(self, moment: datetime) -> datetime:
+        """严格晚于moment的下一个匹配时间（墙上时间，不含时区）"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # 日期层面最多查找约5年（覆盖闰年2月29日）
+        for _ in range(366 * 5):
+            if candidate.month not in self.months:
+                year = candidate.year + (candidate.month == 12)
+                candidate = datetime(year, candidate.month % 12 + 1, 1)
+                continue
+            if not self._day_matches(candidate):
+                candidate = datetime(candidate.year, candidate.month, candidate.day) + timedelta(days=1)
+                continue
+            hour = next((h for h in self._sorted_hours if h >= candidate.hour), None)
+            if hour is None:
+                candidate = datetime(candidate.year, candidate.month, candidate.day) + timedelta(days=1)
+                continue
+            if hour != candidate.hour:
+                candidate = candidate.replace(hour=hour, minute=0)
+            minute = next((m for m in self._sorted_minutes if m >= candidate.minute), None)
+            if minute is None:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+                continue
+            return candidate.replace(minute=minute)
+        raise TriggerError(f"cron表达式没有可触发的时间: {self.expression}")
+
+
+class Trigger:
+    """触发器基类：jitter 为触发时间的随机延后上限（秒），misfire 为错过触发时间后的处理方式"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.config = config
+        self.jitter = float(config.get("jitter", 0) or 0)
+        self.misfire = config.get("misfire", "run_once")
+        if self.misfire not in MISFIRE_POLICIES:
+            raise TriggerError(f"不支持的misfire策略: {self.misfire}")
+        self.misfire_grace = float(config.get("misfire_grace", DEFAULT_MISFIRE_GRACE))
+        self.key_suffix = hashlib.sha1(
+            json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:12]
+
+    def next_fire(self, after: float) -> float:
+        """严格晚于after的下一次触发时间（时间戳）"""
+        raise NotImplementedError
+
+    def jitter_offset(self, key: str, fire_at: float) -> float:
+        """确定性的随机延后：同一次触发在重启前后得到相同的偏移"""
+        if self.jitter <= 0:
+            return 0.0
+        return random.Random(f"{key}:{fire_at}").uniform(0, self.jitter)
+
+    @staticmethod
+    def from_config(config: Dict[str, Any]) -> "Trigger":
+        trigger_type = config.get("type")
+        if trigger_type == "cron":
+            return CronTrigger(config)
+        if trigger_type == "interval":
+            return IntervalTrigger(config)
+        raise TriggerError(f"不支持的触发器类型: {trigger_type}")
+
+
+class CronTrigger(Trigger):
+    """cron触发器：{"type": "cron", "expression": "*/5 * * * *", "timezone": "Asia/Shanghai"}"""
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.cron = CronExpression(str(config.get("expression", "")))
+        tz_name = config.get("timezone") or "UTC"
+        if tz_name == "UTC" or ZoneInfo is None:
+            self.tz = timezone.utc
+        else:
+            try:
+                self.tz = ZoneInfo(tz_name)
+            except Exception:
+                raise TriggerError(f"未知的时区: {tz_name}") from None
+
+    def next_fire(self, after: float) -> float:
+        local = datetime.fromtimestamp(after, self.tz).replace(tzinfo=None)
+        while True:
+            local = self.cron.next_after(local)
+            # 夏令时回拨时同一墙上时间出现两次，取严格晚于after的那一次；都不晚于after时继续找下一个匹配时间
+            fire_at = min((ts for ts in self._resolve(local) if ts > after), default=None)
+            if fire_at is not None:
+                return fire_at
+
+    def _resolve(self, local: datetime) -> List[float]:
+        """墙上时间对应的时间戳：重复的时间有两个，夏令时跳过的时间顺延到跳变之后"""
+        stamps = []
+        for fold in (0, 1):
+            ts = local.replace(tzinfo=self.tz, fold=fold).timestamp()
+            if datetime.fromtimestamp(ts, self.tz).replace(tzinfo=None) == local:
+                stamps.append(ts)
+        return stamps or [local.replace(tzinfo=self.tz).timestamp()]
+
+
+class IntervalTrigger(Trigger):
+    """固定间隔触发器：{"type": "interval", "seconds": 300}（也可用 minutes / hours）"""
+
+    def __init__(self, config: Dict[str, Any]):
+        super().__init__(config)
+        self.interval = (
+            float(config.get("seconds", 0) or 0)
+            + float(config.get("minutes", 0) or 0) * 60
+            + float(config.get("hours", 0) or 0) * 3600
+        )
+        if self.interval <= 0:
+            raise TriggerError("间隔触发器的间隔必须大于0")
+
+    def next_fire(self, after: float) -> float:
+        return after + self.interval
+
+
+@dataclass
+class ScheduleEntry:
+    """一个工作流触发器的调度状态"""
+    key: str
+    workflow_id: int
+    trigger: Trigger
+    next_fire_at: float
+    pending_fire_at: Optional[float] = None
+    # 本进程刚抢占、尚未提交过的触发
+    claimed: bool = False
+    version: int = 0
+
+
+class SqlScheduleStore(SqlStoreBase):
+    """触发器调度状态（schedules表）"""
+
+    async def load_all(self) -> Dict[str, Dict[str, Any]]:
+        def query(conn):
+            return {row.key: row._asdict() for row in conn.execute(select(schedules_table))}
+        return await asyncio.to_thread(self._read, query)
+
+    async def load_keys(self, keys: List[str]) -> Dict[str, Dict[str, Any]]:
+        def query(conn):
+            rows = conn.execute(select(schedules_table).where(schedules_table.c.key.in_(keys)))
+            return {row.key: row._asdict() for row in rows}
+        return await asyncio.to_thread(self._read, query)
+
+    async def load_workflow(self, workflow_id: int) -> Dict[str, Dict[str, Any]]:
+        def query(conn):
+            rows = conn.execute(select(schedules_table).where(schedules_table.c.workflow_id == workflow_id))
+            return {row.key: row._asdict() for row in rows}
+        return await asyncio.to_thread(self._read, query)
+
+    async def replace_workflow(self, workflow_id: int, rows: List[Dict[str, Any]]):
+        """写入工作流的新触发器并删除不再存在的触发器，已有触发器的状态保持不变"""
+        def write(conn):
+            table = schedules_table
+            existing = {row.key for row in conn.execute(select(table.c.key).where(table.c.workflow_id == workflow_id))}
+            keys = {row["key"] for row in rows}
+            stale = existing - keys
+            if stale:
+                conn.execute(delete(table).where(table.c.key.in_(stale)))
+            new_rows = [row for row in rows if row["key"] not in existing]
+            if new_rows:
+                conn.execute(insert(table), new_rows)
+        await asyncio.to_thread(self._write, write)
+
+    async def insert_many(self, rows: List[Dict[str, Any]]):
+        if rows:
+            await asyncio.to_thread(self._write, lambda conn: conn.execute(insert(schedules_table), rows))
+
+    async def delete_workflow(self, workflow_id: int):
+        await asyncio.to_thread(
+            self._write,
+            lambda conn: conn.execute(delete(schedules_table).where(schedules_table.c.workflow_id == workflow_id)),
+        )
+
+    async def claim_many(self, claims: List[Tuple[str, float, float]],
+                         skips: List[Tuple[str, float, float]]) -> Set[str]:
+        """
+        在一个事务中抢占一批触发并推进跳过的触发
+
+        Args:
+            claims: [(key, 触发时间, 下次触发时间)]，只有 next_fire_at 仍为该触发时间时才抢占成功
+            skips: [(key, 触发时间, 下次触发时间)]，misfire=skip 时只推进不触发
+
+        Returns:
+            抢占或推进成功的key
+        """
+        def write(conn):
+            done = set()
+            # 逐行比较并交换（需要每行的更新结果），语句只构建一次
+            for statement, rows in ((_CLAIM, claims), (_SKIP, skips)):
+                for key, due, next_fire_at in rows:
+                    if conn.execute(statement, {"k": key, "due": due, "next": next_fire_at}).rowcount == 1:
+                        done.add(key)
+            return done
+        return await asyncio.to_thread(self._write, write)
+
+    async def complete_many(self, fired: List[Tuple[str, float]]):
+        """确认一批触发已提交"""
+        if fired:
+            rows = [{"k": key, "due": due} for key, due in fired]
+            await asyncio.to_thread(self._write, lambda conn: conn.execute(_COMPLETE, rows))
+
+
+class WorkflowScheduler:
+    """定时触发调度器"""
+
+    def __init__(self, queue: ExecutionQueue, workflows: WorkflowStore, state: SqlScheduleStore,
+                 retry_delay: float = 5.0, batch_size: int = 500):
+        """
+        Args:
+            queue: 执行队列
+            workflows: 工作流存储
+            state: 调度状态存储
+            retry_delay: 执行队列已满或写入失败时重试提交的间隔（秒）
+            batch_size: 同时到期的触发按批处理，每批的抢占、提交与确认各为一个事务
+        """
+        self.queue = queue
+        self.workflows = workflows
+        self.state = state
+        self.retry_delay = retry_delay
+        self.batch_size = batch_size
+        self.entries: Dict[str, ScheduleEntry] = {}
+        self._by_workflow: Dict[int, List[str]] = {}
+        self.fired = 0
+        self.skipped = 0
+        self.deferred = 0
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self, page_size: int = 500):
+        """加载所有启用的工作流的触发器并启动调度循环"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        rows = await self.state.load_all()
+        new_rows = []
+        after_id = None
+        while True:
+            page = await self.workflows.list(limit=page_size, after_id=after_id)
+            if not page:
+                break
+            after_id = page[-1]["id"]
+            for workflow in page:
+                for entry, is_new in self._build_entries(workflow, rows):
+                    self._add(entry)
+                    if is_new:
+                        new_rows.append(self._row(entry))
+        await self.state.insert_many(new_rows)
+        logger.info(f"定时调度器已加载 {len(self.entries)} 个触发器")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def sync_workflow(self, workflow: Dict[str, Any]):
+        """工作流创建/更新后同步其触发器；未启用的工作流不调度"""
+        workflow_id = workflow["id"]
+        rows = await self.state.load_workflow(workflow_id)
+        self._discard(workflow_id)
+        entries = [entry for entry, _ in self._build_entries(workflow, rows)]
+        await self.state.replace_workflow(workflow_id, [self._row(entry) for entry in entries])
+        for entry in entries:
+            self._add(entry)
+        self._notify()
+
+    async def remove_workflow(self, workflow_id: int):
+        self._discard(workflow_id)
+        await self.state.delete_workflow(workflow_id)
+
+    def _discard(self, workflow_id: int):
+        for key in self._by_workflow.pop(workflow_id, ()):
+            self.entries.pop(key, None)
+
+    def _build_entries(self, workflow: Dict[str, Any], rows: Dict[str, Dict[str, Any]]):
+        if not workflow.get("active", True):
+            return
+        now = time.time()
+        for config in workflow.get("triggers") or ():
+            if config.get("type") not in SCHEDULE_TRIGGER_TYPES:
+                continue
+            try:
+                trigger = Trigger.from_config(config)
+            except (TriggerError, TypeError, ValueError) as e:
+                logger.warning(f"工作流 {workflow['id']} 的触发器无效: {str(e)}")
+                continue
+            key = f"{workflow['id']}:{trigger.key_suffix}"
+            row = rows.get(key)
+            if row is not None:
+                # 重启后沿用保存的状态
+                yield ScheduleEntry(key, workflow["id"], trigger, row["next_fire_at"], row["pending_fire_at"]), False
+            else:
+                yield ScheduleEntry(key, workflow["id"], trigger, trigger.next_fire(now)), True
+
+    @staticmethod
+    def _row(entry: ScheduleEntry) -> Dict[str, Any]:
+        return {
+            "key": entry.key,
+            "workflow_id": entry.workflow_id,
+            "next_fire_at": entry.next_fire_at,
+            "pending_fire_at": entry.pending_fire_at,
+        }
+
+    def _add(self, entry: ScheduleEntry):
+        self.entries[entry.key] = entry
+        self._by_workflow.setdefault(entry.workflow_id, []).append(entry.key)
+        self._push(entry)
+
+    def _push(self, entry: ScheduleEntry, at: Optional[float] = None):
+        entry.version += 1
+        if at is None:
+            if entry.pending_fire_at is not None:
+                at = time.time()
+            else:
+                at = entry.next_fire_at + entry.trigger.jitter_offset(entry.key, entry.next_fire_at)
+        heapq.heappush(self._heap, (at, next(self._sequence), entry.key, entry.version))
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            now = time.time()
+            batch = []
+            while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_size:
+                _, _, key, version = heapq.heappop(self._heap)
+                entry = self.entries.get(key)
+                if entry is not None and entry.version == version:
+                    batch.append(entry)
+            if batch:
+                try:
+                    await self._fire(batch)
+                except Exception as e:
+                    logger.error(f"提交定时触发失败: {str(e)}")
+                    self._retry(batch)
+                continue
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def _retry(self, entries: List[ScheduleEntry]):
+        at = time.time() + self.retry_delay
+        for entry in entries:
+            if self.entries.get(entry.key) is entry:
+                self._push(entry, at)
+
+    async def _fire(self, batch: List[ScheduleEntry]):
+        now = time.time()
+        claims, skips, planned = [], [], {}
+        for entry in batch:
+            if entry.pending_fire_at is not None:
+                continue
+            due = entry.next_fire_at
+            trigger = entry.trigger
+            late = now - due > trigger.misfire_grace + trigger.jitter
+            # 错过触发时间（停机等）时：skip 直接跳到下一次；run_once 补触发一次，合并错过的多次
+            next_fire_at = trigger.next_fire(now if late else due)
+            planned[entry.key] = next_fire_at
+            (skips if late and trigger.misfire == "skip" else claims).append((entry.key, due, next_fire_at))
+
+        done = await self.state.claim_many(claims, skips) if planned else set()
+        by_key = {entry.key: entry for entry in batch}
+        for key, _, next_fire_at in skips:
+            if key in done:
+                self.skipped += 1
+                by_key[key].next_fire_at = next_fire_at
+        for key, due, next_fire_at in claims:
+            if key in done:
+                entry = by_key[key]
+                entry.next_fire_at = next_fire_at
+                entry.pending_fire_at = due
+                entry.claimed = True
+
+        lost = [entry for entry in batch if entry.key in planned and entry.key not in done]
+        if lost:
+            # 其他调度器实例已处理这些触发，按数据库中的状态重新调度
+            await self._reload(lost)
+
+        pending = [entry for entry in batch if entry.pending_fire_at is not None]
+        if pending:
+            await self._submit(pending)
+        for entry in batch:
+            if entry.pending_fire_at is None and self.entries.get(entry.key) is entry:
+                self._push(entry)
+
+    async def _reload(self, entries: List[ScheduleEntry]):
+        rows = await self.state.load_keys([entry.key for entry in entries])
+        for entry in entries:
+            row = rows.get(entry.key)
+            if row is None:
+                self.entries.pop(entry.key, None)
+                continue
+            entry.next_fire_at = row["next_fire_at"]
+            entry.pending_fire_at = row["pending_fire_at"]
+
+    async def _submit(self, entries: List[ScheduleEntry]):
+        workflows = await self.workflows.get_many(entry.workflow_id for entry in entries)
+        now = time.time()
+        fresh, recovered = [], []
+        for entry in entries:
+            workflow = workflows.get(entry.workflow_id)
+            if workflow is None or not workflow.get("active", True):
+                continue
+            due = entry.pending_fire_at
+            submission = (
+                entry.workflow_id,
+                workflow,
+                {"trigger": {**entry.trigger.config, "scheduled_at": due, "fired_at": now}},
+                str(uuid.uuid5(_EXECUTION_NAMESPACE, f"{entry.key}:{due}")),
+            )
+            # 刚抢占的触发不可能已提交，批量提交；重启后遗留的pending触发可能已提交，逐个幂等提交
+            (fresh if entry.claimed else recovered).append((entry, submission))
+
+        try:
+            await self.queue.submit_many([submission for _, submission in fresh])
+            for entry, _ in fresh:
+                entry.claimed = False
+            for _, (workflow_id, workflow, input_data, execution_id) in recovered:
+                await self.queue.submit(workflow_id, workflow, input_data, execution_id=execution_id)
+        except QueueFullError:
+            # 保留pending状态，稍后重试提交
+            self.deferred += len(entries)
+            self._retry(entries)
+            return
+        self.fired += len(fresh) + len(recovered)
+
+        await self.state.complete_many([(entry.key, entry.pending_fire_at) for entry in entries])
+        for entry in entries:
+            entry.pending_fire_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        """触发器数量、触发/跳过/延后提交次数与最近的触发时间"""
+        upcoming = min((entry.next_fire_at for entry in self.entries.values()), default=None)
+        return {
+            "schedules": len(self.entries),
+            "fired": self.fired,
+            "skipped_misfires": self.skipped,
+            "deferred": self.deferred,
+            "next_fire_at": upcoming,
+        }
+
+
+def create_schedule_store(engine: Engine) -> SqlScheduleStore:
+    """在存储所用的数据库上创建调度状态存储"""
+    metadata.create_all(engine, tables=[schedules_table])
+    return SqlScheduleStore(engine)
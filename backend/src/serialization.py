@@ -0,0 +1,91 @@
+"""
+紧凑序列化
+节点输出检查点使用的二进制格式：JSON（orjson 编码，未安装时退回标准库 json，两者产出的数据可互相读取），
+较大的数据再用zlib压缩。首字节标记格式，读取时据此解码。
+流式响应体（可能是写入临时文件的大体积数据）不做序列化，遇到时抛出 StreamedBodyError，由调用方跳过
+"""
+
+import json
+import threading
+import zlib
+from datetime import date, datetime
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+from .http_body import StreamedBody
+
+# 超过该大小（字节）的数据压缩后保存
+COMPRESS_THRESHOLD = 4096
+
+_JSON = b"j"
+_ZLIB = b"z"
+
+
+class StreamedBodyError(ValueError):
+    """数据中含有流式响应体，整体加载会破坏其内存上限，因此不序列化"""
+
+
+# 序列化在多个写入线程中进行；orjson 不保留 default 抛出的异常，遇到流式响应体时在此标记
+_encoding = threading.local()
+
+
+def _default(value: Any) -> Any:
+    """不能直接序列化的值：集合转为列表，其余转为字符串；流式响应体抛出 StreamedBodyError"""
+    if isinstance(value, StreamedBody):
+        _encoding.streamed_body = True
+        raise StreamedBodyError(f"不序列化流式响应体: {value!r}")
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+def _encode(value: Any) -> bytes:
+    if orjson is not None:
+        return _JSON + orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return _JSON + json.dumps(value, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def dumps(value: Any) -> bytes:
+    """
+    序列化为紧凑的字节串
+
+    Raises:
+        StreamedBodyError: 数据中含有流式响应体
+    """
+    _encoding.streamed_body = False
+    try:
+        data = _encode(value)
+    except StreamedBodyError:
+        raise
+    except Exception:
+        if _encoding.streamed_body:
+            raise StreamedBodyError("不序列化流式响应体") from None
+        raise
+    if len(data) > COMPRESS_THRESHOLD:
+        compressed = zlib.compress(data, 1)
+        if len(compressed) < len(data):
+            return _ZLIB + compressed
+    return data
+
+
+def loads(data: bytes) -> Any:
+    """
+    反序列化 dumps 的结果
+
+    Raises:
+        ValueError: 未知格式
+    """
+    marker, body = data[:1], data[1:]
+    if marker == _ZLIB:
+        return loads(zlib.decompress(body))
+    if marker == _JSON:
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    raise ValueError(f"未知的序列化格式: {marker!r}")
@@ -0,0 +1,52 @@
+"""
+请求合并（single-flight）
+并发的相同请求共享同一个进行中的调用，结果分发给所有等待者
+"""
+
+import asyncio
+import hashlib
+import json
+from typing import Any, Awaitable, Callable, Dict
+
+
+def make_key(*parts: Any) -> str:
+    """由任意可JSON序列化的部件计算合并键"""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """同一时刻相同键的调用只执行一次"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        执行调用，若已有相同键的调用在进行中则等待其结果
+
+        Args:
+            key: 合并键
+            func: 返回awaitable的无参函数
+
+        Returns:
+            调用结果，字典结果会做浅拷贝，避免调用方之间互相修改
+        """
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            future = asyncio.ensure_future(func())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+        # shield：某个等待者被取消时不影响其他共享该调用的等待者
+        result = await asyncio.shield(future)
+        return dict(result) if isinstance(result, dict) else result
+
+    def stats(self) -> Dict[str, int]:
+        """调用统计：实际执行次数、被合并的次数、进行中的调用数"""
+        return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
@@ -0,0 +1,586 @@
+"""
+持久化存储
+工作流定义与执行/任务记录的存储层：主键索引读取、批量写入、按TTL清理过期记录、分页列出。
+默认实现基于SQLAlchemy（默认SQLite，可通过数据库URL换成其他数据库），
+也可以实现 WorkflowStore / ExecutionStore 接口接入其他后端
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import (
+    Boolean, Column, DateTime, Float, Index, Integer, MetaData, String, Table, Text,
+    create_engine, delete, event, func, insert, select, update,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import StaticPool
+
+logger = logging.getLogger("workflow-engine")
+
+DEFAULT_DATABASE_URL = "sqlite:///./n8n_lite.db"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+# 单条SQL语句中的最大参数数量（SQLite默认上限为32766）
+_SQL_CHUNK = 500
+
+metadata = MetaData()
+
+workflows_table = Table(
+    "workflows", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String(255), nullable=False),
+    Column("owner_id", Integer, nullable=False, index=True),
+    Column("active", Boolean, nullable=False, default=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("updated_at", DateTime, nullable=False),
+    # 其余字段（描述、节点、连接、并发上限等）以JSON保存
+    Column("definition", Text, nullable=False),
+)
+
+executions_table = Table(
+    "executions", metadata,
+    Column("id", String(64), primary_key=True),
+    Column("kind", String(32), nullable=False),
+    Column("workflow_id", Integer, nullable=True),
+    Column("status", String(32), nullable=False),
+    Column("created_at", Float, nullable=False),
+    Column("updated_at", Float, nullable=False),
+    Column("expires_at", Float, nullable=True, index=True),
+    Column("data", Text, nullable=False),
+    Index("ix_executions_workflow", "workflow_id", "created_at"),
+    Index("ix_executions_kind", "kind", "created_at"),
+)
+
+_WORKFLOW_COLUMNS = ("id", "name", "owner_id", "active", "created_at", "updated_at")
+
+
+@dataclass
+class ExecutionRecord:
+    """执行/任务记录"""
+    kind: str
+    status: str
+    data: Dict[str, Any] = field(default_factory=dict)
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    workflow_id: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    expires_at: Optional[float] = None
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires_at is not None and self.expires_at <= (now or time.time())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "workflow_id": self.workflow_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "expires_at": self.expires_at,
+            "data": self.data,
+        }
+
+
+class WorkflowStore:
+    """工作流存储接口"""
+
+    async def create(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    async def create_many(self, workflows: Iterable[Dict[str, Any]]) -> int:
+        raise NotImplementedError
+
+    async def get(self, workflow_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def get_many(self, workflow_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """按id批量读取，返回 {id: 工作流}，不存在的id不出现在结果中"""
+        raise NotImplementedError
+
+    async def update(self, workflow_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def delete(self, workflow_id: int) -> bool:
+        raise NotImplementedError
+
+    async def list(self, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0, after_id: Optional[int] = None,
+                   owner_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def count(self, owner_id: Optional[int] = None) -> int:
+        raise NotImplementedError
+
+
+class ExecutionStore:
+    """执行/任务记录存储接口"""
+
+    async def save(self, record: ExecutionRecord):
+        raise NotImplementedError
+
+    async def save_many(self, records: Iterable[ExecutionRecord]):
+        raise NotImplementedError
+
+    async def get(self, record_id: str, kind: Optional[str] = None) -> Optional[ExecutionRecord]:
+        """
+        查询记录；指定 kind 时其他类型的记录视为不存在（工作流执行与自动化任务共用存储，读取时按类型隔离）
+        """
+        raise NotImplementedError
+
+    async def list(self, kind: Optional[str] = None, workflow_id: Optional[int] = None,
+                   limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[ExecutionRecord]:
+        raise NotImplementedError
+
+    async def count(self, kind: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    async def purge_expired(self, now: Optional[float] = None) -> int:
+        raise NotImplementedError
+
+    async def flush(self):
+        """把缓冲中的写入落盘"""
+
+    async def close(self):
+        await self.flush()
+
+
+def _clamp_limit(limit: int) -> int:
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+
+class SqlStoreBase:
+    """共享的SQLAlchemy引擎；SQLite同一时刻只允许一个写入者，写操作在进程内串行化"""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self._write_lock = threading.Lock()
+        # 内存数据库所有线程共享同一个连接，读操作也需要串行化
+        self._read_lock = self._write_lock if isinstance(engine.pool, StaticPool) else None
+        # 后台刷写任务：保留引用，避免运行中被垃圾回收
+        self._tasks: Set[asyncio.Future] = set()
+
+    def _spawn(self, awaitable: Awaitable[Any]) -> asyncio.Future:
+        """在后台运行，完成后移除引用并记录未处理的异常"""
+        task = asyncio.ensure_future(awaitable)
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Future):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"后台写入任务失败: {str(task.exception())}")
+
+    def _read(self, fn, *args):
+        if self._read_lock is None:
+            with self.engine.connect() as conn:
+                return fn(conn, *args)
+        with self._read_lock, self.engine.connect() as conn:
+            return fn(conn, *args)
+
+    def _write(self, fn, *args):
+        with self._write_lock, self.engine.begin() as conn:
+            return fn(conn, *args)
+
+
+class SqlWorkflowStore(SqlStoreBase, WorkflowStore):
+    """基于SQLAlchemy的工作流存储"""
+
+    async def create(self, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        row = self._to_row(workflow)
+        workflow_id = await asyncio.to_thread(self._write, self._insert_one, row)
+        return self._from_row({**row, "id": workflow_id})
+
+    async def create_many(self, workflows: Iterable[Dict[str, Any]]) -> int:
+        rows = [self._to_row(workflow) for workflow in workflows]
+        if not rows:
+            return 0
+        await asyncio.to_thread(self._write, self._insert_many, rows)
+        return len(rows)
+
+    async def get(self, workflow_id: int) -> Optional[Dict[str, Any]]:
+        row = await asyncio.to_thread(self._read, self._select_one, workflow_id)
+        return self._from_row(row) if row is not None else None
+
+    async def get_many(self, workflow_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        ids = list(set(workflow_ids))
+        if not ids:
+            return {}
+        query = select(workflows_table).where(workflows_table.c.id.in_(ids))
+        rows = await asyncio.to_thread(self._read, self._select_many, query)
+        return {row["id"]: self._from_row(row) for row in rows}
+
+    async def update(self, workflow_id: int, changes: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        row = await asyncio.to_thread(self._write, self._update_one, workflow_id, changes)
+        return self._from_row(row) if row is not None else None
+
+    async def delete(self, workflow_id: int) -> bool:
+        return await asyncio.to_thread(self._write, self._delete_one, workflow_id)
+
+    async def list(self, limit: int = DEFAULT_PAGE_SIZE, offset: int = 0, after_id: Optional[int] = None,
+                   owner_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        按id升序分页列出工作流
+
+        Args:
+            limit: 每页数量（上限 MAX_PAGE_SIZE）
+            offset: 跳过的数量
+            after_id: 游标分页，只返回id大于该值的工作流（大偏移量时优于offset）
+            owner_id: 只返回该用户的工作流
+        """
+        query = select(workflows_table).order_by(workflows_table.c.id).limit(_clamp_limit(limit))
+        if after_id is not None:
+            query = query.where(workflows_table.c.id > after_id)
+        elif offset:
+            query = query.offset(max(0, int(offset)))
+        if owner_id is not None:
+            query = query.where(workflows_table.c.owner_id == owner_id)
+        rows = await asyncio.to_thread(self._read, self._select_many, query)
+        return [self._from_row(row) for row in rows]
+
+    async def count(self, owner_id: Optional[int] = None) -> int:
+        query = select(func.count()).select_from(workflows_table)
+        if owner_id is not None:
+            query = query.where(workflows_table.c.owner_id == owner_id)
+        return await asyncio.to_thread(self._read, lambda conn: conn.execute(query).scalar_one())
+
+    @staticmethod
+    def _insert_one(conn, row: Dict[str, Any]) -> int:
+        return conn.execute(insert(workflows_table), row).inserted_primary_key[0]
+
+    @staticmethod
+    def _insert_many(conn, rows: List[Dict[str, Any]]):
+        # executemany：一条预编译语句批量插入
+        conn.execute(insert(workflows_table), rows)
+
+    @staticmethod
+    def _select_one(conn, workflow_id: int):
+        row = conn.execute(select(workflows_table).where(workflows_table.c.id == workflow_id)).first()
+        return row._asdict() if row is not None else None
+
+    @staticmethod
+    def _select_many(conn, query) -> List[Dict[str, Any]]:
+        return [row._asdict() for row in conn.execute(query)]
+
+    def _update_one(self, conn, workflow_id: int, changes: Dict[str, Any]):
+        current = self._select_one(conn, workflow_id)
+        if current is None:
+            return None
+        merged = {**self._from_row(current), **changes, "id": workflow_id, "updated_at": datetime.now()}
+        row = self._to_row(merged)
+        row.pop("created_at")
+        conn.execute(update(workflows_table).where(workflows_table.c.id == workflow_id).values(**row))
+        return {**current, **row}
+
+    @staticmethod
+    def _delete_one(conn, workflow_id: int) -> bool:
+        return conn.execute(delete(workflows_table).where(workflows_table.c.id == workflow_id)).rowcount > 0
+
+    @staticmethod
+    def _to_row(workflow: Dict[str, Any]) -> Dict[str, Any]:
+        now = datetime.now()
+        definition = {k: v for k, v in workflow.items() if k not in _WORKFLOW_COLUMNS}
+        row = {
+            "name": workflow["name"],
+            "owner_id": workflow.get("owner_id", 1),
+            "active": bool(workflow.get("active", True)),
+            "created_at": workflow.get("created_at") or now,
+            "updated_at": workflow.get("updated_at") or now,
+            "definition": json.dumps(definition, ensure_ascii=False, separators=(",", ":"), default=str),
+        }
+        if workflow.get("id") is not None:
+            row["id"] = workflow["id"]
+        return row
+
+    @staticmethod
+    def _from_row(row: Dict[str, Any]) -> Dict[str, Any]:
+        workflow = json.loads(row["definition"])
+        for column in _WORKFLOW_COLUMNS:
+            workflow[column] = row[column]
+        return workflow
+
+
+class SqlExecutionStore(SqlStoreBase, ExecutionStore):
+    """
+    基于SQLAlchemy的执行记录存储
+
+    写入先进入内存缓冲（同一记录的多次状态更新合并为一次），
+    缓冲达到 batch_size 条或距首次写入超过 flush_interval 秒时批量upsert；
+    读取时优先命中缓冲与正在写入的批次，保证写后可读。
+    """
+
+    def __init__(self, engine: Engine, batch_size: int = 500, flush_interval: float = 0.5,
+                 default_ttl: Optional[float] = None, ttl_by_kind: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            engine: SQLAlchemy引擎
+            batch_size: 缓冲写入条数上限
+            flush_interval: 缓冲最长停留时间（秒）
+            default_ttl: 记录默认保留时间（秒），None为永久保留
+            ttl_by_kind: 按记录类型设置的保留时间，优先于default_ttl
+        """
+        super().__init__(engine)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.default_ttl = default_ttl
+        self.ttl_by_kind = dict(ttl_by_kind or {})
+        self._buffer: Dict[str, ExecutionRecord] = {}
+        # 已取出缓冲、尚未提交的记录，写入成功后才清空
+        self._inflight: Dict[str, ExecutionRecord] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+        self._retention_task: Optional[asyncio.Task] = None
+
+    def ttl_for(self, kind: str) -> Optional[float]:
+        return self.ttl_by_kind.get(kind, self.default_ttl)
+
+    async def save(self, record: ExecutionRecord):
+        """写入或更新记录（进入缓冲）"""
+        await self.save_many((record,))
+
+    async def save_many(self, records: Iterable[ExecutionRecord]):
+        now = time.time()
+        for record in records:
+            record.updated_at = now
+            if record.expires_at is None:
+                ttl = self.ttl_for(record.kind)
+                if ttl is not None:
+                    record.expires_at = record.created_at + ttl
+            self._buffer[record.id] = record
+
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        elif self._buffer and self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.flush_interval, self._schedule_flush)
+
+    def _schedule_flush(self):
+        self._flush_handle = None
+        self._spawn(self.flush())
+
+    async def flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            self._inflight, self._buffer = self._buffer, {}
+            try:
+                await asyncio.to_thread(self._write, self._upsert, list(self._inflight.values()))
+            except Exception:
+                # 写入失败时放回缓冲（不覆盖期间产生的更新），下次再试
+                for record_id, record in self._inflight.items():
+                    self._buffer.setdefault(record_id, record)
+                raise
+            finally:
+                self._inflight = {}
+
+    async def get(self, record_id: str, kind: Optional[str] = None) -> Optional[ExecutionRecord]:
+        record = self._buffer.get(record_id) or self._inflight.get(record_id)
+        if record is None:
+            row = await asyncio.to_thread(self._read, self._select_one, record_id)
+            record = self._from_row(row) if row is not None else None
+        if record is None or record.expired() or (kind is not None and record.kind != kind):
+            return None
+        return record
+
+    async def list(self, kind: Optional[str] = None, workflow_id: Optional[int] = None,
+                   limit: int = DEFAULT_PAGE_SIZE, offset: int = 0) -> List[ExecutionRecord]:
+        """按创建时间倒序分页列出未过期的记录"""
+        await self.flush()
+        table = executions_table
+        now = time.time()
+        query = (
+            select(table)
+            .where((table.c.expires_at.is_(None)) | (table.c.expires_at > now))
+            .order_by(table.c.created_at.desc())
+            .limit(_clamp_limit(limit))
+            .offset(max(0, int(offset)))
+        )
+        if kind is not None:
+            query = query.where(table.c.kind == kind)
+        if workflow_id is not None:
+            query = query.where(table.c.workflow_id == workflow_id)
+        rows = await asyncio.to_thread(self._read, lambda conn: [row._asdict() for row in conn.execute(query)])
+        return [self._from_row(row) for row in rows]
+
+    async def count(self, kind: Optional[str] = None) -> int:
+        await self.flush()
+        query = select(func.count()).select_from(executions_table)
+        if kind is not None:
+            query = query.where(executions_table.c.kind == kind)
+        return await asyncio.to_thread(self._read, lambda conn: conn.execute(query).scalar_one())
+
+    async def purge_expired(self, now: Optional[float] = None, chunk_size: int = 10000) -> int:
+        """
+        删除过期记录，分块删除，避免长时间持有写锁
+
+        Returns:
+            删除的记录数
+        """
+        now = now or time.time()
+        for record_id in [rid for rid, record in self._buffer.items() if record.expired(now)]:
+            del self._buffer[record_id]
+
+        total = 0
+        while True:
+            deleted = await asyncio.to_thread(self._write, self._delete_expired, now, chunk_size)
+            total += deleted
+            if deleted < chunk_size:
+                break
+        if total:
+            logger.info(f"清理过期执行记录 {total} 条")
+        return total
+
+    def start_retention(self, interval: float = 300.0):
+        """启动后台定期清理过期记录"""
+        if self._retention_task is None or self._retention_task.done():
+            self._retention_task = asyncio.ensure_future(self._retention_loop(interval))
+
+    async def _retention_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.purge_expired()
+            except Exception as e:
+                logger.error(f"清理过期执行记录失败: {str(e)}")
+
+    async def close(self):
+        if self._retention_task is not None:
+            self._retention_task.cancel()
+            self._retention_task = None
+        await self.flush()
+
+    def _upsert(self, conn, records: List[ExecutionRecord]):
+        rows = [self._to_row(record) for record in records]
+        dialect = self.engine.dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            if dialect == "sqlite":
+                from sqlalchemy.dialects.sqlite import insert as dialect_insert
+            else:
+                from sqlalchemy.dialects.postgresql import insert as dialect_insert
+            statement = dialect_insert(executions_table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[executions_table.c.id],
+                set_={
+                    name: statement.excluded[name]
+                    for name in ("status", "workflow_id", "updated_at", "expires_at", "data")
+                },
+            )
+            for start in range(0, len(rows), _SQL_CHUNK):
+                conn.execute(statement, rows[start:start + _SQL_CHUNK])
+        else:
+            # 通用方式：先删除再插入
+            ids = [row["id"] for row in rows]
+            for start in range(0, len(ids), _SQL_CHUNK):
+                conn.execute(delete(executions_table).where(executions_table.c.id.in_(ids[start:start + _SQL_CHUNK])))
+            conn.execute(insert(executions_table), rows)
+
+    @staticmethod
+    def _select_one(conn, record_id: str):
+        row = conn.execute(select(executions_table).where(executions_table.c.id == record_id)).first()
+        return row._asdict() if row is not None else None
+
+    @staticmethod
+    def _delete_expired(conn, now: float, chunk_size: int) -> int:
+        expired_ids = (
+            select(executions_table.c.id)
+            .where(executions_table.c.expires_at <= now)
+            .limit(chunk_size)
+            .scalar_subquery()
+        )
+        return conn.execute(delete(executions_table).where(executions_table.c.id.in_(expired_ids))).rowcount
+
+    @staticmethod
+    def _to_row(record: ExecutionRecord) -> Dict[str, Any]:
+        row = record.to_dict()
+        row["data"] = json.dumps(record.data, ensure_ascii=False, separators=(",", ":"), default=str)
+        return row
+
+    @staticmethod
+    def _from_row(row: Dict[str, Any]) -> ExecutionRecord:
+        return ExecutionRecord(**{**row, "data": json.loads(row["data"])})
+
+
+def create_sql_engine(url: str = DEFAULT_DATABASE_URL) -> Engine:
+    """创建SQLAlchemy引擎；SQLite启用WAL，内存数据库在线程间共享同一个连接"""
+    kwargs: Dict[str, Any] = {}
+    if url.startswith("sqlite"):
+        kwargs["connect_args"] = {"check_same_thread": False}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            kwargs["poolclass"] = StaticPool
+    engine = create_engine(url, **kwargs)
+
+    if engine.dialect.name == "sqlite":
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragma(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            cursor.close()
+
+    metadata.create_all(engine)
+    return engine
+
+
+class Storage:
+    """存储入口：同一个数据库上的工作流存储与执行记录存储"""
+
+    def __init__(self, url: str = DEFAULT_DATABASE_URL, workflows: Optional[WorkflowStore] = None,
+                 executions: Optional[ExecutionStore] = None, **execution_options):
+        """
+        Args:
+            url: SQLAlchemy数据库URL（提供了自定义的两个存储时不使用）
+            workflows: 自定义工作流存储
+            executions: 自定义执行记录存储
+            execution_options: 传给 SqlExecutionStore 的参数（batch_size、default_ttl等）
+        """
+        self.engine: Optional[Engine] = None
+        if workflows is None or executions is None:
+            self.engine = create_sql_engine(url)
+        self.workflows = workflows or SqlWorkflowStore(self.engine)
+        self.executions = executions or SqlExecutionStore(self.engine, **execution_options)
+
+    async def close(self):
+        await self.executions.close()
+        if self.engine is not None:
+            self.engine.dispose()
+
+
+# 默认保留时间：工作流执行记录30天，浏览器自动化任务7天
+DEFAULT_EXECUTION_TTL = 30 * 24 * 3600
+DEFAULT_AUTOMATION_TASK_TTL = 7 * 24 * 3600
+
+
+def _env_ttl(name: str, default: float) -> Optional[float]:
+    """读取保留时间，设为0表示永久保留"""
+    value = float(os.environ.get(name, default))
+    return value if value > 0 else None
+
+
+_default_storage: Optional[Storage] = None
+
+
+def get_storage() -> Storage:
+    """
+    进程内共享的默认存储，由环境变量配置：
+    DATABASE_URL、EXECUTION_TTL_SECONDS、AUTOMATION_TASK_TTL_SECONDS
+    """
+    global _default_storage
+    if _default_storage is None:
+        _default_storage = Storage(
+            os.environ.get("DATABASE_URL", DEFAULT_DATABASE_URL),
+            default_ttl=_env_ttl("EXECUTION_TTL_SECONDS", DEFAULT_EXECUTION_TTL),
+            ttl_by_kind={"automation": _env_ttl("AUTOMATION_TASK_TTL_SECONDS", DEFAULT_AUTOMATION_TASK_TTL)},
+        )
+    return _default_storage
@@ -0,0 +1,104 @@
+"""
+模板引擎
+{{变量}} 模板只解析一次，得到文本片段与预先拆分好的路径访问器，渲染时直接拼接
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import Any, Dict, List, Tuple, Union
+
+_PLACEHOLDER = re.compile(r'\{\{\s*(.+?)\s*\}\}')
+
+# 变量不存在时的标记
+_MISSING = object()
+
+
+class CompiledTemplate:
+    """编译后的模板：文本片段与 (路径, 原始占位符) 交替组成"""
+
+    __slots__ = ("source", "segments", "is_static")
+
+    def __init__(self, source: str):
+        self.source = source
+        segments: List[Union[str, Tuple[Tuple[str, ...], str]]] = []
+        last = 0
+        for match in _PLACEHOLDER.finditer(source):
+            if match.start() > last:
+                segments.append(source[last:match.start()])
+            path = tuple(match.group(1).strip().split('.'))
+            segments.append((path, match.group(0)))
+            last = match.end()
+        if last < len(source):
+            segments.append(source[last:])
+        self.segments = segments
+        self.is_static = all(isinstance(segment, str) for segment in segments)
+
+    def render(self, data: Dict[str, Any]) -> str:
+        """用数据渲染模板，不存在的变量保留原始占位符"""
+        if self.is_static:
+            return self.source
+
+        parts = []
+        for segment in self.segments:
+            if isinstance(segment, str):
+                parts.append(segment)
+                continue
+            path, placeholder = segment
+            value = _resolve(data, path)
+            if value is _MISSING:
+                parts.append(placeholder)
+            elif isinstance(value, (dict, list)):
+                # 如果值是复杂类型，转换为JSON字符串
+                parts.append(json.dumps(value))
+            else:
+                parts.append(str(value))
+        return "".join(parts)
+
+
+def _resolve(data: Any, path: Tuple[str, ...]) -> Any:
+    current = data
+    for part in path:
+        if isinstance(current, dict) and part in current:
+            current = current[part]
+        else:
+            return _MISSING
+    return current
+
+
+@lru_cache(maxsize=4096)
+def compile_template(template: str) -> CompiledTemplate:
+    """编译模板，相同模板只解析一次"""
+    return CompiledTemplate(template)
+
+
+def render_template(template: Any, data: Dict[str, Any]) -> Any:
+    """渲染字符串模板，非字符串原样返回"""
+    if not template or not isinstance(template, str) or "{{" not in template:
+        return template
+    return compile_template(template).render(data)
+
+
+def render_value(value: Any, data: Dict[str, Any]) -> Any:
+    """递归渲染字典/列表中的所有字符串模板（键与值），不含模板的部分原样保留"""
+    if isinstance(value, str):
+        return render_template(value, data)
+    if isinstance(value, dict):
+        return {render_template(k, data): render_value(v, data) for k, v in value.items()}
+    if isinstance(value, list):
+        return [render_value(item, data) for item in value]
+    return value
+
+
+def precompile_value(value: Any):
+    """预编译字典/列表中出现的所有模板"""
+    if isinstance(value, str):
+        if "{{" in value:
+            compile_template(value)
+    elif isinstance(value, dict):
+        for k, v in value.items():
+            precompile_value(k)
+            precompile_value(v)
+    elif isinstance(value, list):
+        for item in value:
+            precompile_value(item)
@@ -0,0 +1,398 @@
+"""
+Webhook触发
+工作流在 triggers 中声明 {"type": "webhook", "path": "orders/new"} 后，
+请求 /webhook/orders/new 即提交一次执行。
+
+- 路由表在启动与工作流变更时预先计算，请求时按路径直接查字典，不读数据库
+- 以独立的ASGI应用挂载，不经过FastAPI的路由匹配、依赖解析与响应模型序列化
+- 请求体按Content-Type解析，JSON优先使用orjson；超过 max_body_size 的请求返回413
+- 认证类请求头（Authorization、Cookie等）不写入执行输入，避免随执行记录与检查点持久化
+- 触发器配置 secret 后，请求须带 X-Webhook-Signature: sha256=<以secret对原始请求体计算的HMAC-SHA256十六进制>，
+  缺少或不匹配时返回401
+- 同一时刻到达的请求合并为一次批量写入（组提交），每个请求仍对应一次执行
+- 配置 batch 后进入微批模式：同一工作流在 max_wait 秒内（或攒满 max_size 个）的事件
+  合并为一次执行，输入为事件列表
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+try:
+    import orjson
+except ImportError:  # 可选依赖
+    orjson = None
+
+from .job_queue import ExecutionQueue, QueueFullError
+from .storage import WorkflowStore
+
+logger = logging.getLogger("workflow-engine")
+
+WEBHOOK_TRIGGER_TYPE = "webhook"
+DEFAULT_METHODS = ("POST",)
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+# 不写入执行输入的请求头（小写）
+CREDENTIAL_HEADERS = frozenset({"authorization", "proxy-authorization", "cookie", "x-api-key"})
+SIGNATURE_HEADER = "x-webhook-signature"
+SIGNATURE_PREFIX = "sha256="
+
+
+class WebhookError(ValueError):
+    """Webhook配置无效"""
+
+
+def normalize_path(path: str) -> str:
+    return "/".join(part for part in path.split("/") if part)
+
+
+def dumps(value: Any) -> bytes:
+    """序列化响应体"""
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def sign_body(secret: str, body: bytes) -> str:
+    """请求体签名（X-Webhook-Signature 的值）"""
+    return SIGNATURE_PREFIX + hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """校验请求体签名（常数时间比较）"""
+    if not signature:
+        return False
+    return hmac.compare_digest(sign_body(secret, body), signature.strip())
+
+
+def parse_body(body: bytes, content_type: Optional[str]) -> Any:
+    """
+    按Content-Type解析请求体：JSON（含未声明类型但形如JSON的内容）、表单，其余作为文本
+
+    Raises:
+        ValueError: 声明为JSON但内容无效
+    """
+    if not body:
+        return None
+    content_type = (content_type or "").split(";", 1)[0].strip().lower()
+    if content_type == "application/x-www-form-urlencoded":
+        return dict(parse_qsl(body.decode("utf-8", errors="replace"), keep_blank_values=True))
+    if content_type.endswith("json") or (not content_type and body[:1] in (b"{", b"[")):
+        return orjson.loads(body) if orjson is not None else json.loads(body)
+    return body.decode("utf-8", errors="replace")
+
+
+@dataclass
+class WebhookRoute:
+    """一个Webhook路径对应的工作流"""
+    path: str
+    workflow_id: int
+    workflow: Dict[str, Any]
+    methods: Tuple[str, ...] = DEFAULT_METHODS
+    # 微批：单批最多事件数与最长等待时间（秒），batch_size 为0时不合并
+    batch_size: int = 0
+    batch_wait: float = 0.05
+    # 签名密钥，设置后只接受带有效签名的请求
+    secret: Optional[str] = field(default=None, repr=False)
+
+    @staticmethod
+    def from_config(workflow_id: int, workflow: Dict[str, Any], config: Dict[str, Any]) -> "WebhookRoute":
+        path = normalize_path(str(config.get("path") or ""))
+        if not path:
+            raise WebhookError("webhook触发器需要path")
+        methods = config.get("methods") or config.get("method") or DEFAULT_METHODS
+        if isinstance(methods, str):
+            methods = (methods,)
+        batch = config.get("batch") or {}
+        batch_size = int(batch.get("max_size", 100)) if batch else 0
+        batch_wait = float(batch.get("max_wait", 0.05)) if batch else 0.05
+        if batch and (batch_size < 1 or batch_wait < 0):
+            raise WebhookError("webhook微批配置无效")
+        secret = config.get("secret")
+        if secret is not None and (not isinstance(secret, str) or not secret):
+            raise WebhookError("webhook的secret必须是非空字符串")
+        return WebhookRoute(
+            path=path,
+            workflow_id=workflow_id,
+            workflow=workflow,
+            methods=tuple(method.upper() for method in methods),
+            batch_size=batch_size,
+            batch_wait=batch_wait,
+            secret=secret,
+        )
+
+
+def webhook_routes(workflow: Dict[str, Any]) -> List[WebhookRoute]:
+    """工作流声明的Webhook路由，未启用的工作流没有路由"""
+    if not workflow.get("active", True):
+        return []
+    return [
+        WebhookRoute.from_config(workflow["id"], workflow, config)
+        for config in workflow.get("triggers") or ()
+        if config.get("type") == WEBHOOK_TRIGGER_TYPE
+    ]
+
+
+class WebhookRouter:
+    """路径 → 工作流的路由表"""
+
+    def __init__(self):
+        self.routes: Dict[str, WebhookRoute] = {}
+        self._by_workflow: Dict[int, List[str]] = {}
+
+    def match(self, path: str) -> Optional[WebhookRoute]:
+        route = self.routes.get(path)
+        if route is None:
+            route = self.routes.get(normalize_path(path))
+        return route
+
+    def conflicts(self, workflow: Dict[str, Any]) -> List[str]:
+        """已被其他工作流占用的路径"""
+        return [
+            route.path for route in webhook_routes({**workflow, "active": True})
+            if route.path in self.routes and self.routes[route.path].workflow_id != workflow.get("id")
+        ]
+
+    async def load(self, workflows: WorkflowStore, page_size: int = 500):
+        """从工作流存储加载全部路由"""
+        after_id = None
+        while True:
+            page = await workflows.list(limit=page_size, after_id=after_id)
+            if not page:
+                break
+            after_id = page[-1]["id"]
+            for workflow in page:
+                try:
+                    self.sync_workflow(workflow)
+                except (WebhookError, TypeError, ValueError) as e:
+                    logger.warning(f"工作流 {workflow['id']} 的webhook触发器无效: {str(e)}")
+        logger.info(f"已加载 {len(self.routes)} 个webhook路由")
+
+    def sync_workflow(self, workflow: Dict[str, Any]):
+        routes = webhook_routes(workflow)
+        self.remove_workflow(workflow["id"])
+        for route in routes:
+            self.routes[route.path] = route
+        self._by_workflow[workflow["id"]] = [route.path for route in routes]
+
+    def remove_workflow(self, workflow_id: int):
+        for path in self._by_workflow.pop(workflow_id, ()):
+            route = self.routes.get(path)
+            if route is not None and route.workflow_id == workflow_id:
+                del self.routes[path]
+
+
+@dataclass
+class _Batch:
+    route: WebhookRoute
+    execution_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    events: List[Dict[str, Any]] = field(default_factory=list)
+    done: Optional[asyncio.Future] = None
+    timer: Optional[asyncio.TimerHandle] = None
+    closed: bool = False
+
+
+class WebhookIngestor:
+    """把Webhook事件提交为执行：组提交，以及可选的按工作流微批"""
+
+    def __init__(self, queue: ExecutionQueue, max_group: int = 1000):
+        """
+        Args:
+            queue: 执行队列
+            max_group: 单次组提交写入的执行数上限
+        """
+        self.queue = queue
+        self.max_group = max_group
+        self.received = 0
+        self.executions = 0
+        self._pending: List[Tuple[Tuple[Any, ...], asyncio.Future]] = []
+        self._writer: Optional[asyncio.Task] = None
+        self._batches: Dict[int, _Batch] = {}
+
+    async def ingest(self, route: WebhookRoute, event: Dict[str, Any]) -> Tuple[str, int]:
+        """
+        提交一个事件，执行记录与任务落盘后返回
+
+        Returns:
+            (执行id, 该执行包含的事件数)
+
+        Raises:
+            QueueFullError: 执行队列已满
+        """
+        self.received += 1
+        if route.batch_size:
+            return await self._add_to_batch(route, event)
+        execution_id = str(uuid.uuid4())
+        await self._submit(route, {"webhook": event}, execution_id)
+        return execution_id, 1
+
+    async def _add_to_batch(self, route: WebhookRoute, event: Dict[str, Any]) -> Tuple[str, int]:
+        batch = self._batches.get(route.workflow_id)
+        if batch is None or batch.route is not route:
+            if batch is not None:
+                # 路由已变更（工作流被更新），先提交旧批次
+                self._close_batch(batch)
+            loop = asyncio.get_running_loop()
+            batch = _Batch(route=route, done=loop.create_future())
+            batch.timer = loop.call_later(route.batch_wait, self._close_batch, batch)
+            self._batches[route.workflow_id] = batch
+        batch.events.append(event)
+        if len(batch.events) >= route.batch_size:
+            self._close_batch(batch)
+        await asyncio.shield(batch.done)
+        return batch.execution_id, len(batch.events)
+
+    def _close_batch(self, batch: _Batch):
+        if self._batches.get(batch.route.workflow_id) is batch:
+            del self._batches[batch.route.workflow_id]
+        if batch.timer is not None:
+            batch.timer.cancel()
+            batch.timer = None
+        if batch.closed:
+            return
+        batch.closed = True
+        input_data = {"webhook": {"path": batch.route.path, "events": batch.events}}
+        written = self._submit(batch.route, input_data, batch.execution_id)
+        written.add_done_callback(lambda f: _propagate(f, batch.done))
+
+    def _submit(self, route: WebhookRoute, input_data: Dict[str, Any], execution_id: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(((route.workflow_id, route.workflow, input_data, execution_id), future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.ensure_future(self._write())
+        return future
+
+    async def _write(self):
+        # 上一次写入期间到达的请求在下一次写入中一并提交
+        while self._pending:
+            group, self._pending = self._pending[:self.max_group], self._pending[self.max_group:]
+            try:
+                await self.queue.submit_many([submission for submission, _ in group])
+            except Exception as e:
+                for _, future in group:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.executions += len(group)
+            for _, future in group:
+                if not future.done():
+                    future.set_result(None)
+
+    async def flush(self):
+        """提交所有未满的批次并等待写入完成"""
+        for batch in list(self._batches.values()):
+            self._close_batch(batch)
+        while self._writer is not None and not self._writer.done():
+            await asyncio.shield(self._writer)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "received": self.received,
+            "executions": self.executions,
+            "open_batches": len(self._batches),
+        }
+
+
+class RequestBodyTooLargeError(Exception):
+    """请求体超过上限"""
+
+
+class WebhookEndpoint:
+    """处理 /webhook/{path} 请求的ASGI应用"""
+
+    def __init__(self, router: WebhookRouter, ingestor: WebhookIngestor,
+                 max_body_size: int = DEFAULT_MAX_BODY_SIZE):
+        """
+        Args:
+            router: 路由表
+            ingestor: 事件提交
+            max_body_size: 请求体的最大字节数
+        """
+        self.router = router
+        self.ingestor = ingestor
+        self.max_body_size = max_body_size
+
+    async def __call__(self, scope, receive, send):
+        response = await self.handle(Request(scope, receive))
+        await response(scope, receive, send)
+
+    async def handle(self, request: Request) -> Response:
+        route = self.router.match(request.scope["path"])
+        if route is None:
+            return _json_response({"detail": "webhook未找到"}, 404)
+        if request.method not in route.methods:
+            return _json_response({"detail": "webhook不支持该请求方法"}, 405)
+        try:
+            raw_body = await self._read_body(request)
+        except RequestBodyTooLargeError:
+            return _json_response({"detail": f"请求体超过 {self.max_body_size} 字节"}, 413)
+        if route.secret is not None and not verify_signature(route.secret, raw_body, request.headers.get(SIGNATURE_HEADER)):
+            return _json_response({"detail": "webhook签名缺失或无效"}, 401)
+        try:
+            body = parse_body(raw_body, request.headers.get("content-type"))
+        except ValueError:
+            return _json_response({"detail": "请求体不是有效的JSON"}, 400)
+
+        headers = {name: value for name, value in request.headers.items() if name not in CREDENTIAL_HEADERS}
+        event = webhook_event(request.method, route.path, body, dict(request.query_params), headers)
+        try:
+            execution_id, events = await self.ingestor.ingest(route, event)
+        except QueueFullError:
+            return _json_response({"detail": "执行队列已满，请稍后重试"}, 429, {"Retry-After": "1"})
+        return _json_response({"execution_id": execution_id, "status": "queued", "events": events}, 202)
+
+    async def _read_body(self, request: Request) -> bytes:
+        """
+        读取请求体，Content-Length 超过上限时不读取，分块传输的请求体读到超过上限即停止
+
+        Raises:
+            RequestBodyTooLargeError: 请求体超过 max_body_size
+        """
+        declared = request.headers.get("content-length", "")
+        if declared.isdigit() and int(declared) > self.max_body_size:
+            raise RequestBodyTooLargeError()
+        chunks = []
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > self.max_body_size:
+                raise RequestBodyTooLargeError()
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+
+def _json_response(content: Any, status_code: int, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=dumps(content), status_code=status_code, headers=headers, media_type="application/json")
+
+
+def _propagate(source: asyncio.Future, future: asyncio.Future):
+    if future.done():
+        return
+    if source.cancelled():
+        future.cancel()
+    elif source.exception() is not None:
+        future.set_exception(source.exception())
+    else:
+        future.set_result(None)
+
+
+def webhook_event(method: str, path: str, body: Any, query: Dict[str, str], headers: Dict[str, str]
+                  ) -> Dict[str, Any]:
+    """执行输入中的单个Webhook事件"""
+    return {
+        "method": method,
+        "path": path,
+        "body": body,
+        "query": query,
+        "headers": headers,
+        "received_at": time.time(),
+    }
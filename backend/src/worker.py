@@ -0,0 +1,308 @@
+"""
+工作流执行worker
+从任务队列租用执行任务并在 WorkflowEngine 上运行，可独立于API进程部署多个实例。
+执行期间定期续租；进程崩溃时租约到期，任务由其他worker重试
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import socket
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from .engine import WorkflowEngine
+from .checkpoints import DEFAULT_CHECKPOINT_MAX_AGE, CheckpointStore, create_checkpoint_store
+from .execution_context import ExecutionContext
+from .execution_streams import ExecutionStreamBroker
+from .ai_cache import AIResponseCache
+from .ai_providers import AIConfig
+from .http_pool import HttpPoolConfig
+from .resilience import CircuitBreakerRegistry
+from .job_queue import (
+    WORKFLOW_EXECUTION_KIND, JobQueue, LatencyStats, QueuedJob, create_job_queue,
+)
+from .storage import ExecutionRecord, ExecutionStore, get_storage
+
+logger = logging.getLogger("workflow-engine")
+
+
+class ExecutionWorker:
+    """执行worker：concurrency 个协程并发租用并执行任务"""
+
+    def __init__(self, engine: WorkflowEngine, jobs: JobQueue, store: ExecutionStore, concurrency: int = 4,
+                 visibility_timeout: float = 60.0, poll_interval: float = 0.5, worker_id: Optional[str] = None,
+                 checkpoints: Optional[CheckpointStore] = None, streams: Optional[ExecutionStreamBroker] = None):
+        """
+        Args:
+            engine: 工作流引擎
+            jobs: 任务队列
+            store: 执行记录存储
+            concurrency: 同时执行的任务数
+            visibility_timeout: 租约时长（秒），执行期间每 1/3 租约时长续租一次
+            poll_interval: 队列为空时的最长轮询间隔（秒）
+            worker_id: worker标识，默认为 主机名:进程号:随机后缀
+            checkpoints: 检查点存储，设置后每个节点完成即写入检查点，重试/恢复时跳过已完成节点
+            streams: 执行事件流，设置后向订阅者推送流式节点的片段与节点完成事件（内嵌在API进程时使用）
+        """
+        if concurrency < 1:
+            raise ValueError("concurrency 至少为1")
+        self.engine = engine
+        self.jobs = jobs
+        self.store = store
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.checkpoints = checkpoints
+        self.streams = streams
+        self.wait_time = LatencyStats()
+        self.run_time = LatencyStats()
+        self.completed = 0
+        self.abandoned = 0
+        self.suspended = 0
+        self.busy = 0
+        self._stopping = False
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        """启动租用协程（需在事件循环中调用）"""
+        if self._tasks:
+            return
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._loop(), name=f"execution-worker-{i}") for i in range(self.concurrency)
+        ]
+        if self.checkpoints is not None:
+            self.checkpoints.start_retention(
+                float(os.environ.get("CHECKPOINT_SWEEP_INTERVAL", 3600)),
+                float(os.environ.get("CHECKPOINT_MAX_AGE_SECONDS", DEFAULT_CHECKPOINT_MAX_AGE)),
+            )
+        logger.info(f"执行worker {self.worker_id} 已启动，并发数 {self.concurrency}")
+
+    async def stop(self, drain: bool = True):
+        """
+        停止worker
+
+        Args:
+            drain: True时不再租用新任务并等待执行中的任务完成；
+                   False时立即取消，执行中的任务释放回队列
+        """
+        self._stopping = True
+        if not drain:
+            for task in self._tasks:
+                task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.checkpoints is not None:
+            self.checkpoints.stop_retention()
+        await self.store.flush()
+
+    async def run_until_idle(self):
+        """处理任务直到队列中没有可见任务（测试与一次性批处理使用）"""
+        while True:
+            job = await self.jobs.lease(self.worker_id, self.visibility_timeout)
+            if job is None:
+                return
+            await self.process(job)
+
+    async def _loop(self):
+        idle = 0.01
+        while not self._stopping:
+            job = await self.jobs.lease(self.worker_id, self.visibility_timeout)
+            if job is None:
+                # 队列为空时逐步退避轮询，有任务时立即继续
+                await asyncio.sleep(idle)
+                idle = min(idle * 2, self.poll_interval)
+                continue
+            idle = 0.01
+            try:
+                await self.process(job)
+            except asyncio.CancelledError:
+                await self.jobs.release(job)
+                raise
+            except Exception as e:
+                logger.error(f"处理任务 {job.id} 失败: {str(e)}")
+
+    async def process(self, job: QueuedJob):
+        """执行一个已租用的任务：更新执行记录、定期续租、完成后确认"""
+        record = await self.store.get(job.id, kind=WORKFLOW_EXECUTION_KIND) or ExecutionRecord(
+            id=job.id, kind=WORKFLOW_EXECUTION_KIND, status="queued",
+            workflow_id=job.payload.get("workflow_id"), data={"queued_at": job.enqueued_at},
+        )
+        record.data["attempts"] = job.attempts
+
+        if job.exhausted:
+            # 之前的worker都在执行中途退出，不再重试
+            self.abandoned += 1
+            record.status = "error"
+            record.data["message"] = f"执行被中断 {job.attempts - 1} 次，已放弃重试"
+            record.data["finished_at"] = time.time()
+            await self._finish(job, record)
+            return
+
+        waited = max(0.0, time.time() - record.data.get("queued_at", job.enqueued_at))
+        self.wait_time.add(waited)
+        record.status = "running"
+        record.data["worker"] = self.worker_id
+        record.data["started_at"] = time.time()
+        record.data["wait_time"] = waited
+        await self.store.save(record)
+
+        context = ExecutionContext(execution_id=job.id, wake_times=dict(job.payload.get("wake_times") or {}))
+        if self.checkpoints is not None:
+            # 有检查点才能在长延迟处挂起并在唤醒后恢复
+            context.suspendable = True
+            restored = await self.checkpoints.restore(context)
+            if restored:
+                logger.info(f"执行 {job.id} 从检查点恢复 {restored} 个节点")
+            record.data["restored_nodes"] = restored
+            self.checkpoints.attach(context)
+        if self.streams is not None:
+            self.streams.attach(context)
+
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        self.busy += 1
+        started = time.monotonic()
+        try:
+            result = await self.engine.execute_workflow(
+                job.payload["workflow"], job.payload.get("input_data"), context=context
+            )
+        finally:
+            self.busy -= 1
+            heartbeat.cancel()
+        elapsed = time.monotonic() - started
+        self.run_time.add(elapsed)
+
+        if result.get("status") == "suspended":
+            await self._suspend(job, record, result, elapsed)
+            return
+
+        record.status = result.get("status", "error")
+        if record.status == "success":
+            record.data["results"] = result.get("results")
+        else:
+            record.data["message"] = result.get("message")
+        record.data["finished_at"] = time.time()
+        record.data["run_time"] = record.data.get("run_time", 0) + elapsed
+        await self._finish(job, record)
+        if self.streams is not None:
+            self.streams.close(job.id, record.status, results=record.data.get("results"),
+                               message=record.data.get("message"))
+
+        if self.checkpoints is not None:
+            if record.status == "success" and not _has_node_errors(result.get("results")):
+                # 全部节点成功，结果已在执行记录中，检查点不再需要
+                await self.checkpoints.delete(job.id)
+            else:
+                await self.checkpoints.flush()
+
+    async def _suspend(self, job: QueuedJob, record: ExecutionRecord, result: Dict[str, Any], elapsed: float):
+        """执行挂起：保存检查点与状态后把任务推迟到唤醒时间，本进程不再保留任何执行状态"""
+        resume_at = result["resume_at"]
+        record.status = "suspended"
+        record.data["resume_at"] = resume_at
+        # 恢复后的排队耗时从唤醒时间算起
+        record.data["queued_at"] = resume_at
+        record.data["run_time"] = record.data.get("run_time", 0) + elapsed
+        await self.checkpoints.flush()
+        await self.store.save(record)
+        await self.store.flush()
+        payload = {**job.payload, "wake_times": result["wake_times"]}
+        if not await self.jobs.reschedule(job, resume_at, payload):
+            logger.warning(f"任务 {job.id} 的租约已过期，挂起状态可能被其他worker覆盖")
+        self.suspended += 1
+        if self.streams is not None:
+            self.streams.close(job.id, "suspended", resume_at=resume_at)
+
+    async def _finish(self, job: QueuedJob, record: ExecutionRecord):
+        if self.checkpoints is not None:
+            await self.checkpoints.flush()
+        # 执行结果先落盘再确认，确认前崩溃只会导致重复执行而不会丢失结果
+        await self.store.save(record)
+        await self.store.flush()
+        if not await self.jobs.ack(job):
+            logger.warning(f"任务 {job.id} 的租约已过期，结果可能被其他worker覆盖")
+        self.completed += 1
+
+    async def _heartbeat(self, job: QueuedJob):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 3)
+            if not await self.jobs.extend(job, self.visibility_timeout):
+                logger.warning(f"任务 {job.id} 续租失败")
+                return
+
+    def metrics(self):
+        """本worker的执行统计"""
+        return {
+            "worker_id": self.worker_id,
+            "concurrency": self.concurrency,
+            "busy": self.busy,
+            "completed": self.completed,
+            "abandoned": self.abandoned,
+            "suspended": self.suspended,
+            "wait_time": self.wait_time.summary(),
+            "run_time": self.run_time.summary(),
+            "circuit_breakers": self.engine.circuit_breakers.stats(),
+            "ai": self.engine.ai.stats(),
+            "ai_cache": self.engine.ai_cache.stats(),
+        }
+
+
+def _has_node_errors(results) -> bool:
+    return any(isinstance(result, dict) and "error" in result for result in (results or {}).values())
+
+
+async def run_worker(concurrency: int, visibility_timeout: float, poll_interval: float):
+    """按环境变量配置的存储运行worker，收到SIGINT/SIGTERM后执行完手上的任务再退出"""
+    storage = get_storage()
+    engine = WorkflowEngine(
+        http_config=HttpPoolConfig.from_env(),
+        suspend_threshold=float(os.environ.get("DELAY_SUSPEND_THRESHOLD", 60)),
+        circuit_breakers=CircuitBreakerRegistry.from_env(),
+        ai_config=AIConfig.from_env(),
+        ai_cache=AIResponseCache.from_env(storage.engine),
+    )
+    worker = ExecutionWorker(
+        engine,
+        create_job_queue(storage.engine),
+        storage.executions,
+        concurrency=concurrency,
+        visibility_timeout=visibility_timeout,
+        poll_interval=poll_interval,
+        checkpoints=create_checkpoint_store(storage.engine),
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    await engine.start()
+    worker.start()
+    try:
+        await stop_event.wait()
+        logger.info(f"执行worker {worker.worker_id} 正在停止")
+        await worker.stop(drain=True)
+    finally:
+        await worker.stop(drain=False)
+        await engine.aclose()
+        await storage.close()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_worker(
+        concurrency=int(os.environ.get("WORKER_CONCURRENCY", 4)),
+        visibility_timeout=float(os.environ.get("WORKER_VISIBILITY_TIMEOUT", 60)),
+        poll_interval=float(os.environ.get("WORKER_POLL_INTERVAL", 0.5)),
+    ))
+
+
+if __name__ == "__main__":
+    main()
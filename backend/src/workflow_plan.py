@@ -0,0 +1,189 @@
+"""
+工作流执行计划
+将工作流定义编译为不可变的执行计划，并按内容哈希缓存复用
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Callable, Dict, List, Any, Mapping, Optional, Tuple
+
+
+class WorkflowCycleError(ValueError):
+    """工作流中存在循环依赖"""
+
+    def __init__(self, node_ids: List[str]):
+        self.node_ids = node_ids
+        super().__init__(f"工作流存在循环依赖: {', '.join(node_ids)}")
+
+
+@dataclass(frozen=True)
+class ExecutionPlan:
+    """编译后的工作流执行计划（不可变）"""
+    plan_hash: str
+    nodes: Mapping[str, Dict[str, Any]]
+    successors: Mapping[str, Tuple[str, ...]]
+    predecessors: Mapping[str, Tuple[str, ...]]
+    topological_order: Tuple[str, ...]
+    start_nodes: Tuple[str, ...]
+    # 声明 start_on_partial 的节点 -> 启动所需的上游部分输出字符数
+    partial_starts: Mapping[str, int] = field(default_factory=lambda: MappingProxyType({}))
+
+
+def workflow_hash(workflow: Dict[str, Any]) -> str:
+    """计算工作流图结构（节点与连接）的内容哈希"""
+    return _canonical_hash(_canonical_definition(workflow))
+
+
+def compile_workflow(workflow: Dict[str, Any]) -> ExecutionPlan:
+    """
+    编译工作流定义
+
+    Args:
+        workflow: 包含 nodes 和 connections 的工作流定义
+
+    Returns:
+        ExecutionPlan对象
+
+    Raises:
+        WorkflowCycleError: 工作流存在循环依赖
+    """
+    canonical = _canonical_definition(workflow)
+    return _compile(json.loads(canonical), _canonical_hash(canonical))
+
+
+def _canonical_definition(workflow: Dict[str, Any]) -> str:
+    return json.dumps(
+        {"nodes": workflow.get("nodes", []), "connections": workflow.get("connections", [])},
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+
+
+def _canonical_hash(canonical: str) -> str:
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def _compile(definition: Dict[str, Any], plan_hash: str) -> ExecutionPlan:
+    # 节点索引：ID -> 节点定义（定义来自规范化副本，不与调用方共享）
+    nodes = {node["id"]: node for node in definition["nodes"]}
+
+    # 正向与反向邻接表，重复的连接只保留一条
+    successors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+    predecessors: Dict[str, List[str]] = {node_id: [] for node_id in nodes}
+    seen = set()
+    for connection in definition["connections"]:
+        source = connection.get("source")
+        target = connection.get("target")
+        if not source or not target or (source, target) in seen:
+            continue
+        seen.add((source, target))
+        successors.setdefault(source, []).append(target)
+        successors.setdefault(target, [])
+        predecessors.setdefault(target, []).append(source)
+        predecessors.setdefault(source, [])
+
+    # Kahn 算法求拓扑序，剩余未排序的节点即构成环
+    remaining = {node_id: len(sources) for node_id, sources in predecessors.items()}
+    queue = [node_id for node_id, count in remaining.items() if count == 0]
+    order = []
+    while queue:
+        node_id = queue.pop()
+        order.append(node_id)
+        for target in successors[node_id]:
+            remaining[target] -= 1
+            if remaining[target] == 0:
+                queue.append(target)
+
+    if len(order) < len(remaining):
+        ordered = set(order)
+        raise WorkflowCycleError(sorted(node_id for node_id in remaining if node_id not in ordered))
+
+    return ExecutionPlan(
+        plan_hash=plan_hash,
+        nodes=MappingProxyType(nodes),
+        successors=MappingProxyType({k: tuple(v) for k, v in successors.items()}),
+        predecessors=MappingProxyType({k: tuple(v) for k, v in predecessors.items()}),
+        topological_order=tuple(order),
+        start_nodes=tuple(node_id for node_id in nodes if not predecessors[node_id]),
+        partial_starts=MappingProxyType({
+            node_id: _partial_start_chars(node["start_on_partial"])
+            for node_id, node in nodes.items() if node.get("start_on_partial") and predecessors[node_id]
+        }),
+    )
+
+
+def _partial_start_chars(value: Any) -> int:
+    """start_on_partial 可为 true（收到首个片段即启动）或 {"min_chars": 字符数}"""
+    if isinstance(value, dict):
+        try:
+            return max(1, int(value.get("min_chars", 1)))
+        except (TypeError, ValueError):
+            return 1
+    return 1
+
+
+class PlanCache:
+    """按内容哈希缓存执行计划的LRU缓存"""
+
+    def __init__(self, max_size: int = 128, on_compile: Optional[Callable[[ExecutionPlan], None]] = None):
+        """
+        初始化计划缓存
+
+        Args:
+            max_size: 最多缓存的计划数量
+            on_compile: 计划编译完成后调用，用于预编译节点级的表达式、模板等
+        """
+        self.max_size = max_size
+        self.on_compile = on_compile
+        self.hits = 0
+        self.misses = 0
+        self._plans: "OrderedDict[str, ExecutionPlan]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_plan(self, workflow: Dict[str, Any]) -> ExecutionPlan:
+        """
+        获取工作流的执行计划，定义未变化时复用已编译的计划
+
+        Args:
+            workflow: 工作流定义
+
+        Returns:
+            ExecutionPlan对象
+        """
+        canonical = _canonical_definition(workflow)
+        plan_hash = _canonical_hash(canonical)
+
+        with self._lock:
+            plan = self._plans.get(plan_hash)
+            if plan is not None:
+                self._plans.move_to_end(plan_hash)
+                self.hits += 1
+                return plan
+            self.misses += 1
+
+        plan = _compile(json.loads(canonical), plan_hash)
+        if self.on_compile is not None:
+            self.on_compile(plan)
+
+        with self._lock:
+            self._plans[plan_hash] = plan
+            self._plans.move_to_end(plan_hash)
+            while len(self._plans) > self.max_size:
+                self._plans.popitem(last=False)
+        return plan
+
+    def invalidate(self, plan_hash: Optional[str] = None):
+        """清除指定计划，未指定时清空缓存"""
+        with self._lock:
+            if plan_hash is None:
+                self._plans.clear()
+            else:
+                self._plans.pop(plan_hash, None)
+
+    def __len__(self) -> int:
+        return len(self._plans)
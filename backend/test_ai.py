@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+AI节点测试
+覆盖按模型限流、微批、响应缓存与流式输出
+"""
+
+import asyncio
+import time
+
+from src.ai_cache import AIResponseCache, create_ai_cache_store
+from src.ai_mock_server import create_mock_app
+from src.ai_providers import AIConfig, AIGateway, ModelLimits, SimulatedProvider
+from src.engine import WorkflowEngine
+from src.execution_context import ExecutionContext
+from src.execution_streams import ExecutionStreamBroker, sse_message
+from src.storage import Storage
+from testsupport import mock_ai_engine, run_tests, run_with_sqlite_file
+
+
+def test_ai_rate_limits_and_batching():
+    """测试AI节点：按模型限流不触发提供方429、429后按Retry-After重试、批量接口微批"""
+    def ai_workflow(count, tag):
+        return {"nodes": [
+            {"id": f"ai{i}", "type": "ai", "config": {"model": "mock", "prompt": f"{tag} 提示词 {i}", "max_tokens": 8}}
+            for i in range(count)
+        ], "connections": []}
+    
+    def make_engine(limits, batch_endpoint=False):
+        mock = create_mock_app(latency=0.01, rpm=1200)
+        engine = mock_ai_engine(mock, batch_endpoint=batch_endpoint, limits={"mock": limits})
+        return engine, mock.state.provider.stats
+    
+    async def run():
+        # 未配置客户端限流：提供方每秒放行20个，超出的收到429后等待重试，最终全部成功
+        engine, stats = make_engine(ModelLimits())
+        results = (await engine.execute_workflow(ai_workflow(30, "a")))["results"]
+        assert all(r["response"].startswith("mock response") for r in results.values())
+        assert stats["rate_limited"] > 0 and stats["prompts"] == 30
+        assert engine.ai.stats()["rate_limited"] == stats["rate_limited"]
+        await engine.aclose()
+        
+        # 客户端按略低于提供方的速率限流：不再触发429
+        engine, stats = make_engine(ModelLimits(rpm=1100))
+        results = (await engine.execute_workflow(ai_workflow(30, "b")))["results"]
+        assert all("error" not in r for r in results.values())
+        assert results["ai0"]["usage"]["completion_tokens"] == 8
+        assert stats["rate_limited"] == 0 and stats["prompts"] == 30
+        await engine.aclose()
+        
+        # 支持批量接口时并发提示词合并为批量请求
+        engine, stats = make_engine(ModelLimits(rpm=1100, batch_size=8, batch_wait=0.05), batch_endpoint=True)
+        results = (await engine.execute_workflow(ai_workflow(32, "c")))["results"]
+        assert results["ai5"]["response"] == "mock response to: c 提示词 5"
+        assert stats["requests"] == 4 and stats["prompts"] == 32
+        assert engine.ai.stats() == {"calls": 32, "requests": 4, "rate_limited": 0}
+        await engine.aclose()
+        
+        # 超过桶容量（1000）的请求按容量扣除，之后按实际用量补扣，不退还未扣除的令牌
+        gateway = AIGateway(AIConfig(limits={"big": ModelLimits(tpm=60000)}),
+                            providers={"default": SimulatedProvider(latency=0)})
+        result = await gateway.complete("big", "word " * 4000)
+        bucket = gateway._state("default", "big").tokens
+        assert result["usage"]["total_tokens"] > 1000
+        assert bucket.tokens < 1000 - result["usage"]["total_tokens"] + 100
+        bucket.tokens = bucket.capacity
+        items = [item async for item in gateway.stream("big", "word " * 4000)]
+        assert bucket.tokens < 1000 - items[-1]["usage"]["total_tokens"] + 100
+        await gateway.http_pool.aclose()
+    
+    asyncio.run(run())
+
+
+def test_ai_response_cache_persists_and_reports_per_workflow():
+    """测试AI响应缓存：归一化提示词命中、参数参与缓存键、重启后仍命中、按工作流统计与条目数上限淘汰"""
+    def ai_workflow(prompt, **params):
+        return {"id": 7, "nodes": [{"id": "ai", "type": "ai", "config": {
+            "model": "mock", "prompt": prompt, "cache": {"normalize": True}, **params,
+        }}], "connections": []}
+    
+    async def run(path):
+        mock = create_mock_app(latency=0.01)
+        stats = mock.state.provider.stats
+        
+        def make_engine(storage):
+            return mock_ai_engine(mock, ai_cache=AIResponseCache(create_ai_cache_store(storage.engine)))
+        
+        storage = Storage(f"sqlite:///{path}")
+        engine = make_engine(storage)
+        first = (await engine.execute_workflow(ai_workflow("Hello   World")))["results"]["ai"]
+        assert first["cache"] == "miss"
+        # 空白与大小写不同的提示词命中同一条目
+        second = (await engine.execute_workflow(ai_workflow(" hello world ")))["results"]["ai"]
+        assert second["cache"] == "hit" and second["response"] == first["response"]
+        # 模型参数不同则不命中
+        third = (await engine.execute_workflow(ai_workflow("hello world", max_tokens=4)))["results"]["ai"]
+        assert third["cache"] == "miss"
+        assert stats["requests"] == 2
+        await engine.aclose()
+        await storage.close()
+        
+        # 重启后缓存与统计仍在
+        storage = Storage(f"sqlite:///{path}")
+        engine = make_engine(storage)
+        again = (await engine.execute_workflow(ai_workflow("HELLO WORLD")))["results"]["ai"]
+        assert again["cache"] == "hit" and stats["requests"] == 2
+        report = (await engine.ai_cache.workflow_stats(7))["7"]
+        assert report["hits"] == 2 and report["misses"] == 2 and report["hit_ratio"] == 0.5
+        assert report["tokens_saved"] == 2 * first["tokens"]
+        await engine.aclose()
+        
+        # 超过条目数上限时淘汰最久未访问的条目
+        cache = AIResponseCache(create_ai_cache_store(storage.engine, max_entries=3))
+        keys = [cache.make_key("mock", f"p{i}", {}) for i in range(6)]
+        for key in keys:
+            await cache.save(key, "mock", {"text": "x", "usage": {"total_tokens": 1}})
+        assert await cache.lookup(keys[0]) is None
+        assert await cache.lookup(keys[-1]) is not None
+        assert cache.store.evictions >= 3
+        await cache.flush()
+        await storage.close()
+    
+    run_with_sqlite_file(run, "cache.db")
+
+
+def test_ai_streaming_partial_output():
+    """测试流式AI节点：片段实时推送到事件流，声明 start_on_partial 的下游在部分输出上提前启动"""
+    engine = WorkflowEngine()
+    engine.ai.providers["default"] = SimulatedProvider(latency=0.2)
+    workflow = {"nodes": [
+        {"id": "chat", "type": "ai", "config": {"model": "m", "prompt": "讲一个很长的故事", "stream": True}},
+        {"id": "early", "type": "delay", "config": {"delay": 0}, "start_on_partial": {"min_chars": 8}},
+        {"id": "late", "type": "delay", "config": {"delay": 0}},
+    ], "connections": [{"source": "chat", "target": "early"}, {"source": "chat", "target": "late"}]}
+    
+    async def run():
+        broker = ExecutionStreamBroker()
+        context = ExecutionContext()
+        stream = broker.attach(context)
+        received = []
+        
+        async def consume():
+            async for event in stream.subscribe():
+                received.append((time.perf_counter(), event))
+        
+        consumer = asyncio.ensure_future(consume())
+        start = time.perf_counter()
+        result = await engine.execute_workflow(workflow, context=context)
+        elapsed = time.perf_counter() - start
+        broker.close(context.execution_id, result["status"], results=result["results"])
+        await consumer
+        
+        response = result["results"]["chat"]["response"]
+        partials = [event for _, event in received if event["event"] == "partial"]
+        assert len(partials) > 3 and "".join(event["delta"] for event in partials) == response
+        # 首个片段在整个调用完成前很早到达
+        assert received[0][0] - start < elapsed / 2
+        
+        early = result["results"]["early"]["chat"]
+        assert early["partial"] is True and 8 <= len(early["response"]) < len(response)
+        assert result["results"]["late"]["chat"]["response"] == response
+        completed = [event["node"] for _, event in received if event["event"] == "node"]
+        assert sorted(completed) == ["chat", "early", "late"] and completed.index("early") < completed.index("chat")
+        assert received[-1][1]["event"] == "done"
+        assert sse_message(partials[0]).startswith("event: partial\ndata: {")
+        
+        # 迟到的订阅者重放全部事件
+        replay = [event async for event in stream.subscribe()]
+        assert replay == [event for _, event in received]
+        await engine.aclose()
+    
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "AI节点")
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+浏览器会话池测试
+使用本地WebDriver替身，不需要Browserbase账号
+"""
+
+import asyncio
+import threading
+import time
+
+from src.browser_pool import BrowserFactory, BrowserPool, BrowserPoolConfig, DriverExecutor, PooledBrowser
+from src.browserbase_automation import ActionType, AutomationConfig, BrowserbaseAutomation, FormAction, SelectorType
+from testsupport import run_tests
+
+
+class _FakeDriver:
+    """本地WebDriver替身：记录导航、cookie、本地存储与窗口"""
+    
+    def __init__(self, session_id: str, latency: float = 0.0):
+        self.session_id = session_id
+        self.latency = latency
+        self.threads = set()
+        self.current_url = "about:blank"
+        self.cookies = {}
+        self.storage = {}
+        self.window_handles = ["main"]
+        self.alive = True
+        self.quit_called = False
+        driver = self
+        
+        class _SwitchTo:
+            def window(self, handle):
+                driver.current_window = handle
+        self.switch_to = _SwitchTo()
+        self.current_window = "main"
+    
+    def _check(self):
+        if not self.alive:
+            raise RuntimeError("session deleted")
+    
+    def get(self, url):
+        self._check()
+        self.current_url = url
+        if url != "about:blank":
+            # 模拟阻塞的WebDriver网络调用
+            self.threads.add(threading.current_thread().name)
+            time.sleep(self.latency)
+            self.cookies["sid"] = url
+            self.storage["visited"] = url
+            self.window_handles.append(f"popup-{len(self.window_handles)}")
+    
+    def execute_script(self, script, *args):
+        self._check()
+        if "localStorage.clear" in script:
+            self.storage.clear()
+        return "complete"
+    
+    def delete_all_cookies(self):
+        self._check()
+        self.cookies.clear()
+    
+    def close(self):
+        self.window_handles.remove(self.current_window)
+    
+    def save_screenshot(self, path):
+        return True
+    
+    def quit(self):
+        self.quit_called = True
+
+
+class _FakeBrowserFactory(BrowserFactory):
+    def __init__(self, delay: float = 0.0, latency: float = 0.0):
+        self.delay = delay
+        self.latency = latency
+        self.created = []
+        self.destroyed = []
+    
+    async def create(self) -> PooledBrowser:
+        await asyncio.sleep(self.delay)
+        driver = _FakeDriver(f"session-{len(self.created)}", self.latency)
+        self.created.append(driver)
+        return PooledBrowser(session_id=driver.session_id, driver=driver)
+    
+    async def destroy(self, browser: PooledBrowser):
+        browser.driver.quit()
+        self.destroyed.append(browser.driver)
+
+
+def test_browser_pool_reuses_and_resets_sessions():
+    """测试浏览器会话池：预热、复用、归还时重置状态、健康检查、上限排队与空闲回收"""
+    config = AutomationConfig(url="https://example.com/login", actions=[
+        FormAction(action_type=ActionType.NAVIGATE, selector_type=SelectorType.CSS, selector_value="",
+                   input_value="https://example.com/form"),
+    ], screenshot_on_error=False)
+    
+    async def run():
+        factory = _FakeBrowserFactory(delay=0.01)
+        pool = BrowserPool(factory, BrowserPoolConfig(min_size=1, max_size=2, idle_timeout=0.2, acquire_timeout=1))
+        await pool.start()
+        assert len(factory.created) == 1
+        
+        # 连续两次自动化复用预热的会话，不再新建
+        automation = BrowserbaseAutomation(api_key="test", project_id="test", pool=pool)
+        for _ in range(2):
+            result = await automation.run_automation(config)
+            assert result["success"] and result["session_id"] == "session-0"
+        assert len(factory.created) == 1 and pool.stats()["reused"] == 2
+        driver = factory.created[0]
+        assert driver.current_url == "about:blank" and not driver.cookies and not driver.storage
+        assert driver.window_handles == ["main"] and not driver.quit_called
+        
+        # 健康检查失败的会话被丢弃并换成新会话
+        driver.alive = False
+        async with pool.lease() as browser:
+            assert browser.driver is factory.created[1]
+        assert factory.destroyed == [driver] and pool.stats()["health_failures"] == 1
+        
+        # 达到上限后租用方排队等待归还的会话
+        peak = 0
+        
+        async def lease():
+            nonlocal peak
+            async with pool.lease():
+                peak = max(peak, pool.stats()["leased"])
+                await asyncio.sleep(0.05)
+        
+        await asyncio.gather(*(lease() for _ in range(5)))
+        assert peak == 2 and pool.stats()["size"] == 2 and pool.stats()["waits"] > 0
+        
+        # 空闲超时的会话被回收，只保留 min_size 个
+        await asyncio.sleep(0.5)
+        assert pool.stats()["size"] == 1 and pool.stats()["idle"] == 1
+        
+        await pool.close()
+        assert pool.stats()["size"] == 0 and all(d.quit_called for d in factory.created)
+    
+    asyncio.run(run())
+
+
+def test_browser_automation_runs_driver_calls_off_event_loop():
+    """测试浏览器自动化的阻塞WebDriver调用在专用线程池中执行：事件循环不被阻塞，并发自动化随线程数扩展"""
+    config = AutomationConfig(url="https://example.com/login", actions=[
+        FormAction(action_type=ActionType.NAVIGATE, selector_type=SelectorType.CSS, selector_value="",
+                   input_value="https://example.com/form"),
+        FormAction(action_type=ActionType.WAIT, selector_type=SelectorType.CSS, selector_value="", wait_time=0.1),
+    ], screenshot_on_error=False)
+    
+    async def run():
+        factory = _FakeBrowserFactory(latency=0.1)
+        executor = DriverExecutor(max_workers=4)
+        pool = BrowserPool(factory, BrowserPoolConfig(max_size=4), executor=executor)
+        
+        # 事件循环上的心跳，记录最长间隔
+        gaps = []
+        
+        async def heartbeat():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+        
+        ticker = asyncio.ensure_future(heartbeat())
+        start = time.perf_counter()
+        results = await asyncio.gather(*(
+            BrowserbaseAutomation(api_key="test", project_id="test", pool=pool).run_automation(config)
+            for _ in range(4)
+        ))
+        elapsed = time.perf_counter() - start
+        ticker.cancel()
+        
+        assert all(result["success"] and result["executed_actions"] == 2 for result in results)
+        # 每个自动化约0.3秒（两次0.1秒的阻塞导航 + 0.1秒等待），4个并发执行而不是串行的1.2秒
+        assert elapsed < 0.8
+        assert max(gaps) < 0.1
+        threads = set().union(*(driver.threads for driver in factory.created))
+        assert threads and all(name.startswith("webdriver") for name in threads)
+        
+        await pool.close()
+        executor.shutdown()
+    
+    asyncio.run(run())
+
+
+def test_idle_browser_pool_closes_itself():
+    """整个池闲置超过 close_after_idle 秒后关闭，预热的会话也被结束；租用中的池不会关闭"""
+    async def run():
+        factory = _FakeBrowserFactory()
+        pool = BrowserPool(factory, BrowserPoolConfig(min_size=1, max_size=2, close_after_idle=0.2))
+        await pool.start()
+        async with pool.lease():
+            await asyncio.sleep(0.4)
+            assert not pool.closed
+        assert not pool.closed and pool.stats()["idle"] == 1
+        await asyncio.sleep(0.4)
+        assert pool.closed and pool.stats()["size"] == 0
+        assert all(driver.quit_called for driver in factory.created)
+    
+    asyncio.run(run())
+
+
+def test_api_browser_pools_are_bounded_and_keyed_by_digest():
+    """API的会话池：按凭据摘要分组（不含明文密钥）、超出上限时关闭最久未用的池，请求的浏览器配置与池不符时拒绝"""
+    from src import browserbase_api
+    
+    async def run():
+        max_pools = browserbase_api._max_pools
+        browserbase_api._max_pools = 2
+        try:
+            first = browserbase_api._browser_pool("secret-key-1", "project")
+            second = browserbase_api._browser_pool("secret-key-2", "project")
+            assert browserbase_api._browser_pool("secret-key-1", "project") is first
+            assert not any("secret" in key for key in browserbase_api._browser_pools)
+            
+            # 第三个池淘汰最久未用的 second
+            third = browserbase_api._browser_pool("secret-key-3", "project", {"region": "eu"})
+            await asyncio.gather(*browserbase_api._closing_pools)
+            assert second.closed and not first.closed and not third.closed
+            assert list(browserbase_api._browser_pools.values()) == [first, third]
+            
+            automation = BrowserbaseAutomation(api_key="secret-key-3", project_id="project", pool=third)
+            config = AutomationConfig(url="https://example.com", actions=[], browser_config={"region": "us"})
+            try:
+                await automation.run_automation(config)
+                assert False, "浏览器配置与池不符时应拒绝"
+            except ValueError:
+                pass
+        finally:
+            browserbase_api._max_pools = max_pools
+            await browserbase_api.close_browser_pools()
+    
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "浏览器会话池")
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+工作流引擎测试
+覆盖调度、数据传递、节点处理与执行策略等不依赖外部服务的场景
+"""
+
+import asyncio
+import json
+import time
+
+import httpx
+
+from src import function_runner
+from src.engine import WorkflowEngine
+from src.expressions import ExpressionError, compile_expression
+from src.function_runner import FunctionLimitExceeded, FunctionRunner
+from src.resilience import CircuitBreakerRegistry
+from src.workflow_plan import WorkflowCycleError, compile_workflow
+from testsupport import mock_http_engine, run_tests
+
+
+def _fan_out_workflow(branches: int, delay: float) -> dict:
+    """构建一个触发节点扇出到多个延迟分支的工作流"""
+    nodes = [{"id": "trigger", "type": "delay", "config": {"delay": 0}}]
+    connections = []
+    for i in range(branches):
+        nodes.append({"id": f"branch{i}", "type": "delay", "config": {"delay": delay}})
+        connections.append({"source": "trigger", "target": f"branch{i}"})
+    return {"nodes": nodes, "connections": connections}
+
+
+def test_parallel_branches():
+    """测试独立分支并发执行"""
+    engine = WorkflowEngine()
+    workflow = _fan_out_workflow(branches=10, delay=0.2)
+    
+    start = time.perf_counter()
+    result = asyncio.run(engine.execute_workflow(workflow, {"x": 1}))
+    elapsed = time.perf_counter() - start
+    
+    assert result["status"] == "success"
+    assert len(result["results"]) == 11
+    # 10个0.2秒的分支串行需要2秒，并发执行应接近最长路径
+    assert elapsed < 1.0, elapsed
+
+
+def test_max_concurrency():
+    """测试工作流级别的并发上限"""
+    engine = WorkflowEngine()
+    workflow = _fan_out_workflow(branches=4, delay=0.1)
+    workflow["max_concurrency"] = 1
+    
+    start = time.perf_counter()
+    result = asyncio.run(engine.execute_workflow(workflow))
+    elapsed = time.perf_counter() - start
+    
+    assert result["status"] == "success"
+    assert elapsed >= 0.4, elapsed
+
+
+def test_chain_data_passing():
+    """测试链式节点之间的数据传递"""
+    engine = WorkflowEngine()
+    workflow = {
+        "nodes": [
+            {"id": "a", "type": "function", "config": {"language": "python", "code": "result = {'data': {'n': 1}}"}},
+            {"id": "b", "type": "transform", "config": {"mapping": {"value": "n"}}},
+        ],
+        "connections": [{"source": "a", "target": "b"}],
+    }
+    
+    result = asyncio.run(engine.execute_workflow(workflow))
+    
+    assert result["status"] == "success"
+    assert result["results"]["b"] == {"data": {"value": 1}}
+
+
+def test_join_waits_for_all_inputs():
+    """测试多输入节点等待所有上游完成后只执行一次"""
+    engine = WorkflowEngine()
+    calls = []
+    
+    async def record_node(node, input_data):
+        calls.append(sorted(input_data))
+        return {"data": sorted(input_data)}
+    
+    engine.node_handlers["record"] = record_node
+    workflow = {
+        "nodes": [
+            {"id": "fast", "type": "delay", "config": {"delay": 0}},
+            {"id": "slow", "type": "delay", "config": {"delay": 0.1}},
+            {"id": "join", "type": "record"},
+        ],
+        "connections": [
+            {"source": "fast", "target": "join"},
+            {"source": "slow", "target": "join"},
+            {"source": "slow", "target": "join"},  # 重复连接不应导致重复执行
+        ],
+    }
+    
+    result = asyncio.run(engine.execute_workflow(workflow))
+    
+    assert result["status"] == "success"
+    assert calls == [["fast", "slow"]]
+
+
+def test_plan_cache_and_cycle_detection():
+    """测试执行计划缓存复用与循环依赖检测"""
+    engine = WorkflowEngine()
+    workflow = _fan_out_workflow(branches=3, delay=0)
+    
+    asyncio.run(engine.execute_workflow(workflow))
+    asyncio.run(engine.execute_workflow(workflow))
+    assert engine.plan_cache.misses == 1
+    assert engine.plan_cache.hits == 1
+    
+    plan = engine.plan_cache.get_plan(workflow)
+    assert plan.topological_order[0] == "trigger"
+    assert plan.predecessors["branch0"] == ("trigger",)
+    
+    # 修改定义后内容哈希变化，重新编译
+    workflow["connections"].append({"source": "branch0", "target": "branch1"})
+    assert engine.plan_cache.get_plan(workflow).plan_hash != plan.plan_hash
+    
+    workflow["connections"].append({"source": "branch1", "target": "branch0"})
+    try:
+        compile_workflow(workflow)
+        assert False, "应该检测到循环依赖"
+    except WorkflowCycleError as e:
+        assert e.node_ids == ["branch0", "branch1"]
+    
+    result = asyncio.run(engine.execute_workflow(workflow))
+    assert result["status"] == "error"
+
+
+def test_concurrent_executions_are_isolated():
+    """压力测试：同一引擎并发执行多个工作流，结果互不干扰"""
+    engine = WorkflowEngine()
+    runs = 200
+    workflow = {
+        "nodes": [
+            {"id": "wait", "type": "delay", "config": {"delay": 0.01}},
+            {"id": "echo", "type": "transform", "config": {"mapping": {"run": "workflow_input.run"}}},
+        ],
+        "connections": [{"source": "wait", "target": "echo"}],
+    }
+    
+    async def run_all():
+        return await asyncio.gather(*[
+            engine.execute_workflow(workflow, {"run": i}) for i in range(runs)
+        ])
+    
+    results = asyncio.run(run_all())
+    
+    assert len({r["execution_id"] for r in results}) == runs
+    for i, result in enumerate(results):
+        assert result["status"] == "success"
+        assert result["results"]["wait"] == {"workflow_input": {"run": i}}
+        assert result["results"]["echo"] == {"data": {"run": i}}
+
+
+def test_compiled_filter_and_conditional():
+    """测试预编译的过滤/条件表达式：列表过滤、列式过滤、条件分支、沙箱限制与运算结果大小限制"""
+    engine = WorkflowEngine()
+    rows = [{"id": i, "tier": "gold" if i % 2 else "free"} for i in range(6)] + ["not-a-dict"]
+    columns = {"id": [1, 2, 3, 4], "tier": ["gold", "free", "gold", "free"]}
+    condition = "item['id'] > 1 and item.get('tier') == 'gold'"
+    
+    filtered = asyncio.run(engine.handle_filter_node(
+        {"config": {"condition": condition}}, {"src": {"data": rows}}))
+    assert filtered == {"src": [{"id": 3, "tier": "gold"}, {"id": 5, "tier": "gold"}]}
+    
+    filtered = asyncio.run(engine.handle_filter_node(
+        {"config": {"condition": condition, "columnar": True}}, {"src": {"data": columns}}))
+    assert filtered == {"src": {"id": [3], "tier": ["gold"]}}
+    
+    branch = asyncio.run(engine.handle_conditional_node(
+        {"config": {"condition": "len(data) > 2", "true_branch": "many", "false_branch": "few"}},
+        {"src": {"data": [1, 2, 3]}}))
+    assert branch["branch"] == "many"
+    
+    for unsafe in ("item.__class__", "open('/etc/passwd')", "'{0.__class__}'.format(item)"):
+        result = asyncio.run(engine.handle_filter_node({"config": {"condition": unsafe}}, {"src": {"data": rows}}))
+        assert "error" in result, unsafe
+    
+    # 结果过大的乘方与乘法在求值时立即报错，不会卡住事件循环或耗尽内存
+    start = time.perf_counter()
+    for oversized in ("9 ** 9 ** 9 > 0", '"a" * 10**12 == ""', "[0] * (item['id'] + 10) ** 20 == []"):
+        try:
+            compile_expression(oversized).evaluate({"id": 10 ** 6})
+            assert False, oversized
+        except ExpressionError:
+            pass
+        filtered = asyncio.run(engine.handle_filter_node({"config": {"condition": oversized}}, {"src": {"data": rows}}))
+        assert filtered == {"src": []}, oversized
+    assert time.perf_counter() - start < 1
+    assert compile_expression("item['id'] ** 2 * 1.5 + len('ab' * 3)").evaluate({"id": 2}) == 12
+
+
+def test_function_node_process_pool():
+    """测试函数节点在进程池中执行，CPU超限的节点不影响其他节点"""
+    engine = WorkflowEngine()
+    workflow = {
+        "nodes": [
+            {"id": "sum", "type": "function", "config": {
+                "language": "python", "execution": "process",
+                "code": "result = {'total': sum(range(input_data['workflow_input']['n']))}"}},
+            {"id": "spin", "type": "function", "config": {
+                "language": "python", "execution": "process", "cpu_time_limit": 1,
+                "code": "while True:\n    pass"}},
+            {"id": "io", "type": "function", "config": {
+                "language": "python", "execution": "thread", "code": "result = len(input_data)"}},
+        ],
+        "connections": [],
+    }
+    
+    async def run():
+        try:
+            return await engine.execute_workflow(workflow, {"n": 1000})
+        finally:
+            await engine.aclose()
+    
+    result = asyncio.run(run())["results"]
+    
+    assert result["sum"] == {"total": 499500}
+    assert "CPU" in result["spin"]["error"]
+    assert result["io"] == 1
+
+
+def test_function_node_timeouts_stop_code():
+    """测试函数节点默认在进程池中执行，超时的代码被停止：进程池worker自行停止或被回收，线程池中抛出异常释放线程"""
+    runner = FunctionRunner(process_workers=1, thread_workers=1)
+    assert runner.default_mode == "process"
+    
+    async def run():
+        # 默认不在事件循环上执行：执行期间心跳不中断
+        ticks = 0
+        
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        
+        ticker = asyncio.ensure_future(heartbeat())
+        assert await runner.run("result = sum(i * i for i in range(3000000))", {}) == 8999995500000500000
+        ticker.cancel()
+        assert ticks > 5
+        
+        for mode in ("process", "thread"):
+            try:
+                await runner.run("while True:\n    pass", {}, mode=mode, timeout=0.3)
+                assert False, mode
+            except FunctionLimitExceeded as e:
+                assert "超时" in str(e)
+            # 单个worker已被释放，后续代码可以执行
+            assert await runner.run("result = 1", {}, mode=mode, timeout=5) == 1
+        
+        # 不响应信号的长时间C调用：超时后回收进程池
+        pool = runner._process_pool
+        try:
+            await runner.run("result = sum(range(10 ** 13))", {}, timeout=0.2)
+            assert False, "应超时"
+        except FunctionLimitExceeded:
+            pass
+        await asyncio.sleep(function_runner.PROCESS_KILL_GRACE + 0.5)
+        assert runner._process_pool is not pool
+        assert await runner.run("result = 2", {}, timeout=5) == 2
+    
+    try:
+        asyncio.run(run())
+    finally:
+        runner.shutdown()
+
+
+def test_templates_in_http_request():
+    """测试URL、请求头、查询参数与请求体中的模板变量"""
+    seen = {}
+    
+    def handler(request):
+        seen["url"] = str(request.url)
+        seen["auth"] = request.headers.get("authorization")
+        seen["body"] = json.loads(request.content)
+        return httpx.Response(200, json={})
+    
+    engine = mock_http_engine(handler)
+    node = {"id": "call", "type": "http", "config": {
+        "method": "POST",
+        "url": "http://api.internal/users/{{ user.id }}",
+        "headers": {"Authorization": "Bearer {{user.token}}"},
+        "params": {"q": "{{user.name}}", "missing": "{{ nope }}"},
+        "data": {"tags": "{{user.tags}}", "static": [1, 2]},
+    }}
+    input_data = {"user": {"id": 7, "token": "t0k", "name": "ann", "tags": ["a", "b"]}}
+    
+    result = asyncio.run(engine.handle_http_node(node, input_data))
+    
+    assert result["status_code"] == 200
+    assert seen["url"].startswith("http://api.internal/users/7?")
+    assert "q=ann" in seen["url"] and "missing=%7B%7B%20nope%20%7D%7D" in seen["url"]
+    assert seen["auth"] == "Bearer t0k"
+    assert seen["body"] == {"tags": '["a", "b"]', "static": [1, 2]}
+    assert engine._replace_variables("{{x}}-{{ y.z }}-{{}}", {"x": 1, "y": {"z": None}}) == "1-None-{{}}"
+
+
+def test_transform_batch_mode():
+    """测试转换节点的编译路径与批量模式（行式/列式输出、通配路径）"""
+    engine = WorkflowEngine()
+    payload = {"data": {"source": "crm", "items": [
+        {"email": "a@x.io", "profile": {"name": "A"}},
+        {"email": "b@x.io"},
+    ]}}
+    mapping = {"email": "items.*.email", "name": "items.*.profile.name", "source": "source"}
+    
+    single = asyncio.run(engine.handle_transform_node(
+        {"config": {"mapping": {"first": "items.0.email", "all": "items.*.email", "none": "items.9"}}},
+        {"src": payload}))
+    assert single == {"data": {"first": "a@x.io", "all": ["a@x.io", "b@x.io"]}}
+    
+    rows = asyncio.run(engine.handle_transform_node(
+        {"config": {"mapping": mapping, "batch": True}}, {"src": payload}))
+    assert rows == {"data": [
+        {"source": "crm", "email": "a@x.io", "name": "A"},
+        {"source": "crm", "email": "b@x.io"},
+    ]}
+    
+    columns = asyncio.run(engine.handle_transform_node(
+        {"config": {"mapping": mapping, "batch": True, "output": "columns"}}, {"src": payload}))
+    assert columns == {"data": {"email": ["a@x.io", "b@x.io"], "name": ["A", None], "source": "crm"}}
+
+
+def test_node_timeout_retry_and_circuit_breaker():
+    """测试节点策略：超时、指数退避重试与按主机共享的熔断器"""
+    calls = {"flaky": 0, "dead": 0}
+    healthy = {"dead": False}
+    
+    def handler(request):
+        host = request.url.host
+        calls[host] += 1
+        if host == "flaky" and calls[host] <= 2:
+            return httpx.Response(503)
+        if host == "dead" and not healthy["dead"]:
+            return httpx.Response(500)
+        return httpx.Response(200, json={"ok": True})
+    
+    engine = mock_http_engine(handler, circuit_breakers=CircuitBreakerRegistry(failure_threshold=3, reset_timeout=0.2))
+    retry = {"retries": 3, "backoff": 0.01, "jitter": 0.5}
+    dead = {"nodes": [{"id": "call", "type": "http", "config": {"url": "http://dead/x"},
+                       "policy": {"circuit_breaker": True}}], "connections": []}
+    
+    async def run():
+        result = await engine.execute_workflow({"nodes": [
+            {"id": "flaky", "type": "http", "config": {"url": "http://flaky/x"}, "policy": retry},
+            {"id": "slow", "type": "delay", "config": {"delay": 5}, "policy": {"timeout": 0.05}},
+        ], "connections": []})
+        assert result["results"]["flaky"]["status_code"] == 200
+        assert result["results"]["flaky"]["attempts"] == 3
+        assert result["results"]["slow"]["timeout"] is True
+        
+        # 连续失败3次后熔断，其后的执行不再请求该主机
+        results = [(await engine.execute_workflow(dead))["results"]["call"] for _ in range(6)]
+        assert calls["dead"] == 3
+        assert all(r.get("circuit_open") for r in results[3:])
+        assert engine.circuit_breakers.stats()["http:dead"]["state"] == "open"
+        
+        # 半开后放行一次探测，成功则恢复
+        healthy["dead"] = True
+        await asyncio.sleep(0.25)
+        assert (await engine.execute_workflow(dead))["results"]["call"]["status_code"] == 200
+        assert "http:dead" not in engine.circuit_breakers.stats()
+        await engine.aclose()
+    
+    start = time.perf_counter()
+    asyncio.run(run())
+    assert time.perf_counter() - start < 2
+
+
+def test_cancelled_execution_not_counted_by_circuit_breaker():
+    """执行被取消（包括取消被处理函数吞掉、变成错误结果）时不计入熔断失败，半开状态的探测名额被归还"""
+    async def handler(request):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            if request.url.path == "/swallow":
+                return httpx.Response(500)
+            raise
+        return httpx.Response(200)
+    
+    engine = mock_http_engine(handler, circuit_breakers=CircuitBreakerRegistry(failure_threshold=1, reset_timeout=0.05))
+    
+    def workflow(path):
+        return {"nodes": [{"id": "call", "type": "http", "config": {"url": f"http://slow{path}"},
+                           "policy": {"circuit_breaker": True, "retries": 2, "backoff": 0.01}}], "connections": []}
+    
+    async def cancel_after_start(path):
+        task = asyncio.ensure_future(engine.execute_workflow(workflow(path)))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        try:
+            await task
+            assert False, "执行应被取消"
+        except asyncio.CancelledError:
+            pass
+    
+    async def run():
+        paths = ["/x", "/swallow"] if hasattr(asyncio.Task, "cancelling") else ["/x"]
+        for path in paths:
+            await cancel_after_start(path)
+        breaker = engine.circuit_breakers.get("http:slow")
+        assert breaker.state == breaker.CLOSED and breaker.failures == 0
+        
+        # 半开状态下唯一的探测调用被取消后，下一次调用仍可探测
+        breaker.record_failure()
+        await asyncio.sleep(0.06)
+        await cancel_after_start("/x")
+        assert breaker.state == breaker.HALF_OPEN and breaker.allow()
+        await engine.aclose()
+    
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "引擎")
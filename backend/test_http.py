@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+HTTP节点测试
+覆盖连接池、流式响应体、响应缓存与请求合并
+"""
+
+import asyncio
+import json
+import os
+import tempfile
+
+import httpx
+
+from src.http_body import StreamedBody, _iter_json_array, _iter_ndjson
+from src.http_cache import FileCacheBackend, HttpResponseCache
+from testsupport import mock_http_engine, run_tests
+
+
+def test_http_node_reuses_pooled_client():
+    """测试HTTP节点复用按主机分组的共享客户端"""
+    requests = []
+    
+    def handler(request):
+        requests.append(request)
+        return httpx.Response(200, json={"path": request.url.path})
+    
+    engine = mock_http_engine(handler)
+    workflow = {
+        "nodes": [
+            {"id": "a", "type": "http", "config": {"url": "http://api.internal/a"}},
+            {"id": "b", "type": "http", "config": {"url": "http://api.internal/b", "method": "POST", "data": {"x": 1}, "timeout": 5}},
+            {"id": "c", "type": "http", "config": {"url": "http://other.internal/c"}},
+        ],
+        "connections": [],
+    }
+    
+    async def run():
+        result = await engine.execute_workflow(workflow)
+        clients = len(engine.http_pool)
+        await engine.aclose()
+        return result, clients
+    
+    result, clients = asyncio.run(run())
+    
+    assert result["results"]["b"]["data"] == {"path": "/b"}
+    assert len(requests) == 3
+    assert clients == 2
+    assert len(engine.http_pool) == 0
+
+
+def test_http_pool_bound_to_event_loop():
+    """连接池在 start() 的事件循环中创建客户端，在其他循环中使用或关闭时报错，aclose() 后可在新循环中使用"""
+    engine = mock_http_engine(lambda request: httpx.Response(200, json={}))
+    pool = engine.http_pool
+    
+    async def use():
+        return pool.get_client("http://api.internal/a")
+    
+    async def start():
+        await engine.start()
+        return await use()
+    
+    loop = asyncio.new_event_loop()
+    try:
+        client = loop.run_until_complete(start())
+        for other_loop_call in (use, pool.start, pool.aclose):
+            try:
+                asyncio.run(other_loop_call())
+                assert False, "不应在其他事件循环中使用连接池"
+            except RuntimeError:
+                pass
+        assert not client.is_closed and len(pool) == 1
+        loop.run_until_complete(engine.aclose())
+        assert client.is_closed and len(pool) == 0
+    finally:
+        loop.close()
+    
+    async def reuse():
+        client = await use()
+        await engine.aclose()
+        return client
+    
+    assert asyncio.run(reuse()).is_closed
+
+
+def test_streamed_http_body():
+    """测试流式响应体：超过阈值写入临时文件，过滤与批量转换节点逐条消费，需要整体加载或超过上限时报错"""
+    items = [{"id": i, "name": f"user{i}"} for i in range(2000)]
+    
+    def handler(request):
+        if request.url.path == "/ndjson":
+            body = "\n".join(json.dumps(item) for item in items)
+            return httpx.Response(200, text=body, headers={"content-type": "application/x-ndjson"})
+        return httpx.Response(200, json=items)
+    
+    engine = mock_http_engine(handler)
+    workflow = {
+        "nodes": [
+            {"id": "export", "type": "http", "config": {"url": "http://api.internal/export", "stream": True, "spill_threshold": 1024}},
+            {"id": "lines", "type": "http", "config": {"url": "http://api.internal/ndjson", "stream": True}},
+            {"id": "small", "type": "filter", "config": {"condition": "item['id'] < 3"}},
+            {"id": "tiny", "type": "http", "config": {"url": "http://api.internal/export", "max_body_size": 100}},
+            # 批量转换逐条映射，不受整体加载上限影响
+            {"id": "names", "type": "transform", "config": {"mapping": {"name": "name"}, "batch": True, "max_body_size": 100}},
+            # 条件表达式需要整体加载，超过上限时报错
+            {"id": "check", "type": "conditional", "config": {"condition": "data", "max_body_size": 100}},
+        ],
+        "connections": [{"source": "export", "target": "small"}, {"source": "export", "target": "names"},
+                        {"source": "export", "target": "check"}],
+    }
+    
+    result = asyncio.run(engine.execute_workflow(workflow))["results"]
+    
+    body = result["export"]["data"]
+    assert isinstance(body, StreamedBody) and body.spilled and body.is_sequence
+    assert list(body.records()) == items
+    assert result["small"] == {"export": items[:3]}
+    assert result["lines"]["data"].load() == items
+    assert "error" in result["tiny"]
+    assert result["names"]["data"] == [{"name": item["name"]} for item in items]
+    assert "超过上限" in result["check"]["error"]
+    
+    path = body.path
+    body.close()
+    assert not os.path.exists(path)
+
+
+def test_streamed_records_across_small_chunks():
+    """逐条解析跨越大量分块的长元素与长行：结果正确，数字不会在分块边界被截断"""
+    items = [{"id": -3.25, "text": "x" * 50000}, 12345, [1, 2, {"nested": "y" * 20000}], "end"]
+    array = json.dumps(items)
+    ndjson = "\n".join(json.dumps(item) for item in items).encode()
+    for size in (1, 7, 4096):
+        assert list(_iter_json_array(array[i:i + size] for i in range(0, len(array), size))) == items
+        assert list(_iter_ndjson(ndjson[i:i + size] for i in range(0, len(ndjson), size))) == items
+
+
+def test_http_response_cache():
+    """测试HTTP响应缓存：TTL内命中、过期后通过ETag重新验证、文件后端跨实例共享"""
+    calls = []
+    
+    def handler(request):
+        calls.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304, headers={"etag": '"v1"'})
+        return httpx.Response(200, json={"rates": [1, 2]}, headers={"etag": '"v1"'})
+    
+    engine = mock_http_engine(handler)
+    node = {"id": "ref", "type": "http", "config": {"url": "http://api.internal/rates", "cache": {"ttl": 60}}}
+    
+    async def run():
+        first = await engine.handle_http_node(node, {})
+        second = await engine.handle_http_node(node, {})
+        # 让缓存条目过期，触发条件请求
+        for entry in engine.http_cache.backend._entries.values():
+            entry.expires_at = 0
+        third = await engine.handle_http_node(node, {})
+        return first, second, third
+    
+    first, second, third = asyncio.run(run())
+    
+    assert [first["cache"], second["cache"], third["cache"]] == ["miss", "hit", "revalidated"]
+    assert third["data"] == {"rates": [1, 2]}
+    assert len(calls) == 2
+    assert engine.http_cache.stats()["hits"] == 2
+    
+    with tempfile.TemporaryDirectory() as directory:
+        shared = [HttpResponseCache(FileCacheBackend(directory)) for _ in range(2)]
+        engines = [
+            mock_http_engine(handler, http_cache=cache)
+            for cache in shared
+        ]
+        asyncio.run(engines[0].handle_http_node(node, {}))
+        result = asyncio.run(engines[1].handle_http_node(node, {}))
+        assert result["cache"] == "hit"
+        assert result["data"] == {"rates": [1, 2]}
+    
+    # 共享缓存不跨凭据复用：带凭据的请求只缓存声明 public 的响应，private 响应不缓存
+    def auth_handler(request):
+        cache_control = {"/public": "public, max-age=60", "/private": "private, max-age=60"}.get(
+            request.url.path, "max-age=60")
+        return httpx.Response(200, json={"user": request.headers.get("authorization")},
+                              headers={"cache-control": cache_control})
+    
+    engine = mock_http_engine(auth_handler)
+    
+    def auth_node(path, token=None):
+        headers = {"Authorization": token} if token else {}
+        return {"id": "me", "type": "http", "config": {"url": f"http://api.internal{path}", "headers": headers, "cache": True}}
+    
+    async def run_auth():
+        requests = [("/me", "a"), ("/me", "b"), ("/me", "a"), ("/public", "a"), ("/public", "a"), ("/public", "b"),
+                    ("/private", None), ("/private", None)]
+        return [await engine.handle_http_node(auth_node(path, token), {}) for path, token in requests]
+    
+    results = asyncio.run(run_auth())
+    assert [result["cache"] for result in results] == ["miss", "miss", "miss", "miss", "hit", "miss", "miss", "miss"]
+    assert [result["data"]["user"] for result in results[:6]] == ["a", "b", "a", "a", "a", "b"]
+
+
+def test_single_flight_coalesces_identical_requests():
+    """测试并发执行中相同的HTTP GET只发出一次，关闭合并的节点各自发出请求"""
+    calls = []
+    
+    async def handler(request):
+        calls.append(request.url.path)
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"path": request.url.path})
+    
+    engine = mock_http_engine(handler)
+    workflow = {
+        "nodes": [
+            {"id": "shared", "type": "http", "config": {"url": "http://api.internal/config"}},
+            {"id": "own", "type": "http", "config": {"url": "http://api.internal/own", "coalesce": False}},
+        ],
+        "connections": [],
+    }
+    
+    async def run_all():
+        return await asyncio.gather(*[engine.execute_workflow(workflow) for _ in range(20)])
+    
+    results = asyncio.run(run_all())
+    
+    assert all(r["results"]["shared"]["data"] == {"path": "/config"} for r in results)
+    assert calls.count("/config") == 1
+    assert calls.count("/own") == 20
+    assert engine.single_flight.stats() == {"calls": 1, "shared": 19, "inflight": 0}
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "HTTP节点")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+任务队列测试
+覆盖入队背压、租约到期重试与延迟任务
+"""
+
+import asyncio
+
+from src.engine import WorkflowEngine
+from src.job_queue import ExecutionQueue, ExecutionStateError, QueueFullError, QueuedJob, create_job_queue
+from src.storage import ExecutionRecord, Storage
+from src.worker import ExecutionWorker
+from testsupport import delay_workflow, run_on_both_queues, run_tests, run_with_sqlite_file
+
+
+def test_execution_queue_backpressure():
+    """执行队列：入队后立即返回执行id，队列满时拒绝，worker执行后记录排队与运行耗时"""
+    async def run():
+        storage = Storage("sqlite://")
+        queue = ExecutionQueue(create_job_queue(storage.engine), storage.executions, max_size=2)
+        worker = ExecutionWorker(WorkflowEngine(), queue.jobs, storage.executions, concurrency=2)
+        workflow = delay_workflow(0.1, node_id="wait")
+        
+        first = await queue.submit(1, workflow)
+        second = await queue.submit(1, workflow, {"value": 1})
+        assert first.status == second.status == "queued"
+        try:
+            await queue.submit(1, workflow)
+            assert False, "队列已满时应拒绝"
+        except QueueFullError:
+            pass
+        
+        worker.start()
+        for record in (first, second):
+            finished = await queue.wait(record.id, timeout=5)
+            assert finished.status == "success" and "wait" in finished.data["results"]
+        
+        # 同步模式：等待worker执行完成
+        finished = await queue.submit(2, workflow, wait=True, timeout=5)
+        assert finished.status == "success" and finished.workflow_id == 2
+        await worker.stop()
+        
+        metrics = await queue.metrics()
+        assert metrics["submitted"] == 3 and metrics["rejected"] == 1
+        assert metrics["queued"] == 0 and metrics["run_time"]["count"] == 3 and metrics["run_time"]["p50"] >= 0.1
+        assert worker.metrics()["completed"] == 3
+        await storage.close()
+    
+    asyncio.run(run())
+
+
+def test_job_lease_expiry_retries_crashed_worker():
+    """worker崩溃（未确认）后租约到期，任务由其他worker重试；超过最大次数后放弃"""
+    async def run(jobs, storage):
+        queue = ExecutionQueue(jobs, storage.executions, max_attempts=2)
+        workflow = delay_workflow()
+        record = await queue.submit(1, workflow)
+        
+        crashed = await jobs.lease("crashed-worker", visibility_timeout=0.05)
+        assert crashed.id == record.id and crashed.attempts == 1
+        assert await jobs.lease("other", visibility_timeout=0.05) is None  # 租约期间不可见
+        await asyncio.sleep(0.06)
+        
+        worker = ExecutionWorker(WorkflowEngine(), jobs, storage.executions, worker_id="healthy-worker")
+        await worker.run_until_idle()
+        finished = await queue.get(record.id)
+        assert finished.status == "success" and finished.data["attempts"] == 2
+        assert not await jobs.ack(crashed)  # 过期的租约不能再确认
+        assert (await jobs.stats()) == {"queued": 0, "leased": 0, "delayed": 0}
+        
+        # 每次租用后都崩溃：第3次租用时放弃
+        abandoned = await queue.submit(1, workflow)
+        for _ in range(2):
+            assert await jobs.lease("crashed-worker", visibility_timeout=0.01) is not None
+            await asyncio.sleep(0.02)
+        await worker.run_until_idle()
+        failed = await queue.get(abandoned.id)
+        assert failed.status == "error" and "放弃" in failed.data["message"]
+        assert worker.metrics()["abandoned"] == 1
+        await storage.close()
+    
+    run_on_both_queues(run, "queue.db")
+
+
+def test_concurrent_submits_respect_queue_bound():
+    """并发提交：排队数的检查与入队是原子的，排队数不超过上限，超出的执行记为出错"""
+    async def run(jobs, storage):
+        queue = ExecutionQueue(jobs, storage.executions, max_size=3)
+        workflow = delay_workflow()
+        
+        results = await asyncio.gather(*(queue.submit(1, workflow) for _ in range(10)), return_exceptions=True)
+        accepted = [result for result in results if not isinstance(result, Exception)]
+        assert len(accepted) == 3 and all(isinstance(result, QueueFullError) for result in results if result not in accepted)
+        assert await jobs.depth() == 3
+        assert queue.submitted == 3 and queue.rejected == 7
+        
+        # 入队时才发现队列已满的执行记为出错，不会停留在排队状态
+        records = await storage.executions.list(limit=20)
+        assert sum(record.status == "queued" for record in records) == 3
+        assert all(record.status == "error" and "队列已满" in record.data["message"]
+                   for record in records if record.status != "queued")
+        
+        # 批量提交同样整批原子地检查
+        await jobs.lease("worker", visibility_timeout=60)
+        batches = await asyncio.gather(*(
+            queue.submit_many([(1, workflow, None, f"batch-{index}")]) for index in range(3)
+        ), return_exceptions=True)
+        assert sum(not isinstance(batch, Exception) for batch in batches) == 1
+        assert await jobs.depth() == 3
+        await storage.close()
+    
+    run_on_both_queues(run, "bound.db")
+
+
+def test_sqlite_lease_is_exclusive_across_workers():
+    """SQLite上多个worker（各自的连接池，模拟多进程）并发租用：每个任务恰好被租用一次"""
+    async def run(path):
+        storages = [Storage(f"sqlite:///{path}") for _ in range(4)]
+        queues = [create_job_queue(storage.engine) for storage in storages]
+        job_ids = {f"job-{index}" for index in range(60)}
+        await queues[0].enqueue_many([QueuedJob(id=job_id, payload={}) for job_id in sorted(job_ids)])
+        
+        leased = []
+        
+        async def lease_loop(jobs, worker_id):
+            # 写锁冲突时 lease 返回None，继续尝试直到没有可见的任务
+            while await jobs.depth() > 0:
+                job = await jobs.lease(worker_id, visibility_timeout=60)
+                if job is not None:
+                    leased.append(job.id)
+        
+        await asyncio.gather(*(
+            lease_loop(jobs, f"worker-{index}") for index, jobs in enumerate(queues) for _ in range(3)
+        ))
+        assert len(leased) == len(job_ids) and set(leased) == job_ids
+        assert await queues[0].stats() == {"queued": 0, "leased": len(job_ids), "delayed": 0}
+        for storage in storages:
+            await storage.close()
+    
+    run_with_sqlite_file(run, "lease.db")
+
+
+def test_execution_reads_are_isolated_by_kind():
+    """执行记录与自动化任务共用存储：按执行id读取、等待、恢复与幂等提交都看不到其他类型的记录"""
+    async def run(jobs, storage):
+        queue = ExecutionQueue(jobs, storage.executions)
+        task = ExecutionRecord(kind="automation", status="error", data={"input_data": {"password": "secret"}})
+        await storage.executions.save(task)
+        
+        assert await queue.get(task.id) is None and await queue.wait(task.id, timeout=0) is None
+        assert await queue.resume(task.id, delay_workflow()) is None
+        try:
+            await queue.submit(1, delay_workflow(), execution_id=task.id)
+            assert False, "不应以自动化任务的id提交执行"
+        except ExecutionStateError:
+            pass
+        assert (await storage.executions.get(task.id, kind="automation")).status == "error"
+        assert await storage.executions.get(task.id, kind="workflow") is None
+        
+        record = await queue.submit(1, delay_workflow())
+        assert await storage.executions.get(record.id, kind="automation") is None
+        assert (await queue.get(record.id)).id == record.id
+        await storage.close()
+    
+    run_on_both_queues(run, "kinds.db")
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "任务队列")
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+定时触发测试
+覆盖cron解析、跨重启只触发一次与夏令时切换
+"""
+
+import asyncio
+import time
+
+from src.scheduler import CronExpression, CronTrigger, WorkflowScheduler, create_schedule_store, schedules_table
+from testsupport import memory_queue, run_tests
+
+
+def test_scheduler_fires_once_across_restarts():
+    """测试定时触发：cron解析、到期触发、重启后不重复触发、misfire跳过与万级触发器加载"""
+    from datetime import datetime
+    
+    cron = CronExpression("*/15 9-17 * * mon-fri")
+    # 周五17:50之后的下一次是周一09:00
+    assert cron.next_after(datetime(2024, 1, 5, 17, 50)) == datetime(2024, 1, 8, 9, 0)
+    assert CronExpression("0 0 29 2 *").next_after(datetime(2023, 3, 1)) == datetime(2024, 2, 29)
+    
+    async def run():
+        storage, queue = memory_queue()
+        jobs = queue.jobs
+        state = create_schedule_store(storage.engine)
+        workflow = {"name": "定时", "nodes": [], "connections": [], "active": True}
+        hourly = await storage.workflows.create({**workflow, "triggers": [{"type": "cron", "expression": "@hourly"}]})
+        skipped = await storage.workflows.create(
+            {**workflow, "triggers": [{"type": "interval", "hours": 1, "misfire": "skip"}]}
+        )
+        await storage.workflows.create({**workflow, "active": False, "triggers": [{"type": "interval", "seconds": 1}]})
+        
+        scheduler = WorkflowScheduler(queue, storage.workflows, state)
+        await scheduler.start()
+        assert scheduler.stats()["schedules"] == 2
+        await scheduler.stop()
+        
+        # 模拟停机：hourly 刚好到期，skipped 已错过很久
+        now = time.time()
+        def set_due(key, next_fire_at, pending=None):
+            with storage.engine.begin() as conn:
+                conn.execute(schedules_table.update().where(schedules_table.c.key == key)
+                             .values(next_fire_at=next_fire_at, pending_fire_at=pending))
+        keys = {entry.workflow_id: key for key, entry in scheduler.entries.items()}
+        set_due(keys[hourly["id"]], now - 1)
+        set_due(keys[skipped["id"]], now - 1000)
+        
+        scheduler = WorkflowScheduler(queue, storage.workflows, state)
+        await scheduler.start()
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        assert await jobs.depth() == 1
+        assert scheduler.stats()["fired"] == 1 and scheduler.stats()["skipped_misfires"] == 1
+        job = await jobs.lease("w", 30)
+        assert job.payload["workflow_id"] == hourly["id"]
+        assert job.payload["input_data"]["trigger"]["scheduled_at"] == now - 1
+        await jobs.release(job)
+        
+        # 模拟提交后、确认前崩溃：重启后按相同的执行id补提交，执行已存在则不重复入队
+        set_due(keys[hourly["id"]], time.time() + 3600, pending=now - 1)
+        scheduler = WorkflowScheduler(queue, storage.workflows, state)
+        await scheduler.start()
+        await asyncio.sleep(0.2)
+        await scheduler.stop()
+        assert await jobs.depth() == 1 and scheduler.stats()["fired"] == 1
+        assert all(entry.pending_fire_at is None for entry in scheduler.entries.values())
+        
+        # 一万个工作流的触发器加载后按堆调度，不逐个扫描
+        await storage.workflows.create_many(
+            {**workflow, "triggers": [{"type": "interval", "seconds": 60 + i % 600, "jitter": 5}]}
+            for i in range(10000)
+        )
+        start = time.perf_counter()
+        scheduler = WorkflowScheduler(queue, storage.workflows, state)
+        await scheduler.start()
+        loaded = time.perf_counter() - start
+        await scheduler.stop()
+        assert scheduler.stats()["schedules"] == 10002
+        assert loaded < 10
+        await storage.close()
+    
+    asyncio.run(run())
+
+
+def test_cron_trigger_dst_fall_back():
+    """测试cron触发器跨越夏令时回拨：重复的一小时内下次触发时间始终晚于当前时间"""
+    from datetime import datetime
+    from zoneinfo import ZoneInfo
+    
+    tz = ZoneInfo("America/New_York")
+    trigger = CronTrigger({"type": "cron", "expression": "*/5 * * * *", "timezone": "America/New_York"})
+    # 2026-11-01 01:00-02:00 出现两次，第二次（fold=1）为EST
+    second = datetime(2026, 11, 1, 1, 30, fold=1, tzinfo=tz).timestamp()
+    assert trigger.next_fire(second) == second + 300
+    
+    assert trigger.next_fire(second - 1) == second
+    
+    # 从回拨前逐次推进：每个墙上时间只触发一次，01:55(EDT)之后是02:00(EST)
+    at = datetime(2026, 11, 1, 0, 50, tzinfo=tz).timestamp()
+    fired = []
+    while len(fired) < 16:
+        following = trigger.next_fire(at)
+        assert following > at
+        fired.append(following)
+        at = following
+    assert fired[13] - fired[12] == 65 * 60
+    assert fired[13] == datetime(2026, 11, 1, 2, 0, tzinfo=tz).timestamp()
+    
+    # 春季跳过的 02:30 顺延到跳变之后
+    daily = CronTrigger({"type": "cron", "expression": "30 2 * * *", "timezone": "America/New_York"})
+    before = datetime(2026, 3, 8, 1, 0, tzinfo=tz).timestamp()
+    assert daily.next_fire(before) == datetime(2026, 3, 8, 3, 30, tzinfo=tz).timestamp()
+
+
+def test_cron_day_fields_follow_standard_semantics():
+    """日/周字段以*开头或覆盖全部取值时视为不限制（与另一字段取交集），都有限制时取并集；a/n 表示从a到上限"""
+    from datetime import datetime
+    
+    def fires(expression, count=6):
+        cron, at, result = CronExpression(expression), datetime(2026, 1, 1), []
+        for _ in range(count):
+            at = cron.next_after(at)
+            result.append(at)
+        return result
+    
+    mondays = fires("0 0 * * 1")
+    assert all(moment.weekday() == 0 for moment in mondays)
+    assert fires("0 0 */1 * 1") == fires("0 0 1-31 * 1") == mondays
+    
+    firsts = fires("0 0 1 * *")
+    assert all(moment.day == 1 for moment in firsts)
+    assert fires("0 0 1 * */1") == fires("0 0 1 * 0-6") == fires("0 0 1 * 1-7") == firsts
+    
+    # 日与周都有限制：13日或周五
+    either = fires("0 0 13 * 5", count=10)
+    assert all(moment.day == 13 or moment.weekday() == 4 for moment in either)
+    assert any(moment.day == 13 and moment.weekday() != 4 for moment in either)
+    assert any(moment.day != 13 for moment in either)
+    
+    assert CronExpression("5/1 * * * *").minutes == frozenset(range(5, 60))
+    assert CronExpression("5/20 * * * *").minutes == frozenset({5, 25, 45})
+    assert CronExpression("5 * * * *").minutes == frozenset({5})
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "定时触发")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+存储测试
+覆盖工作流与执行记录的读写、分页、缓冲与过期清理
+"""
+
+import asyncio
+import threading
+
+from src.storage import ExecutionRecord, Storage
+from testsupport import run_tests, run_with_sqlite_file
+
+
+def test_persistent_storage():
+    """工作流按id读写、分页列出，执行记录批量写入并按TTL清理，重启后数据仍在"""
+    async def run(path):
+        storage = Storage(f"sqlite:///{path}", batch_size=3, flush_interval=60, ttl_by_kind={"automation": 10})
+        
+        created = await storage.workflows.create({"name": "first", "nodes": [{"id": "a"}], "connections": []})
+        await storage.workflows.create_many({"name": f"bulk{i}", "nodes": []} for i in range(9))
+        assert await storage.workflows.count() == 10
+        
+        updated = await storage.workflows.update(created["id"], {"name": "renamed", "max_concurrency": 2})
+        assert updated["name"] == "renamed" and updated["nodes"] == [{"id": "a"}] and updated["max_concurrency"] == 2
+        assert await storage.workflows.update(9999, {"name": "x"}) is None
+        
+        page = await storage.workflows.list(limit=4, offset=4)
+        assert [w["name"] for w in page] == ["bulk3", "bulk4", "bulk5", "bulk6"]
+        cursor_page = await storage.workflows.list(limit=4, after_id=page[-1]["id"])
+        assert [w["name"] for w in cursor_page] == ["bulk7", "bulk8"]
+        
+        assert await storage.workflows.delete(created["id"]) is True
+        assert await storage.workflows.delete(created["id"]) is False
+        assert await storage.workflows.get(created["id"]) is None
+        
+        # 缓冲未满时写入仍可读到，同一记录的多次更新合并
+        task = ExecutionRecord(kind="automation", status="pending")
+        await storage.executions.save(task)
+        task.status = "completed"
+        await storage.executions.save(task)
+        assert (await storage.executions.get(task.id)).status == "completed"
+        assert task.expires_at == task.created_at + 10
+        
+        await storage.executions.save_many(
+            ExecutionRecord(kind="workflow", status="success", workflow_id=2, data={"n": i}) for i in range(5)
+        )
+        assert await storage.executions.count() == 6
+        assert len(await storage.executions.list(kind="workflow", workflow_id=2, limit=10)) == 5
+        
+        assert await storage.executions.purge_expired(now=task.created_at + 11) == 1
+        assert await storage.executions.get(task.id) is None
+        await storage.close()
+        
+        reopened = Storage(f"sqlite:///{path}")
+        assert await reopened.workflows.count() == 9
+        assert await reopened.executions.count(kind="workflow") == 5
+        await reopened.close()
+    
+    run_with_sqlite_file(run, "store.db")
+
+
+def test_execution_readable_while_flushing():
+    """执行记录从缓冲取出、尚未提交时仍可读到；写入失败的记录放回缓冲"""
+    async def run(path):
+        storage = Storage(f"sqlite:///{path}", flush_interval=60)
+        store = storage.executions
+        release = threading.Event()
+        upsert = store._upsert
+        
+        def blocked_upsert(conn, records):
+            release.wait(5)
+            if any(record.status == "broken" for record in records):
+                raise RuntimeError("数据库不可用")
+            return upsert(conn, records)
+        store._upsert = blocked_upsert
+        
+        record = ExecutionRecord(kind="workflow", status="queued")
+        await store.save(record)
+        flushing = asyncio.ensure_future(store.flush())
+        await asyncio.sleep(0.05)
+        assert not flushing.done()
+        assert (await store.get(record.id)).status == "queued"
+        release.set()
+        await flushing
+        assert (await store.get(record.id)).status == "queued"
+        
+        release.clear()
+        failing = ExecutionRecord(kind="workflow", status="broken")
+        await store.save(failing)
+        flushing = asyncio.ensure_future(store.flush())
+        await asyncio.sleep(0.05)
+        assert (await store.get(failing.id)).status == "broken"
+        release.set()
+        try:
+            await flushing
+            assert False, "写入失败应抛出异常"
+        except RuntimeError:
+            pass
+        assert (await store.get(failing.id)).status == "broken"
+        store._upsert = upsert
+        await storage.close()
+    
+    run_with_sqlite_file(run, "flush.db")
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "存储")
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Webhook触发测试
+覆盖路由、请求体解析、组提交与微批
+"""
+
+import asyncio
+
+import httpx
+
+from src.webhooks import WebhookEndpoint, WebhookError, WebhookIngestor, WebhookRouter, parse_body, sign_body, webhook_event
+from testsupport import memory_queue, run_tests
+
+
+def test_webhook_routing_and_batching():
+    """测试webhook路由、请求体解析、组提交、微批合并、请求体上限与认证头过滤"""
+    assert parse_body(b'{"a": 1}', "application/json; charset=utf-8") == {"a": 1}
+    assert parse_body(b'[1, 2]', None) == [1, 2]
+    assert parse_body(b"a=1&b=", "application/x-www-form-urlencoded") == {"a": "1", "b": ""}
+    assert parse_body(b"hello", "text/plain") == "hello"
+    
+    router = WebhookRouter()
+    workflow = {"nodes": [], "connections": [], "active": True}
+    router.sync_workflow({**workflow, "id": 1, "triggers": [{"type": "webhook", "path": "/orders/new/"}]})
+    router.sync_workflow({**workflow, "id": 2, "triggers": [
+        {"type": "webhook", "path": "events", "batch": {"max_size": 10, "max_wait": 0.05}},
+        {"type": "interval", "seconds": 60},
+    ]})
+    assert router.match("orders/new").workflow_id == 1 and router.match("orders//new").workflow_id == 1
+    assert router.conflicts({"id": 3, "triggers": [{"type": "webhook", "path": "events"}]}) == ["events"]
+    router.sync_workflow({**workflow, "id": 1, "active": False, "triggers": [{"type": "webhook", "path": "orders/new"}]})
+    assert router.match("orders/new") is None
+    router.sync_workflow({**workflow, "id": 1, "triggers": [{"type": "webhook", "path": "orders/new"}]})
+    
+    async def run():
+        storage, queue = memory_queue()
+        jobs = queue.jobs
+        ingestor = WebhookIngestor(queue)
+        groups = []
+        submit_many = queue.submit_many
+        async def counting_submit_many(submissions):
+            groups.append(len(submissions))
+            return await submit_many(submissions)
+        queue.submit_many = counting_submit_many
+        
+        # 并发到达的请求各自对应一次执行，但合并写入
+        route = router.match("orders/new")
+        results = await asyncio.gather(*(
+            ingestor.ingest(route, webhook_event("POST", route.path, {"n": i}, {}, {})) for i in range(50)
+        ))
+        assert len({execution_id for execution_id, _ in results}) == 50
+        assert await jobs.depth() == 50 and len(groups) < 50
+        
+        # 微批：25个事件合并为 10 + 10 + 5 三次执行
+        route = router.match("events")
+        results = await asyncio.gather(*(
+            ingestor.ingest(route, webhook_event("POST", route.path, {"n": i}, {}, {})) for i in range(25)
+        ))
+        executions = {}
+        for execution_id, count in results:
+            executions[execution_id] = count
+        assert sorted(executions.values()) == [5, 10, 10]
+        assert await jobs.depth() == 53
+        record = await queue.get(results[-1][0])
+        events = record.data["input_data"]["webhook"]["events"]
+        assert [event["body"]["n"] for event in events] == list(range(20, 25))
+        assert ingestor.stats() == {"received": 75, "executions": 53, "open_batches": 0}
+        
+        # 通过ASGI请求：认证类请求头不进入执行输入，超过上限的请求体返回413
+        endpoint = WebhookEndpoint(router, ingestor, max_body_size=64)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=endpoint), base_url="http://test") as client:
+            response = await client.post("/orders/new", json={"n": 1}, headers={
+                "Authorization": "Bearer secret", "Cookie": "session=1", "X-Signature": "abc",
+            })
+            assert response.status_code == 202
+            record = await queue.get(response.json()["execution_id"])
+            headers = record.data["input_data"]["webhook"]["headers"]
+            assert headers["x-signature"] == "abc"
+            assert "authorization" not in headers and "cookie" not in headers
+            
+            response = await client.post("/orders/new", content=b"x" * 65, headers={"Content-Type": "text/plain"})
+            assert response.status_code == 413
+            async def chunked():
+                for _ in range(10):
+                    yield b"x" * 10
+            response = await client.post("/orders/new", content=chunked())
+            assert response.status_code == 413
+        assert ingestor.stats()["received"] == 76
+        await storage.close()
+    
+    asyncio.run(run())
+
+
+def test_webhook_secret_requires_signature():
+    """配置了secret的webhook只接受带有效HMAC签名的请求，未配置的不受影响"""
+    router = WebhookRouter()
+    workflow = {"nodes": [], "connections": [], "active": True}
+    router.sync_workflow({**workflow, "id": 1, "triggers": [{"type": "webhook", "path": "signed", "secret": "s3cret"}]})
+    router.sync_workflow({**workflow, "id": 2, "triggers": [{"type": "webhook", "path": "open"}]})
+    try:
+        router.sync_workflow({**workflow, "id": 3, "triggers": [{"type": "webhook", "path": "bad", "secret": ""}]})
+        assert False, "空的secret应被拒绝"
+    except WebhookError:
+        pass
+    
+    async def run():
+        storage, queue = memory_queue()
+        endpoint = WebhookEndpoint(router, WebhookIngestor(queue))
+        body = b'{"order": 1}'
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=endpoint), base_url="http://test") as client:
+            async def post(path, signature=None, content=body):
+                headers = {"Content-Type": "application/json"}
+                if signature is not None:
+                    headers["X-Webhook-Signature"] = signature
+                return (await client.post(path, content=content, headers=headers)).status_code
+            
+            assert await post("/signed") == 401
+            assert await post("/signed", sign_body("wrong", body)) == 401
+            assert await post("/signed", sign_body("s3cret", body), content=b'{"order": 2}') == 401
+            assert await post("/signed", sign_body("s3cret", body)) == 202
+            assert await post("/open") == 202
+        assert await queue.jobs.depth() == 2
+        await storage.close()
+    
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "Webhook")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+执行worker测试
+覆盖检查点恢复、长延迟挂起与唤醒
+"""
+
+import asyncio
+import json
+import time
+from datetime import date
+
+from src import serialization
+from src.checkpoints import create_checkpoint_store
+from src.engine import WorkflowEngine
+from src.execution_context import ExecutionContext
+from src.http_body import StreamedBody
+from src.job_queue import ExecutionQueue, MemoryJobQueue, QueuedJob, create_job_queue
+from src.storage import Storage
+from src.worker import ExecutionWorker
+from testsupport import run_on_both_queues, run_tests, run_with_sqlite_file
+
+
+def test_checkpoint_resume_skips_completed_nodes():
+    """节点输出写入检查点：worker中途崩溃后重试、以及失败后恢复时，已完成的节点不再执行"""
+    calls = {"fetch": 0, "slow": 0}
+    
+    async def fetch(node, input_data):
+        calls["fetch"] += 1
+        return {"data": {"items": list(range(5))}}
+    
+    async def slow(node, input_data):
+        calls["slow"] += 1
+        if calls["slow"] == 1:
+            await asyncio.sleep(10)  # 第一次执行时worker在此处崩溃
+        if calls["slow"] == 2:
+            raise RuntimeError("上游服务暂时不可用")
+        return {"data": sum(input_data["fetch"]["data"]["items"])}
+    
+    async def run(path):
+        storage = Storage(f"sqlite:///{path}")
+        checkpoints = create_checkpoint_store(storage.engine)
+        queue = ExecutionQueue(create_job_queue(storage.engine), storage.executions)
+        engine = WorkflowEngine()
+        engine.node_handlers.update({"fetch": fetch, "slow": slow})
+        workflow = {
+            "nodes": [{"id": "fetch", "type": "fetch"}, {"id": "slow", "type": "slow"}],
+            "connections": [{"source": "fetch", "target": "slow"}],
+        }
+        record = await queue.submit(1, workflow)
+        
+        crashed = ExecutionWorker(engine, queue.jobs, storage.executions, visibility_timeout=0.2, checkpoints=checkpoints)
+        job = await queue.jobs.lease(crashed.worker_id, crashed.visibility_timeout)
+        task = asyncio.create_task(crashed.process(job))
+        await asyncio.sleep(0.05)
+        task.cancel()  # 模拟进程退出：不释放租约
+        await asyncio.gather(task, return_exceptions=True)
+        await checkpoints.flush()
+        await asyncio.sleep(0.2)
+        
+        # 租约到期后由另一个worker重试，fetch从检查点恢复；slow这次失败
+        worker = ExecutionWorker(engine, queue.jobs, storage.executions, checkpoints=checkpoints)
+        await worker.run_until_idle()
+        failed = await queue.get(record.id)
+        assert failed.data["restored_nodes"] == 1 and "error" in failed.data["results"]["slow"]
+        assert calls == {"fetch": 1, "slow": 2}
+        
+        # 恢复执行：只重新执行失败的节点
+        await queue.resume(record.id, workflow)
+        await worker.run_until_idle()
+        resumed = await queue.get(record.id)
+        assert resumed.status == "success" and resumed.data["results"]["slow"] == {"data": 10}
+        assert resumed.data["resumed"] == 1 and calls == {"fetch": 1, "slow": 3}
+        assert (await checkpoints.load(record.id)) == (None, {})
+        
+        # 含流式响应体的输出不写入检查点；已结束或记录已不存在的执行的检查点被定期清理，未结束的保留
+        pending = await queue.submit(1, workflow)
+        await storage.executions.flush()
+        for execution_id in (record.id, pending.id, "gone"):
+            checkpoints.record(execution_id, "h", "fetch", {"data": 1})
+        checkpoints.record(record.id, "h", "export", {"data": StreamedBody(b"[1]", size=3, fmt="json")})
+        await checkpoints.flush()
+        assert (await checkpoints.load(record.id))[1] == {"fetch": {"data": 1}}
+        assert await checkpoints.purge_finished(max_age=0) == 2
+        assert (await checkpoints.load(record.id))[1] == {} and (await checkpoints.load("gone"))[1] == {}
+        assert (await checkpoints.load(pending.id))[1] == {"fetch": {"data": 1}}
+        
+        # 工作流定义变化后检查点不再复用
+        context = ExecutionContext(execution_id="changed")
+        context.restore({"fetch": {"data": {"items": [1]}}}, plan_hash="other")
+        result = await engine.execute_workflow(workflow, context=context)
+        assert result["results"]["slow"] == {"data": 10} and calls["fetch"] == 2
+        await storage.close()
+    
+    run_with_sqlite_file(run, "checkpoints.db")
+
+
+def test_checkpoint_serialization():
+    """检查点序列化：orjson 与标准库 json 两种编码都比JSON文本紧凑、集合可往返、数据可互相读取，流式响应体拒绝序列化"""
+    payload = {"rows": [{"id": i, "name": f"row{i}"} for i in range(500)], "tags": {"a", "b"}, "at": date(2024, 1, 2)}
+    assert serialization.orjson is not None  # requirements.txt 中的依赖
+    encoded = {}
+    for backend in ("orjson", "json"):
+        original = serialization.orjson
+        if backend == "json":
+            serialization.orjson = None
+        try:
+            encoded[backend] = serialization.dumps(payload)
+            assert len(encoded[backend]) < len(json.dumps(payload["rows"]))
+            try:
+                serialization.dumps({"data": StreamedBody(b'{"ok": true}', size=12, fmt="json")})
+                assert False, "流式响应体不应被序列化"
+            except serialization.StreamedBodyError:
+                pass
+        finally:
+            serialization.orjson = original
+    
+    for data in encoded.values():
+        decoded = serialization.loads(data)
+        assert decoded["rows"] == payload["rows"] and sorted(decoded["tags"]) == ["a", "b"]
+        assert decoded["at"] == "2024-01-02"
+    serialization.orjson = None
+    try:
+        assert serialization.loads(encoded["orjson"]) == serialization.loads(encoded["json"])
+    finally:
+        serialization.orjson = original
+
+
+def test_long_delay_suspends_execution():
+    """长延迟挂起执行并推迟任务到唤醒时间，唤醒后从检查点恢复，不重复执行上游节点"""
+    calls = {"fetch": 0, "notify": 0}
+    
+    async def fetch(node, input_data):
+        calls["fetch"] += 1
+        return {"data": "lead"}
+    
+    async def notify(node, input_data):
+        calls["notify"] += 1
+        return {"data": input_data}
+    
+    async def run(jobs, storage):
+        calls.update(fetch=0, notify=0)
+        engine = WorkflowEngine(suspend_threshold=0.2)
+        engine.node_handlers.update({"fetch": fetch, "notify": notify})
+        queue = ExecutionQueue(jobs, storage.executions)
+        worker = ExecutionWorker(engine, jobs, storage.executions, checkpoints=create_checkpoint_store(storage.engine))
+        workflow = {
+            "nodes": [
+                {"id": "fetch", "type": "fetch"},
+                {"id": "wait_long", "type": "delay", "config": {"delay": 0.3}},
+                {"id": "wait_longer", "type": "delay", "config": {"delay": 0.5}},
+                {"id": "follow_up", "type": "notify"},
+                {"id": "short", "type": "delay", "config": {"delay": 0.01}},
+            ],
+            "connections": [
+                {"source": "fetch", "target": "wait_long"},
+                {"source": "fetch", "target": "wait_longer"},
+                {"source": "wait_long", "target": "follow_up"},
+                {"source": "wait_longer", "target": "follow_up"},
+                {"source": "fetch", "target": "short"},
+            ],
+        }
+        record = await queue.submit(1, workflow)
+        started = time.time()
+        await worker.run_until_idle()
+        
+        suspended = await queue.get(record.id)
+        assert suspended.status == "suspended" and abs(suspended.data["resume_at"] - started - 0.3) < 0.1
+        assert (await jobs.stats())["delayed"] == 1 and await jobs.depth() == 0
+        
+        # 第一次唤醒：wait_long到期，wait_longer剩余时间不足阈值，在协程内等待剩余时间
+        await asyncio.sleep(suspended.data["resume_at"] - time.time() + 0.01)
+        await worker.run_until_idle()
+        finished = await queue.get(record.id)
+        assert finished.status == "success", finished.status
+        assert finished.data["results"]["follow_up"]["data"]["wait_longer"] == {"fetch": {"data": "lead"}}
+        assert time.time() - started >= 0.5
+        assert calls == {"fetch": 1, "notify": 1} and worker.metrics()["suspended"] == 1
+        await storage.close()
+    
+    run_on_both_queues(run, "delay.db")
+    
+    # 大量挂起中的任务不影响租用：堆顶未到期即返回
+    async def many_sleeping():
+        jobs = MemoryJobQueue()
+        for i in range(20000):
+            await jobs.enqueue(QueuedJob(payload={}, visible_at=time.time() + 3600 + i))
+        await jobs.enqueue(QueuedJob(payload={"due": True}))
+        start = time.perf_counter()
+        job = await jobs.lease("w", 30)
+        assert job.payload == {"due": True} and await jobs.lease("w", 30) is None
+        assert time.perf_counter() - start < 0.01
+    
+    asyncio.run(many_sleeping())
+
+
+if __name__ == "__main__":
+    run_tests(globals(), "执行worker")
@@ -0,0 +1,68 @@
+"""
+测试辅助
+各测试模块共用的引擎、存储与队列构造，以及以脚本方式运行测试模块
+"""
+
+import asyncio
+import os
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from src.ai_cache import AIResponseCache
+from src.ai_providers import AIConfig
+from src.engine import WorkflowEngine
+from src.http_pool import HttpPoolConfig
+from src.job_queue import ExecutionQueue, JobQueue, MemoryJobQueue, create_job_queue
+from src.storage import Storage
+
+MOCK_AI_URL = "http://mock-ai/v1"
+
+
+def mock_http_engine(handler: Callable[[httpx.Request], Any], **kwargs) -> WorkflowEngine:
+    """HTTP请求由 handler 应答的引擎"""
+    return WorkflowEngine(http_config=HttpPoolConfig(transport=httpx.MockTransport(handler)), **kwargs)
+
+
+def mock_ai_engine(app: Any, ai_cache: Optional[AIResponseCache] = None, **ai_config) -> WorkflowEngine:
+    """AI提供方指向模拟服务（ASGI应用）的引擎"""
+    return WorkflowEngine(
+        http_config=HttpPoolConfig(transport=httpx.ASGITransport(app=app)),
+        ai_config=AIConfig(provider_url=MOCK_AI_URL, **ai_config),
+        ai_cache=ai_cache,
+    )
+
+
+def delay_workflow(delay: float = 0, node_id: str = "a") -> Dict[str, Any]:
+    """只有一个延迟节点的工作流"""
+    return {"nodes": [{"id": node_id, "type": "delay", "config": {"delay": delay}}], "connections": []}
+
+
+def memory_queue(**kwargs) -> Tuple[Storage, ExecutionQueue]:
+    """内存数据库上的存储与内存任务队列"""
+    storage = Storage("sqlite://")
+    return storage, ExecutionQueue(MemoryJobQueue(), storage.executions, **kwargs)
+
+
+def run_with_sqlite_file(run: Callable[[str], Awaitable[Any]], name: str):
+    """在临时目录中的SQLite数据库文件上运行 run(path)"""
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(os.path.join(directory, name)))
+
+
+def run_on_both_queues(run: Callable[[JobQueue, Storage], Awaitable[Any]], name: str):
+    """分别在SQLite文件上的持久化队列与内存队列上运行 run(jobs, storage)"""
+    with tempfile.TemporaryDirectory() as directory:
+        storage = Storage(f"sqlite:///{os.path.join(directory, name)}")
+        asyncio.run(run(create_job_queue(storage.engine), storage))
+    asyncio.run(run(MemoryJobQueue(), Storage("sqlite://")))
+
+
+def run_tests(namespace: Dict[str, Any], title: str):
+    """按定义顺序运行模块中的 test_* 函数（以脚本方式运行测试模块时使用）"""
+    for name, test in list(namespace.items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"  ✓ {name}")
+    print(f"✅ {title}测试完成!")